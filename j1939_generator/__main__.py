@@ -0,0 +1,13 @@
+"""
+Entry point for `python -m j1939_generator`; see cli.py.
+"""
+import os
+import sys
+
+# The app's modules import each other as top-level modules (app.py is run
+# from inside this directory), so make that directory importable first.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cli import main
+
+sys.exit(main())
@@ -1,74 +1,348 @@
-from flask import Flask, render_template, request, send_file, jsonify
-import pandas as pd
-import io
+import os
 import time
+# Start-up is timed from here, so it includes the imports below
+STARTED = time.perf_counter()
+
+from flask import Flask, Response, render_template, request, jsonify, send_file, stream_with_context
+import metrics
+from cache import ResultCache, cache_key
+from db_import import configure_from_env
 from engine import J1939Engine
-from j1939_db import PGNS
+from compression import CODECS, compress
+from exporters import EXPORTERS, FORMAT_LABELS, download_info
+from jobs import DONE, JobManager, JobQueueFull
+from live import POLICIES, LiveBusy, LiveHub, sse_event
+from noise import new_seed, parse_seed
+from scenario import cache as scenario_cache
 
 app = Flask(__name__)
+# J1939_CATALOG may point at an imported DBC/DA database instead of j1939_db
+configure_from_env()
 engine = J1939Engine()
 
+# PGN checkboxes per page of the index
+PGNS_PER_PAGE = 50
+
+# Seconds of simulated traffic generated per streamed chunk
+STREAM_WINDOW_SEC = 10
+
+# Longest simulated run a /generate or /jobs request may ask for
+MAX_DURATION_SEC = int(os.environ.get("J1939_MAX_DURATION_SEC", 24 * 3600))
+
+# Responses to seeded requests are cached; sizes in bytes
+cache = ResultCache(
+    max_bytes=int(os.environ.get("J1939_CACHE_MAX_BYTES", 256 * 2**20)),
+    max_entry_bytes=int(os.environ.get("J1939_CACHE_MAX_ENTRY_BYTES", 64 * 2**20)),
+    spill_dir=os.environ.get("J1939_CACHE_DIR"),
+    spill_max_bytes=int(os.environ.get("J1939_CACHE_DISK_MAX_BYTES", 2**30)),
+)
+
+# Background generation jobs; the pool and job caps protect the workers
+jobs = JobManager(
+    engine,
+    max_workers=int(os.environ.get("J1939_JOB_WORKERS", 2)),
+    max_jobs=int(os.environ.get("J1939_MAX_JOBS", 8)),
+    ttl_sec=int(os.environ.get("J1939_JOB_TTL_SEC", 3600)),
+    workdir=os.environ.get("J1939_JOB_DIR"),
+    window_sec=STREAM_WINDOW_SEC,
+)
+
+# Live SSE streams; slow clients keep at most LIVE_QUEUE batches queued
+LIVE_BATCH_MS = int(os.environ.get("J1939_LIVE_BATCH_MS", 200))
+LIVE_QUEUE = int(os.environ.get("J1939_LIVE_QUEUE", 32))
+LIVE_POLICY = os.environ.get("J1939_LIVE_POLICY", "coalesce")
+LIVE_MAX_DURATION_SEC = int(os.environ.get("J1939_LIVE_MAX_DURATION_SEC", 3600))
+LIVE_KEEPALIVE_SEC = 15
+live = LiveHub(engine, max_streams=int(os.environ.get("J1939_LIVE_MAX_STREAMS", 16)))
+
+# J1939_WARMUP=1 runs warm_up() before the app serves its first request
+WARMUP = os.environ.get("J1939_WARMUP", "0").lower() in ("1", "true", "yes")
+
+# Milliseconds spent importing and warming up, see /healthz
+startup = {}
+
+# Requests sending this header get their stage breakdown back as Server-Timing
+PROFILE_HEADER = "X-Profile"
+
+def _queue_metrics():
+    families = metrics.stats_family("j1939_result_cache", cache.stats(), "Response cache",
+                                    counters=("hits", "disk_hits", "misses", "evictions"))
+    families += metrics.stats_family("j1939_scenario_cache", scenario_cache.stats(), "Scenario channel cache",
+                                     counters=("hits", "misses"))
+    families.append(("j1939_jobs", "gauge", "Background jobs by status.",
+                     [({"status": status}, count) for status, count in jobs.stats().items()]))
+    families.append(("j1939_startup_seconds", "gauge", "Start-up time by phase.",
+                     [({"phase": phase}, ms / 1000) for phase, ms in startup.items()]))
+    streams = live.stats()
+    families.append(("j1939_live_streams", "gauge", "Open live streams.", [({}, len(streams))]))
+    families.append(("j1939_live_subscribers", "gauge", "Live stream subscribers.",
+                     [({}, sum(s["subscribers"] for s in streams))]))
+    return families
+
+metrics.register_collector(_queue_metrics)
+
 @app.route('/')
 def index():
-    available_pgns = [{"id": k, "name": v['name']} for k, v in PGNS.items()]
-    return render_template('index.html', pgns=available_pgns)
+    available_pgns, total = engine.codec.catalog.page(1, PGNS_PER_PAGE)
+    formats = [(name, FORMAT_LABELS.get(name, name)) for name in EXPORTERS]
+    return render_template('index.html', pgns=available_pgns, total=total, per_page=PGNS_PER_PAGE,
+                           formats=formats, compressions=list(CODECS))
+
+@app.route('/pgns')
+def list_pgns():
+    """
+    One page of the PGN catalog, optionally filtered by ?q= (name or number).
+    """
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(max(int(request.args.get('per_page', PGNS_PER_PAGE)), 1), 500)
+    except ValueError:
+        return jsonify({"error": "page and per_page must be integers"}), 400
+    items, total = engine.codec.catalog.page(page, per_page, request.args.get('q'))
+    return jsonify({"pgns": items, "page": page, "per_page": per_page, "total": total})
+
+def _parse_generate_request(data):
+    """
+    Validated (pgns, format, compression, duration, seed, cacheable) from a /generate or
+    /jobs body, or (None, error response).
+    """
+    data = data or {}
+    if not isinstance(data, dict):
+        return None, (jsonify({"error": "Expected a JSON object"}), 400)
+    try:
+        pgns = data.get('pgns', [])
+        if not isinstance(pgns, list):
+            raise ValueError("pgns must be a list")
+        selected_pgns = [int(x) for x in pgns]
+        duration = int(data.get('duration', 10))
+    except (TypeError, ValueError) as e:
+        return None, (jsonify({"error": f"Invalid parameter: {e}"}), 400)
+    file_format = data.get('format', 'csv')
+    compression = data.get('compression') or None
+    seed = data.get('seed')
+
+    if not selected_pgns:
+        return None, (jsonify({"error": "No PGN selected"}), 400)
+
+    if not 0 < duration <= MAX_DURATION_SEC:
+        return None, (jsonify({"error": f"duration must be 1..{MAX_DURATION_SEC}"}), 400)
+
+    unknown = [p for p in selected_pgns if p not in engine.codec.pgns]
+    if unknown:
+        return None, (jsonify({"error": f"Unknown PGN(s): {unknown}"}), 400)
+
+    if not isinstance(file_format, str) or file_format not in EXPORTERS:
+        return None, (jsonify({"error": f"Unknown format '{file_format}'"}), 400)
+
+    if compression is not None and (not isinstance(compression, str) or compression not in CODECS):
+        return None, (jsonify({"error": f"Unknown compression '{compression}'"}), 400)
+
+    if seed in (None, ""):
+        seeded, seed = False, new_seed()
+    else:
+        try:
+            seed = parse_seed(seed)
+        except ValueError as e:
+            return None, (jsonify({"error": f"Invalid seed: {e}"}), 400)
+        seeded = True
+
+    return (selected_pgns, file_format, compression, duration, seed, seeded), None
 
 @app.route('/generate', methods=['POST'])
 def generate():
-    data = request.json
-    selected_pgns = [int(x) for x in data.get('pgns', [])]
-    file_format = data.get('format', 'csv')
-    duration = int(data.get('duration', 10))
+    params, error = _parse_generate_request(request.json)
+    if error:
+        return error
+    selected_pgns, file_format, compression, duration, seed, seeded = params
+    key = cache_key(selected_pgns, duration, file_format, seed, compression) if seeded else None
+
+    writer = EXPORTERS[file_format][0]
+    mimetype, fname = download_info(file_format, compression)
+    headers = {"Content-Disposition": f"attachment; filename={fname}", "X-Seed": str(seed)}
+
+    profile = metrics.Profile() if metrics.ENABLED and request.headers.get(PROFILE_HEADER) else None
+    trace_memory = profile is not None or metrics.sample_memory()
+
+    cached = cache.get(key) if key else None
+    if cached is not None:
+        headers["X-Cache"] = "HIT"
+        body = metrics.observe_download(cached, file_format, "hit", profile, trace_memory)
+    else:
+        windows = engine.iter_frames(selected_pgns, duration_sec=duration, window_sec=STREAM_WINDOW_SEC, seed=seed,
+                                     signals=file_format == 'csv')
+        body = metrics.timed_iter("export", writer(windows, engine.dataset_columns(selected_pgns)))
+        if compression:
+            body = metrics.timed_iter("compress", compress(body, compression))
+        if key:
+            headers["X-Cache"] = "MISS"
+            body = cache.tee(key, body)
+        body = metrics.observe_download(body, file_format, "miss" if key else "none", profile, trace_memory)
+
+    if profile is not None:
+        # The breakdown goes in a header, so the body is produced before responding
+        body = list(body)
+        headers["Server-Timing"] = profile.server_timing()
+        return Response(body, mimetype=mimetype, headers=headers)
+    return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
+
+# --- BACKGROUND JOBS ---
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    params, error = _parse_generate_request(request.json)
+    if error:
+        return error
+    selected_pgns, file_format, compression, duration, seed, _ = params
+
+    try:
+        job = jobs.submit(selected_pgns, duration, file_format, seed, compression)
+    except JobQueueFull as e:
+        return jsonify({"error": f"Server busy: {e}"}), 429, {"Retry-After": "10"}
+
+    return jsonify(job.to_dict()), 202, {"Location": f"/jobs/{job.id}"}
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/download')
+def job_download(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if job.status != DONE:
+        return jsonify({"error": f"Job is {job.status}"}), 409
+
+    mimetype, fname = download_info(job.format, job.compression)
+    # conditional=True answers Range requests with 206 partial content
+    response = send_file(job.path, mimetype=mimetype, as_attachment=True, download_name=fname, conditional=True)
+    response.headers["X-Seed"] = str(job.seed)
+    return response
+
+# --- LIVE STREAMING ---
+
+def _parse_live_request(args):
+    """
+    Validated live stream options from the /live query string, or
+    (None, error response).
+    """
+    try:
+        selected_pgns = [int(x) for x in args.get('pgns', '').split(',') if x.strip()]
+        seed = args.get('seed')
+        seed = parse_seed(seed) if seed not in (None, "") else None
+        options = {
+            "duration_sec": int(args.get('duration', LIVE_MAX_DURATION_SEC)),
+            "rate": float(args.get('rate', 1.0)),
+            "batch_ms": int(args.get('batch_ms', LIVE_BATCH_MS)),
+            "frames": args.get('frames', '1') not in ('0', 'false'),
+            "max_queue": int(args.get('queue', LIVE_QUEUE)),
+            "policy": args.get('policy', LIVE_POLICY),
+        }
+    except ValueError as e:
+        return None, (jsonify({"error": f"Invalid parameter: {e}"}), 400)
 
     if not selected_pgns:
-        return jsonify({"error": "No PGN selected"}), 400
-
-    df = engine.generate_dataset(selected_pgns, duration_sec=duration)
-    
-    if df.empty:
-         return jsonify({"error": "No data generated"}), 400
-
-    buffer = io.BytesIO()
-    
-    if file_format == 'csv':
-        df.drop(columns=['payload_bytes'], inplace=True, errors='ignore')
-        df.to_csv(buffer, index=False)
-        mimetype = 'text/csv'
-        fname = 'j1939_data.csv'
-
-    elif file_format == 'trc':
-        buffer.write(b";$FILEVERSION=1.1\n")
-        buffer.write(b";$STARTTIME=0\n")
-        buffer.write(b";   Message Number  Time(ms)   Type    ID     DLC  Data Bytes\n")
-        
-        msg_num = 1
-        for _, row in df.iterrows():
-            can_id = row['pgn_hex'].replace("0x", "") 
-            payload = row['payload_hex']
-            line = f"{msg_num:>6} {row['time_ms']:>10.1f} Rx {can_id:>8} 8 {payload}\n"
-            buffer.write(line.encode('utf-8'))
-            msg_num += 1
-            
-        mimetype = 'text/plain'
-        fname = 'j1939_trace.trc'
-
-    elif file_format == 'txt':
-        for _, row in df.iterrows():
-            header = f"{row['pgn_hex']}h\n"
-            payload = f"{row['payload_hex']}\n"
-            buffer.write(header.encode('utf-8'))
-            buffer.write(payload.encode('utf-8'))
-        
-        mimetype = 'text/plain'
-        fname = 'j1939_dump.txt'
-
-    buffer.seek(0)
-    return send_file(
-        buffer,
-        as_attachment=True,
-        download_name=fname,
-        mimetype=mimetype
-    )
+        return None, (jsonify({"error": "No PGN selected"}), 400)
+    unknown = [p for p in selected_pgns if p not in engine.codec.pgns]
+    if unknown:
+        return None, (jsonify({"error": f"Unknown PGN(s): {unknown}"}), 400)
+    if not 0 < options['duration_sec'] <= LIVE_MAX_DURATION_SEC:
+        return None, (jsonify({"error": f"duration must be 1..{LIVE_MAX_DURATION_SEC}"}), 400)
+    if options['rate'] <= 0 or options['batch_ms'] <= 0:
+        return None, (jsonify({"error": "rate and batch_ms must be positive"}), 400)
+    if options['policy'] not in POLICIES:
+        return None, (jsonify({"error": f"Unknown policy '{options['policy']}'"}), 400)
+
+    return (selected_pgns, seed, options), None
+
+@app.route('/live')
+def live_stream():
+    """
+    Server-sent events: one "meta" event, then a "batch" event per
+    batch_ms of simulated time until the run ends ("end") or generation
+    fails ("error").
+    """
+    params, error = _parse_live_request(request.args)
+    if error:
+        return error
+    selected_pgns, seed, options = params
+
+    try:
+        stream, sub = live.open(selected_pgns, seed, **options)
+    except LiveBusy as e:
+        return jsonify({"error": f"Server busy: {e}"}), 429, {"Retry-After": "10"}
+
+    def events():
+        try:
+            yield sse_event("meta", stream.describe())
+            dropped = 0
+            while True:
+                batch = sub.get(timeout=LIVE_KEEPALIVE_SEC)
+                if sub.dropped != dropped:
+                    dropped = sub.dropped
+                    yield sse_event("dropped", {"dropped": dropped})
+                if batch is not None:
+                    yield batch.event
+                elif sub.closed:
+                    if stream.error is not None:
+                        yield sse_event("error", {"t_ms": stream.t_ms, "error": stream.error})
+                    else:
+                        yield sse_event("end", {"t_ms": stream.t_ms})
+                    return
+                else:
+                    yield b": keepalive\n\n"
+        finally:
+            live.close(stream, sub)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Seed": str(stream.seed)}
+    return Response(events(), mimetype='text/event-stream', headers=headers)
+
+@app.route('/live/streams')
+def live_streams():
+    return jsonify(live.stats())
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(cache.stats())
+
+@app.route('/healthz')
+def healthz():
+    return jsonify({"status": "ok", "startup_ms": startup})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Counters, stage timers, latency histograms and cache/queue gauges in
+    the Prometheus text format.
+    """
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
+# --- START-UP ---
+
+def warm_up():
+    """
+    Compiles every PGN of the catalog, renders the index and runs one
+    second of the first PGN through every exporter, so the first real
+    request doesn't pay for lazy imports (pandas for CSV), codec
+    compilation and template compilation.
+    """
+    engine.codec.compile_all()
+    with app.test_request_context():
+        index()
+    pgns = list(engine.codec.catalog.pgns)[:1]
+    for writer, _, _ in EXPORTERS.values():
+        windows = engine.iter_frames(pgns, duration_sec=1, window_sec=1, seed=0)
+        for _ in writer(windows, engine.dataset_columns(pgns)):
+            pass
+
+startup["import_ms"] = round((time.perf_counter() - STARTED) * 1000, 1)
+if WARMUP:
+    warm_start = time.perf_counter()
+    warm_up()
+    startup["warmup_ms"] = round((time.perf_counter() - warm_start) * 1000, 1)
 
 if __name__ == '__main__':
     app.run(debug=True, port=3000)
@@ -0,0 +1,190 @@
+"""
+Parquet and Arrow exporters (optional, need pyarrow).
+
+The download formats carry the frame table, one row per frame:
+
+    time_us int64, can_id uint32, pgn uint32, dlc uint8, data fixed_size_binary(8)
+
+as a Parquet file (one row group per window) or an Arrow IPC stream (one
+record batch per window). SignalTableWriter additionally writes the
+decoded signals as one table per PGN (time_us plus one float64 column per
+SPN, with the unit and SPN number in the field metadata) next to the frame
+table in a directory.
+
+pyarrow is imported on first use; without it ARROW_EXPORTERS is empty and
+the formats are not offered.
+"""
+import importlib.util
+import os
+import numpy as np
+
+PARQUET_COMPRESSION = os.environ.get("J1939_PARQUET_COMPRESSION", "snappy")
+
+# File extension of each table format when written to a directory
+TABLE_EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ValueError(f"Parquet/Arrow export needs pyarrow (pip install pyarrow): {e}") from None
+    return pyarrow
+
+class _ChunkSink:
+    """
+    Write-only file object collecting what pyarrow writes until drained.
+    """
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+def frame_schema(pa):
+    return pa.schema([
+        ('time_us', pa.int64()),
+        ('can_id', pa.uint32()),
+        ('pgn', pa.uint32()),
+        ('dlc', pa.uint8()),
+        ('data', pa.binary(8)),
+    ])
+
+def frame_batch(pa, schema, store):
+    """
+    The frames of a FrameStore as one record batch of the frame schema.
+    """
+    frames = store.frames
+    data = np.ascontiguousarray(frames['data']).tobytes()
+    return pa.record_batch([
+        pa.array(np.ascontiguousarray(frames['time_us'])),
+        pa.array(np.ascontiguousarray(frames['can_id'])),
+        pa.array(store.pgn.astype(np.uint32)),
+        pa.array(np.ascontiguousarray(frames['dlc'])),
+        pa.FixedSizeBinaryArray.from_buffers(pa.binary(8), len(store), [None, pa.py_buffer(data)]),
+    ], schema=schema)
+
+def signal_schema(pa, table):
+    fields = [pa.field('time_us', pa.int64())]
+    for spn_id, name, unit in zip(table.spn_ids, table.names, table.units):
+        fields.append(pa.field(name, pa.float64(), metadata={"spn": str(spn_id), "unit": unit}))
+    return pa.schema(fields, metadata={"pgn": str(table.pgn_id)})
+
+def signal_batch(pa, schema, store, table):
+    time_us = store.frames['time_us'][table.frame_index]
+    return pa.record_batch([pa.array(time_us)] + [pa.array(np.asarray(v, dtype=np.float64)) for v in table.values],
+                           schema=schema)
+
+def _open_writer(pa, file_format, sink, schema, stream=True):
+    if file_format == 'parquet':
+        return pa.parquet.ParquetWriter(sink, schema, compression=PARQUET_COMPRESSION)
+    if stream:
+        return pa.ipc.new_stream(sink, schema)
+    return pa.ipc.new_file(sink, schema)
+
+def _write(pa, writer, batch):
+    # ParquetWriter takes tables, one row group per call
+    if isinstance(writer, pa.parquet.ParquetWriter):
+        writer.write_table(pa.Table.from_batches([batch]))
+    else:
+        writer.write_batch(batch)
+
+# --- STREAMING WRITERS ---
+
+def _iter_frame_table(stores, file_format):
+    pa = _pyarrow()
+    schema = frame_schema(pa)
+    sink = _ChunkSink()
+    writer = _open_writer(pa, file_format, pa.PythonFile(sink, mode='w'), schema)
+    try:
+        for store in stores:
+            _write(pa, writer, frame_batch(pa, schema, store))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    data = sink.drain()
+    if data:
+        yield data
+
+def iter_parquet(stores, columns=None):
+    return _iter_frame_table(stores, 'parquet')
+
+def iter_arrow(stores, columns=None):
+    return _iter_frame_table(stores, 'arrow')
+
+class SignalTableWriter:
+    """
+    Writes frames.<ext> and one pgn_<id>.<ext> signal table per PGN into
+    directory while the windows pass through tee(). The windows need
+    their signal tables (signals=True).
+    """
+    def __init__(self, directory, file_format='parquet'):
+        if file_format not in TABLE_EXTENSIONS:
+            raise ValueError(f"Unknown table format '{file_format}', expected one of {', '.join(TABLE_EXTENSIONS)}")
+        self.pa = _pyarrow()
+        self.directory = directory
+        self.file_format = file_format
+        self._writers = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _writer(self, key, schema):
+        entry = self._writers.get(key)
+        if entry is None:
+            path = os.path.join(self.directory, f"{key}{TABLE_EXTENSIONS[self.file_format]}")
+            sink = self.pa.OSFile(path, 'wb')
+            entry = self._writers[key] = (_open_writer(self.pa, self.file_format, sink, schema, stream=False),
+                                          sink, schema)
+        return entry
+
+    def write(self, store):
+        pa = self.pa
+        writer, _, schema = self._writer("frames", frame_schema(pa))
+        _write(pa, writer, frame_batch(pa, schema, store))
+        for pgn_id, table in store.signals.items():
+            if not len(table):
+                continue
+            writer, _, schema = self._writer(f"pgn_{pgn_id}", signal_schema(pa, table))
+            _write(pa, writer, signal_batch(pa, schema, store, table))
+
+    def tee(self, stores):
+        for store in stores:
+            self.write(store)
+            yield store
+
+    def close(self):
+        for writer, sink, _ in self._writers.values():
+            writer.close()
+            sink.close()
+        self._writers = {}
+
+# Format selector entries, see exporters.EXPORTERS
+ARROW_EXPORTERS = {}
+if importlib.util.find_spec("pyarrow") is not None:
+    ARROW_EXPORTERS = {
+        'parquet': (iter_parquet, 'application/vnd.apache.parquet', 'j1939_frames.parquet'),
+        'arrow': (iter_arrow, 'application/vnd.apache.arrow.stream', 'j1939_frames.arrows'),
+    }
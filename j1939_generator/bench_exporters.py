@@ -0,0 +1,69 @@
+"""
+Exporter benchmark: rows/sec of the vectorized TRC/TXT writers next to the
+original DataFrame.iterrows() implementation they replaced.
+
+Usage: python bench_exporters.py [--duration 600] [--repeat 3]
+"""
+import argparse
+import io
+import time
+from engine import J1939Engine
+from exporters import TRC_HEADER, iter_trc, iter_txt
+from j1939_db import PGNS
+
+# --- REFERENCE (pre-exporter) PATH ---
+
+def legacy_trc(df):
+    buffer = io.BytesIO()
+    buffer.write(TRC_HEADER)
+    msg_num = 1
+    for _, row in df.iterrows():
+        can_id = row['pgn_hex'].replace("0x", "")
+        payload = row['payload_hex']
+        line = f"{msg_num:>6} {row['time_ms']:>10.1f} Rx {can_id:>8} 8 {payload}\n"
+        buffer.write(line.encode('utf-8'))
+        msg_num += 1
+    return buffer.getvalue()
+
+def legacy_txt(df):
+    buffer = io.BytesIO()
+    for _, row in df.iterrows():
+        buffer.write(f"{row['pgn_hex']}h\n".encode('utf-8'))
+        buffer.write(f"{row['payload_hex']}\n".encode('utf-8'))
+    return buffer.getvalue()
+
+def best_of(fn, repeat):
+    best, out = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, out
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--duration', type=int, default=600, help="simulated seconds")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    engine = J1939Engine()
+    store = engine.generate_frames(list(PGNS), duration_sec=args.duration, signals=False)
+    df = store.to_dataframe(engine.dataset_columns(list(PGNS)))
+    rows = len(df)
+    print(f"{rows} rows ({args.duration} s, {len(PGNS)} PGNs)")
+    print(f"{'format':<6} {'path':<10} {'seconds':>9} {'rows/sec':>12}")
+
+    cases = [
+        ('trc', legacy_trc, lambda: b"".join(iter_trc([store]))),
+        ('txt', legacy_txt, lambda: b"".join(iter_txt([store]))),
+    ]
+    for name, legacy, vectorized in cases:
+        t_old, out_old = best_of(lambda: legacy(df), args.repeat)
+        t_new, out_new = best_of(vectorized, args.repeat)
+        assert out_old == out_new, f"{name} output differs from the legacy path"
+        print(f"{name:<6} {'iterrows':<10} {t_old:>9.3f} {rows / t_old:>12,.0f}")
+        print(f"{name:<6} {'exporters':<10} {t_new:>9.3f} {rows / t_new:>12,.0f}  ({t_old / t_new:.1f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Export format benchmark: output size and encode throughput of every
+download format, uncompressed and with each available compression.
+
+The windows are generated once up front, so only encoding (and
+compression) is timed.
+
+Usage: python bench_formats.py [--duration 600] [--repeat 3] [--workers N]
+"""
+import argparse
+import time
+from compression import CODECS, WORKERS, compress
+from engine import J1939Engine
+from exporters import EXPORTERS
+from j1939_db import PGNS
+
+def encode(file_format, stores, columns, compression, workers):
+    blocks = EXPORTERS[file_format][0](iter(stores), columns)
+    if compression:
+        blocks = compress(blocks, compression, workers)
+    return sum(len(b) for b in blocks)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--duration', type=int, default=600, help="simulated seconds")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=WORKERS, help="compression threads")
+    args = parser.parse_args()
+
+    engine = J1939Engine()
+    pgns = list(PGNS)
+    stores = list(engine.iter_frames(pgns, duration_sec=args.duration, window_sec=10, seed=1))
+    columns = engine.dataset_columns(pgns)
+    frames = sum(len(s) for s in stores)
+    print(f"{frames} frames, {args.duration} s of {len(pgns)} PGNs\n")
+    print(f"{'format':<14} {'MB':>8} {'B/frame':>8} {'vs csv':>7} {'frames/s':>12} {'MB/s out':>9}")
+
+    csv_bytes = None
+    for file_format in EXPORTERS:
+        for compression in [None] + list(CODECS):
+            best, size = float('inf'), 0
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                size = encode(file_format, stores, columns, compression, args.workers)
+                best = min(best, time.perf_counter() - start)
+            if file_format == 'csv' and compression is None:
+                csv_bytes = size
+            name = file_format + (f"+{compression}" if compression else "")
+            print(f"{name:<14} {size / 1e6:>8.2f} {size / frames:>8.1f} {size / csv_bytes:>7.1%} "
+                  f"{frames / best:>12,.0f} {size / 1e6 / best:>9.1f}")
+
+if __name__ == '__main__':
+    main()
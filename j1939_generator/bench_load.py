@@ -0,0 +1,341 @@
+"""
+Load test: replays a mix of /generate requests against a local server at a
+fixed concurrency.
+
+The app is started on a free local port (gunicorn when it is installed,
+otherwise Flask's threaded development server), or --url points at a
+server that is already running. Every client thread sends requests back to
+back, picking each from the weighted mix, and reads the whole download.
+Reported, overall and per request kind:
+
+    throughput      requests/s and MB/s of completed downloads
+    latency         p50/p95/p99 of successful requests, in ms
+    errors          non-200 answers and connection failures
+    timeouts        requests that exceeded --timeout
+
+plus the server's resident memory (the whole process tree, so every
+gunicorn worker) sampled over the run. The JSON report can be compared
+against a baseline from an earlier build: a throughput drop, a p95 rise
+or a peak RSS rise of more than the threshold fails the run (exit 1).
+
+A mix file is a JSON list of requests such as
+    {"weight": 3, "pgns": "all", "duration": 60, "format": "csv", "compression": "gzip"}
+with "pgns" a list of PGN IDs or "all"; a "seed" makes the request
+cacheable, which the default mix avoids.
+
+Usage: python bench_load.py [--concurrency 12] [--seconds 30 | --requests N] [--mix mix.json]
+                            [--workers 2] [--threads 4] [--url http://host:port]
+                            [-o report.json] [--baseline baseline.json [--update-baseline]]
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+import numpy as np
+from bench_suite import add_baseline_args, environment, finish
+from j1939_db import PGNS
+
+DEFAULT_MIX = [
+    {"weight": 4, "pgns": [61444], "duration": 10, "format": "trc"},
+    {"weight": 3, "pgns": "all", "duration": 60, "format": "csv"},
+    {"weight": 2, "pgns": "all", "duration": 60, "format": "blf", "compression": "gzip"},
+    {"weight": 1, "pgns": "all", "duration": 600, "format": "txt"},
+]
+
+PERCENTILES = (50, 95, 99)
+STARTUP_TIMEOUT_SEC = 60
+
+# --- SERVER ---
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(port, workers, threads, server):
+    """
+    The app on 127.0.0.1:port as a child process.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    if server == 'gunicorn':
+        cmd = [sys.executable, "-m", "gunicorn", "-w", str(workers), "--threads", str(threads),
+               "-b", f"127.0.0.1:{port}", "--timeout", "600", "app:app"]
+    else:
+        cmd = [sys.executable, "-c",
+               f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    return subprocess.Popen(cmd, cwd=here, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def wait_ready(host, port, process=None, timeout=STARTUP_TIMEOUT_SEC):
+    """
+    Seconds until /healthz answers 200.
+    """
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request("GET", "/healthz")
+            if conn.getresponse().status == 200:
+                return time.perf_counter() - start
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"server not ready after {timeout} s")
+
+def _children():
+    tree = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; fields resume after ")"
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        tree.setdefault(ppid, []).append(int(entry))
+    return tree
+
+def tree_rss_mb(pid):
+    """
+    Resident memory of pid and all its descendants in MB, or None where
+    /proc is not available.
+    """
+    if not os.path.isdir("/proc"):
+        return None
+    tree = _children()
+    total, stack = 0, [pid]
+    while stack:
+        p = stack.pop()
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+        stack.extend(tree.get(p, []))
+    return total / 1024
+
+# --- CLIENTS ---
+
+class RequestKind:
+    def __init__(self, spec, all_pgns):
+        self.weight = spec.get("weight", 1)
+        self.pgns = all_pgns if spec.get("pgns", "all") == "all" else [int(p) for p in spec["pgns"]]
+        self.body = {"pgns": self.pgns, "duration": spec.get("duration", 10), "format": spec.get("format", "csv"),
+                     "compression": spec.get("compression"), "seed": spec.get("seed")}
+        self.name = spec.get("name") or (
+            f"{self.body['format']}{'+' + self.body['compression'] if self.body['compression'] else ''}"
+            f"/{self.body['duration']}s/{len(self.pgns)}pgn"
+        )
+
+def send(host, port, kind, timeout):
+    """
+    One /generate request: (status, bytes, seconds); status is "timeout"
+    or "error" when no complete answer arrived.
+    """
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        conn.request("POST", "/generate", json.dumps(kind.body), {"Content-Type": "application/json"})
+        response = conn.getresponse()
+        size = 0
+        while True:
+            chunk = response.read(1 << 16)
+            if not chunk:
+                break
+            size += len(chunk)
+        status = response.status
+    except socket.timeout:
+        status, size = "timeout", 0
+    except (OSError, http.client.HTTPException):
+        status, size = "error", 0
+    finally:
+        conn.close()
+    return status, size, time.perf_counter() - start
+
+def run_load(host, port, kinds, concurrency, seconds, total, timeout, pid=None, sample_sec=0.5):
+    """
+    Runs the clients until seconds have passed or total requests were
+    sent; returns (samples [(kind, status, bytes, seconds, t)], rss
+    timeline [(t, MB)], wall seconds).
+    """
+    samples, rss = [], []
+    lock = threading.Lock()
+    stop = threading.Event()
+    issued = [0]
+    weights = [k.weight for k in kinds]
+    start = time.perf_counter()
+
+    def client(index):
+        rng = random.Random(index)
+        while not stop.is_set():
+            with lock:
+                if total is not None and issued[0] >= total:
+                    return
+                issued[0] += 1
+            kind = rng.choices(kinds, weights)[0]
+            status, size, elapsed = send(host, port, kind, timeout)
+            with lock:
+                samples.append((kind.name, status, size, elapsed, time.perf_counter() - start))
+
+    def sampler():
+        while not stop.wait(sample_sec):
+            value = tree_rss_mb(pid)
+            if value is not None:
+                rss.append((round(time.perf_counter() - start, 2), round(value, 1)))
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    monitor = threading.Thread(target=sampler, daemon=True) if pid is not None else None
+    for t in threads:
+        t.start()
+    if monitor is not None:
+        monitor.start()
+
+    deadline = start + seconds if total is None else None
+    for t in threads:
+        t.join(None if deadline is None else max(deadline - time.perf_counter(), 0))
+    stop.set()
+    # Requests in flight at the deadline still complete and count
+    for t in threads:
+        t.join()
+    if monitor is not None:
+        monitor.join()
+    return samples, rss, time.perf_counter() - start
+
+# --- REPORT ---
+
+def summarize(samples, wall):
+    ok = [s for s in samples if s[1] == 200]
+    latencies = np.array([s[3] for s in ok]) * 1000
+    summary = {
+        "requests": len(samples),
+        "ok": len(ok),
+        "errors": sum(1 for s in samples if s[1] not in (200, "timeout")),
+        "timeouts": sum(1 for s in samples if s[1] == "timeout"),
+        "throughput_rps": len(ok) / wall if wall else 0.0,
+        "throughput_mbps": sum(s[2] for s in ok) / 1e6 / wall if wall else 0.0,
+    }
+    summary["error_rate"] = summary["errors"] / len(samples) if samples else 0.0
+    summary["timeout_rate"] = summary["timeouts"] / len(samples) if samples else 0.0
+    for p in PERCENTILES:
+        summary[f"p{p}_ms"] = float(np.percentile(latencies, p)) if len(latencies) else None
+    return summary
+
+def report(samples, rss, wall):
+    kinds = {}
+    for s in samples:
+        kinds.setdefault(s[0], []).append(s)
+    statuses = {}
+    for s in samples:
+        statuses[str(s[1])] = statuses.get(str(s[1]), 0) + 1
+    return {
+        "wall_sec": wall,
+        "overall": summarize(samples, wall),
+        "kinds": {name: summarize(group, wall) for name, group in sorted(kinds.items())},
+        "statuses": statuses,
+        "rss_mb": rss,
+        "peak_rss_mb": max((v for _, v in rss), default=None),
+    }
+
+def _ms(value):
+    return f"{value:>8.0f}" if value is not None else f"{'-':>8}"
+
+def print_report(result):
+    print(f"{'kind':<28} {'reqs':>6} {'err':>5} {'t/o':>5} {'req/s':>7} {'MB/s':>7} "
+          + " ".join(f"{'p' + str(p) + ' ms':>8}" for p in PERCENTILES))
+    rows = list(result["kinds"].items()) + [("overall", result["overall"])]
+    for name, s in rows:
+        print(f"{name:<28} {s['requests']:>6} {s['errors']:>5} {s['timeouts']:>5} {s['throughput_rps']:>7.2f} "
+              f"{s['throughput_mbps']:>7.2f} " + " ".join(_ms(s[f'p{p}_ms']) for p in PERCENTILES))
+    if result["peak_rss_mb"] is not None:
+        print(f"server RSS: peak {result['peak_rss_mb']:.0f} MB over {len(result['rss_mb'])} samples")
+
+def compare(result, baseline, threshold):
+    """
+    Lines describing the run against the baseline, and the failures.
+    """
+    checks = [
+        ("throughput", result["overall"]["throughput_rps"], baseline["overall"]["throughput_rps"], -1),
+        ("p95 latency", result["overall"]["p95_ms"], baseline["overall"]["p95_ms"], 1),
+        ("peak RSS", result["peak_rss_mb"], baseline["peak_rss_mb"], 1),
+    ]
+    lines, failures = [], []
+    for name, value, base, worse in checks:
+        if value is None or not base:
+            lines.append(f"{name:<12} (not measured)")
+            continue
+        change = value / base - 1
+        status = "WORSE" if change * worse > threshold else "ok"
+        lines.append(f"{name:<12} {change:>+7.1%}  {status}")
+        if status != "ok":
+            failures.append(name)
+    return lines, failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=12, help="client threads sending back to back")
+    parser.add_argument('--seconds', type=float, default=30, help="test length")
+    parser.add_argument('--requests', type=int, default=None, help="stop after this many requests instead")
+    parser.add_argument('--mix', help="JSON file of weighted requests (default: a built-in mix)")
+    parser.add_argument('--timeout', type=float, default=120, help="per-request timeout in seconds")
+    parser.add_argument('--url', help="test this running server instead of starting one")
+    parser.add_argument('--pid', type=int, help="process ID of the --url server, to sample its RSS")
+    parser.add_argument('--server', choices=('gunicorn', 'flask'), default=None,
+                        help="server to start (default: gunicorn if installed)")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument('--threads', type=int, default=4, help="gunicorn threads per worker")
+    parser.add_argument('--sample-sec', type=float, default=0.5, help="RSS sampling interval")
+    add_baseline_args(parser, "allowed throughput drop / p95 and peak RSS growth")
+    args = parser.parse_args(argv)
+
+    if args.mix:
+        with open(args.mix) as f:
+            specs = json.load(f)
+    else:
+        specs = DEFAULT_MIX
+    kinds = [RequestKind(spec, list(PGNS)) for spec in specs]
+
+    server = args.server or ('gunicorn' if importlib.util.find_spec("gunicorn") else 'flask')
+    process = None
+    if args.url:
+        url = urlparse(args.url)
+        host, port = url.hostname, url.port or 80
+        startup = wait_ready(host, port)
+    else:
+        host, port = "127.0.0.1", free_port()
+        process = start_server(port, args.workers, args.threads, server)
+    try:
+        if process is not None:
+            startup = wait_ready(host, port, process)
+        print(f"{server if process else args.url}: ready in {startup:.1f} s, "
+              f"{args.concurrency} clients, {len(kinds)} request kinds")
+        samples, rss, wall = run_load(host, port, kinds, args.concurrency, args.seconds, args.requests,
+                                      args.timeout, process.pid if process else args.pid, args.sample_sec)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(10)
+
+    result = report(samples, rss, wall)
+    print_report(result)
+    output = {"environment": environment(), "threshold": args.threshold,
+              "config": {"server": server if process else args.url, "concurrency": args.concurrency,
+                         "workers": args.workers, "threads": args.threads, "seconds": args.seconds,
+                         "requests": args.requests, "mix": specs},
+              "startup_sec": startup, **result}
+    return finish(args, output, compare)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Start-up benchmark: import-to-first-response latency of the Flask app.
+
+Every run is a fresh interpreter that imports app and sends one small
+/generate request through the test client, with and without the
+J1939_WARMUP hook. Reported per mode and format (medians over the runs):
+
+    import      importing app, including configure_from_env() and warm-up
+    first       the first /generate response, fully read
+    ready       import + first, i.e. import-to-first-response
+    process     wall time of the whole child process, interpreter included
+
+Results can be saved as JSON and checked against a baseline like
+bench_suite.py: any ready time that grows by more than the threshold
+fails the run (exit status 1).
+
+Usage: python bench_startup.py [--runs 5] [--formats csv trc txt]
+                               [--output results.json] [--baseline baseline.json [--update-baseline]]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from bench_suite import add_baseline_args, environment, finish
+from exporters import EXPORTERS
+
+MODES = {"cold": "0", "warmup": "1"}
+
+CHILD = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+pgns = list(app.engine.codec.catalog.pgns)[:1]
+response = client.post('/generate', json={'pgns': pgns, 'format': %r, 'duration': 1, 'seed': 1})
+assert response.status_code == 200, response.status_code
+len(response.data)
+done = time.perf_counter()
+print(json.dumps({'import': imported - start, 'first': done - imported}))
+"""
+
+def run_once(file_format, warmup):
+    env = dict(os.environ, J1939_WARMUP=warmup)
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", CHILD % file_format], env=env, check=True,
+                         capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    process = time.perf_counter() - start
+    timings = json.loads(out.stdout.strip().splitlines()[-1])
+    timings['ready'] = timings['import'] + timings['first']
+    timings['process'] = process
+    return timings
+
+def run_bench(modes, formats, runs, log=print):
+    results = {}
+    for mode in modes:
+        for file_format in formats:
+            samples = [run_once(file_format, MODES[mode]) for _ in range(runs)]
+            r = {key: statistics.median(s[key] for s in samples) * 1000 for key in samples[0]}
+            results[f"{mode}/{file_format}"] = r
+            log(f"{mode + '/' + file_format:<16} {r['import']:>9.1f} {r['first']:>9.1f} "
+                f"{r['ready']:>9.1f} {r['process']:>9.1f}")
+    return results
+
+def compare(report, baseline, threshold):
+    lines, failures = [], []
+    for case_id, r in report['results'].items():
+        base = baseline['results'].get(case_id)
+        if base is None:
+            lines.append(f"{case_id:<16} (new)")
+            continue
+        change = r['ready'] / base['ready'] - 1
+        status = "SLOWER" if change > threshold else "ok"
+        lines.append(f"{case_id:<16} ready {change:>+7.1%}  {status}")
+        if status != "ok":
+            failures.append(case_id)
+    return lines, failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--formats', nargs='+', choices=list(EXPORTERS), default=list(EXPORTERS))
+    parser.add_argument('--runs', type=int, default=5)
+    add_baseline_args(parser, "allowed growth of the ready time vs. the baseline")
+    args = parser.parse_args(argv)
+
+    print(f"{'mode/format':<16} {'import ms':>9} {'first ms':>9} {'ready ms':>9} {'process':>9}")
+    results = run_bench(args.modes, args.formats, max(args.runs, 1))
+    report = {"environment": environment(), "threshold": args.threshold, "results": results}
+    return finish(args, report, compare)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""
+Benchmark suite: timings of the generation and export paths over a grid of
+run durations and PGN counts, compared against a stored baseline.
+
+Cases:
+    pattern     get_smart_pattern() for every SPN of the selection
+    pack        PACK_CALLS pack_message() calls over the selection
+    pack_batch  pack_batch() over every frame of the run
+    dataset     generate_dataset()
+    csv/trc/txt the download writers over iter_frames(), end to end
+
+Each case records its best time, throughput (frames, samples or calls per
+second) and peak traced memory. Results are saved as JSON; with a baseline
+file, any case whose throughput drops or whose peak memory grows by more
+than the threshold fails the run (exit status 1). Baselines are machine
+specific: record one with --update-baseline on the box that will run the
+comparison.
+
+Runs offline with only the app's own dependencies.
+
+Usage: python bench_suite.py [--quick] [--output results.json]
+                             [--baseline baseline.json [--update-baseline]] [--threshold 0.2]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from engine import J1939Engine
+from exporters import EXPORTERS
+from j1939_db import PGNS
+
+DURATIONS = (10, 60, 600, 3600)
+QUICK_DURATIONS = (10, 60)
+PACK_CALLS = 20000
+SEED = 1
+
+# Each timing repeats its case until one measurement takes this long
+MIN_MEASURE_SEC = 0.2
+
+# --- CASES ---
+
+def _frame_count(engine, pgns, duration):
+    return sum(engine.sample_count(duration, engine.codec.pgn(p).cycle_time_ms) for p in pgns)
+
+def case_pattern(engine, pgns, duration):
+    jobs = [(spn_id, engine.codec.pgn(p).cycle_time_ms) for p in pgns for spn_id in engine.codec.pgn(p).spn_ids]
+    samples = sum(engine.sample_count(duration, rate) for _, rate in jobs)
+
+    def run():
+        for spn_id, rate in jobs:
+            engine.get_smart_pattern(spn_id, duration, rate, seed=SEED)
+    return run, samples, "samples"
+
+def case_pack(engine, pgns, duration):
+    calls = PACK_CALLS
+    layouts = [engine.codec.pgn(p) for p in pgns]
+    values = [{s.spn_id: (s.min + s.max) / 2 for s in layout.spns} for layout in layouts]
+
+    def run():
+        for i in range(calls):
+            k = i % len(layouts)
+            engine.pack_message(layouts[k].pgn_id, values[k])
+    return run, calls, "calls"
+
+def case_pack_batch(engine, pgns, duration):
+    blocks = engine.generate_blocks(pgns, duration, SEED)
+    arrays = [(b.layout.pgn_id, dict(zip(b.layout.spn_ids, b.values))) for b in blocks]
+    frames = sum(len(b) for b in blocks)
+
+    def run():
+        for pgn_id, spn_arrays in arrays:
+            engine.pack_batch(pgn_id, spn_arrays)
+    return run, frames, "frames"
+
+def case_dataset(engine, pgns, duration):
+    def run():
+        engine.generate_dataset(pgns, duration_sec=duration, seed=SEED)
+    return run, _frame_count(engine, pgns, duration), "frames"
+
+def export_case(file_format):
+    writer = EXPORTERS[file_format][0]
+
+    def case(engine, pgns, duration):
+        def run():
+            windows = engine.iter_frames(pgns, duration_sec=duration, window_sec=10, seed=SEED,
+                                         signals=file_format == 'csv')
+            for _ in writer(windows, engine.dataset_columns(pgns)):
+                pass
+        return run, _frame_count(engine, pgns, duration), "frames"
+    return case
+
+CASES = {
+    "pattern": case_pattern,
+    "pack": case_pack,
+    "pack_batch": case_pack_batch,
+    "dataset": case_dataset,
+    "csv": export_case('csv'),
+    "trc": export_case('trc'),
+    "txt": export_case('txt'),
+}
+
+# pack_message is timed per call, so the run duration only sets the count
+DURATION_FREE = ("pack",)
+
+# --- MEASUREMENT ---
+
+def measure(run, repeat):
+    """
+    Best seconds per call of run over repeat measurements.
+    """
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_MEASURE_SEC or loops >= 1000:
+            break
+        loops *= 10
+    best = elapsed / loops
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        best = min(best, (time.perf_counter() - start) / loops)
+    return best
+
+def peak_memory(run):
+    """
+    Peak traced allocation of one call of run, in MB.
+    """
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 2**20
+
+def run_suite(cases, durations, pgn_counts, repeat, log=print):
+    engine = J1939Engine()
+    all_pgns = list(PGNS)
+    results = {}
+    for name in cases:
+        for count in pgn_counts:
+            pgns = all_pgns[:count]
+            for duration in durations[:1] if name in DURATION_FREE else durations:
+                case_id = f"{name}/{count}pgn" if name in DURATION_FREE else f"{name}/{duration}s/{count}pgn"
+                run, items, unit = CASES[name](engine, pgns, duration)
+                seconds = measure(run, repeat)
+                results[case_id] = {
+                    "case": name,
+                    "duration_sec": None if name in DURATION_FREE else duration,
+                    "pgns": count,
+                    "items": items,
+                    "unit": unit,
+                    "seconds": seconds,
+                    "rate": items / seconds,
+                    "peak_mb": peak_memory(run),
+                }
+                r = results[case_id]
+                log(f"{case_id:<24} {r['seconds']:>10.4f} {r['rate']:>14,.0f} {unit + '/s':<10} {r['peak_mb']:>9.1f}")
+    return results
+
+def environment():
+    return {
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+def compare(report, baseline, threshold):
+    """
+    Lines describing each case against the baseline, and the failures.
+    """
+    lines, failures = [], []
+    for case_id, r in report['results'].items():
+        base = baseline['results'].get(case_id)
+        if base is None:
+            lines.append(f"{case_id:<24} (new)")
+            continue
+        speed = r['rate'] / base['rate'] - 1
+        memory = r['peak_mb'] / base['peak_mb'] - 1 if base['peak_mb'] else 0.0
+        status = "ok"
+        if speed < -threshold:
+            status = "SLOWER"
+        elif memory > threshold:
+            status = "MORE MEMORY"
+        lines.append(f"{case_id:<24} speed {speed:>+7.1%}  memory {memory:>+7.1%}  {status}")
+        if status != "ok":
+            failures.append(case_id)
+    return lines, failures
+
+# --- BASELINES ---
+
+def add_baseline_args(parser, threshold_help):
+    """
+    The --output/--baseline/--update-baseline/--threshold options that
+    finish() handles.
+    """
+    parser.add_argument('-o', '--output', help="write the report to this JSON file")
+    parser.add_argument('--baseline', help="JSON report to compare against")
+    parser.add_argument('--update-baseline', action='store_true', help="write the report to --baseline")
+    parser.add_argument('--threshold', type=float, default=0.2, help=f"{threshold_help} (0.2 = 20%%)")
+
+def finish(args, report, compare):
+    """
+    Saves the report and checks it against the baseline with
+    compare(report, baseline, threshold) -> (lines, failures). Returns the
+    exit status: 1 on any regression.
+    """
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nagainst {args.baseline} ({baseline['environment']['date']}, "
+              f"threshold {args.threshold:.0%}):")
+        lines, failures = compare(report, baseline, args.threshold)
+        print("\n".join(lines))
+        if failures:
+            print(f"{len(failures)} regression(s): {', '.join(failures)}", file=sys.stderr)
+            return 1
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cases', nargs='+', choices=sorted(CASES), default=list(CASES))
+    parser.add_argument('--durations', type=int, nargs='+', default=None,
+                        help=f"simulated seconds per run (default: {' '.join(map(str, DURATIONS))})")
+    parser.add_argument('--pgn-counts', type=int, nargs='+', default=None,
+                        help="number of PGNs per run (default: 1 and all)")
+    parser.add_argument('--quick', action='store_true',
+                        help=f"durations {' '.join(map(str, QUICK_DURATIONS))} only")
+    parser.add_argument('--repeat', type=int, default=5)
+    add_baseline_args(parser, "allowed throughput drop / peak memory growth vs. the baseline")
+    args = parser.parse_args(argv)
+
+    durations = args.durations or (QUICK_DURATIONS if args.quick else DURATIONS)
+    pgn_counts = sorted(set(min(max(c, 1), len(PGNS)) for c in (args.pgn_counts or (1, len(PGNS)))))
+
+    print(f"{'case':<24} {'seconds':>10} {'throughput':>14} {'':<10} {'peak MB':>9}")
+    results = run_suite(args.cases, durations, pgn_counts, args.repeat)
+    report = {"environment": environment(), "threshold": args.threshold, "results": results}
+    return finish(args, report, compare)
+
+if __name__ == '__main__':
+    sys.exit(main())
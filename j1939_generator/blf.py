@@ -0,0 +1,102 @@
+"""
+Vector BLF (binary logging format) writer.
+
+A BLF file is a 144-byte "LOGG" header followed by LOG_CONTAINER objects,
+each holding a zlib-compressed run of CAN_MESSAGE objects. The message
+objects of a window are built as one NumPy structured array, split into
+containers at object boundaries and the containers are compressed on the
+compression thread pool.
+
+Streamed output cannot go back to the header, so its file size and object
+count fields stay 0; readers walk the containers and don't need them.
+"""
+import struct
+import zlib
+import numpy as np
+from compression import ordered_map
+
+FILE_HEADER = struct.Struct("<4sLBBBBBBBBQQLL8H8H")
+FILE_HEADER_SIZE = 144
+OBJ_HEADER_BASE = struct.Struct("<4sHHLL")
+LOG_CONTAINER = struct.Struct("<H6xL4x")
+
+LOG_CONTAINER_TYPE = 10
+CAN_MESSAGE_TYPE = 1
+ZLIB_DEFLATE = 2
+
+# Object timestamps in nanoseconds
+TIME_ONE_NANS = 2
+CAN_MSG_EXT = 0x80000000
+CHANNEL = 1
+
+# Uncompressed bytes of message objects per container
+CONTAINER_BYTES = 128 * 1024
+ZLIB_LEVEL = 6
+
+# CAN_MESSAGE object: base header, v1 header, message body
+CAN_OBJECT_DTYPE = np.dtype([
+    ('signature', 'S4'),
+    ('header_size', '<u2'),
+    ('header_version', '<u2'),
+    ('object_size', '<u4'),
+    ('object_type', '<u4'),
+    ('flags', '<u4'),
+    ('client_index', '<u2'),
+    ('object_version', '<u2'),
+    ('timestamp', '<u8'),
+    ('channel', '<u2'),
+    ('msg_flags', 'u1'),
+    ('dlc', 'u1'),
+    ('arbitration_id', '<u4'),
+    ('data', 'u1', (8,)),
+])
+
+# Start of the trace as a SYSTEMTIME (year, month, weekday, day, h, m, s, ms),
+# the same zero time the TRC header uses
+EPOCH = (1970, 1, 4, 1, 0, 0, 0, 0)
+
+def file_header():
+    header = FILE_HEADER.pack(b"LOGG", FILE_HEADER_SIZE, 0, 0, 0, 0, 4, 0, 0, 0, 0, 0, 0, 0, *EPOCH, *EPOCH)
+    return header + b"\x00" * (FILE_HEADER_SIZE - len(header))
+
+def can_objects(time_us, can_ids, payloads, dlc):
+    """
+    CAN_MESSAGE objects of a block of frames as raw bytes.
+    """
+    objects = np.zeros(len(time_us), dtype=CAN_OBJECT_DTYPE)
+    objects['signature'] = b"LOBJ"
+    objects['header_size'] = 32
+    objects['header_version'] = 1
+    objects['object_size'] = CAN_OBJECT_DTYPE.itemsize
+    objects['object_type'] = CAN_MESSAGE_TYPE
+    objects['flags'] = TIME_ONE_NANS
+    objects['timestamp'] = np.asarray(time_us, dtype=np.uint64) * 1000
+    objects['channel'] = CHANNEL
+    objects['dlc'] = dlc
+    objects['arbitration_id'] = np.asarray(can_ids, dtype=np.uint32) | CAN_MSG_EXT
+    objects['data'] = payloads
+    return objects.tobytes()
+
+def container(data):
+    """
+    One LOG_CONTAINER object (with its padding) around data.
+    """
+    packed = zlib.compress(data, ZLIB_LEVEL)
+    size = OBJ_HEADER_BASE.size + LOG_CONTAINER.size + len(packed)
+    return b"".join((
+        OBJ_HEADER_BASE.pack(b"LOBJ", OBJ_HEADER_BASE.size, 1, size, LOG_CONTAINER_TYPE),
+        LOG_CONTAINER.pack(ZLIB_DEFLATE, len(data)),
+        packed,
+        b"\x00" * (size % 4),
+    ))
+
+def _object_runs(stores):
+    per_container = CONTAINER_BYTES // CAN_OBJECT_DTYPE.itemsize * CAN_OBJECT_DTYPE.itemsize
+    for store in stores:
+        data = can_objects(store.frames['time_us'], store.can_id, store.data, store.frames['dlc'])
+        for start in range(0, len(data), per_container):
+            yield data[start:start + per_container]
+
+def iter_blf(stores, columns=None):
+    yield file_header()
+    yield from ordered_map(container, _object_runs(stores))
@@ -0,0 +1,362 @@
+"""
+CAN bus timing model: bit-level frame lengths, arbitration and bus load.
+
+The engine stamps every frame with its ideal send time (i * cycle_time_ms),
+as if the bus had unlimited bandwidth. BusModel replays those frames on a
+250 or 500 kbit/s J1939 bus instead:
+
+    length       each 29-bit data frame's exact bit count, with the stuff
+                 bits of its ID, DLC, data and CRC-15
+    arbitration  whenever the bus goes idle, the pending frame with the
+                 lowest CAN ID wins; the others wait for the next idle
+    timestamps   frames are stamped when they finish (end of EOF), as a
+                 receiving logger would see them
+
+Scheduling is vectorized: a cumulative-max pass gives every frame's start
+in ready order and splits the timeline into busy periods. The set of frames
+in a busy period does not depend on their order, so only periods that hold
+frames of several ready times are re-ordered by ID with a priority queue.
+
+Besides the retimed frames the model keeps a bus-utilization series and
+per-PGN latencies (finish time - ready time), see BusModel.report().
+"""
+import heapq
+import numpy as np
+from frames import FrameStore, pgn_of
+
+BITRATES = (250000, 500000)
+
+# SOF, ID A, SRR, IDE, ID B, RTR, r1, r0, DLC: the stuffed header
+HEADER_BITS = 39
+CRC_BITS = 15
+CRC15_POLY = 0x4599
+# CRC delimiter, ACK slot and delimiter, EOF, then the intermission
+TRAILER_BITS = 1 + 2 + 7
+IFS_BITS = 3
+
+# Mean load above this draws a warning
+LOAD_WARN = 0.8
+
+UTILIZATION_BIN_MS = 100
+
+PERCENTILES = (50, 90, 99)
+
+# --- FRAME LENGTH ---
+
+def _crc15(bits, crc):
+    """
+    CRC-15 register after shifting in the columns of a bit matrix.
+    """
+    for column in bits.T:
+        flip = (column ^ (crc >> 14)) & 1
+        crc = (crc << 1) & 0x7FFF
+        crc = crc ^ flip.astype(np.uint16) * CRC15_POLY
+    return crc
+
+def _stuff(bits, last, run, count):
+    """
+    Bit-stuffing state (last bit, run length, stuff bits so far) after the
+    columns of a bit matrix; last = 2 before the first bit.
+    """
+    for column in bits.T:
+        run = np.where(column == last, run + 1, 1).astype(np.uint8)
+        stuff = run == 5
+        count = count + stuff
+        # The stuff bit is the complement and starts a new run
+        last = np.where(stuff, column ^ 1, column).astype(np.uint8)
+        run[stuff] = 1
+    return last, run, count
+
+def _bits_msb(values, width):
+    return ((np.asarray(values)[:, None] >> np.arange(width - 1, -1, -1)) & 1).astype(np.uint8)
+
+def _tables():
+    """
+    Byte-at-a-time tables: the CRC-15 update, and the stuffing state
+    (last * 5 + run) and stuff count after 8 or 7 more bits.
+    """
+    crc = _crc15(_bits_msb(np.arange(256), 8), np.zeros(256, dtype=np.uint16))
+    stuff = {}
+    for width in (8, 7):
+        values = np.arange(1 << width)
+        states = np.arange(15)
+        last, run = np.repeat(states // 5, len(values)), np.repeat(states % 5, len(values))
+        bits = _bits_msb(np.tile(values, len(states)), width)
+        last, run, count = _stuff(bits, last.astype(np.uint8), run.astype(np.uint8), 0)
+        stuff[width] = ((last * 5 + run).reshape(15, -1).astype(np.uint8),
+                        np.asarray(count).reshape(15, -1).astype(np.uint8))
+    return crc, stuff
+
+_CRC_TABLE, _STUFF_TABLES = _tables()
+
+def _header_state(can_id, dlc):
+    """
+    CRC register and stuffing state after SOF..DLC of each frame.
+    """
+    n = len(can_id)
+    bits = np.zeros((n, HEADER_BITS), dtype=np.uint8)
+    id_bits = _bits_msb(can_id.astype(np.int64), 29)
+    # SOF = 0, ID 28..18, SRR = 1, IDE = 1, ID 17..0, RTR = r1 = r0 = 0
+    bits[:, 1:12] = id_bits[:, :11]
+    bits[:, 12:14] = 1
+    bits[:, 14:32] = id_bits[:, 11:]
+    bits[:, 35:39] = _bits_msb(dlc, 4)
+    crc = _crc15(bits, np.zeros(n, dtype=np.uint16))
+    last, run, count = _stuff(bits, np.full(n, 2, dtype=np.uint8), np.zeros(n, dtype=np.uint8),
+                              np.zeros(n, dtype=np.int64))
+    return crc, last * 5 + run, count
+
+def frame_bits(can_id, dlc, data):
+    """
+    Bus bits of 29-bit data frames, stuff bits and intermission included.
+    data is the (n, 8) payload matrix; bytes past the DLC are ignored.
+    """
+    can_id = np.asarray(can_id, dtype=np.int64)
+    dlc = np.minimum(np.asarray(dlc, dtype=np.int64), 8)
+    data = np.asarray(data, dtype=np.uint8)
+
+    # The header only depends on (CAN ID, DLC), of which a trace has few
+    keys, inverse = np.unique((can_id << 4) | dlc, return_inverse=True)
+    crc, state, count = (a[inverse] for a in _header_state(keys >> 4, keys & 0xF))
+    crc = crc.astype(np.int64)
+    state = state.astype(np.intp)
+
+    next8, count8 = _STUFF_TABLES[8]
+    for j in range(int(dlc.max(initial=0))):
+        live = j < dlc
+        byte = data[:, j]
+        crc = np.where(live, ((crc << 8) & 0x7FFF) ^ _CRC_TABLE[((crc >> 7) ^ byte) & 0xFF], crc)
+        count = count + np.where(live, count8[state, byte], 0)
+        state = np.where(live, next8[state, byte], state)
+
+    # CRC field: its top 8 bits, then the low 7
+    count = count + count8[state, crc >> 7]
+    state = next8[state, crc >> 7]
+    count = count + _STUFF_TABLES[7][1][state, crc & 0x7F]
+    return HEADER_BITS + 8 * dlc + CRC_BITS + count + TRAILER_BITS + IFS_BITS
+
+def worst_case_bits(dlc=8):
+    """
+    Longest possible 29-bit data frame with dlc data bytes, in bus bits.
+    """
+    stuffed = HEADER_BITS + 8 * dlc + CRC_BITS
+    return stuffed + (stuffed - 1) // 4 + TRAILER_BITS + IFS_BITS
+
+def estimate_load(codec, pgns, bitrate):
+    """
+    Worst-case bus load of the periodic traffic of pgns, 1.0 = saturated.
+    A PGN listed more than once (several source addresses) counts each time.
+    """
+    bits_per_sec = sum(worst_case_bits() * 1000 / codec.pgn(p).cycle_time_ms for p in pgns)
+    return bits_per_sec / bitrate
+
+# --- ARBITRATION ---
+
+def _arbitrate(ready, can_id, duration, bus_free):
+    """
+    Start times of frames sharing one bus, non-preemptive with the lowest
+    CAN ID winning each arbitration. ready must be sorted, ties by CAN ID.
+    """
+    n = len(ready)
+    # Start times if frames were sent in ready order (Lindley recursion)
+    sent = np.cumsum(duration)
+    before = sent - duration
+    end = np.maximum(np.maximum.accumulate(ready - before), bus_free) + sent
+    start = end - duration
+    if n == 0:
+        return start
+
+    # Busy periods: a frame that finds the bus idle starts a new one
+    previous_end = np.concatenate(([bus_free], end[:-1]))
+    period_start = np.flatnonzero(ready >= previous_end)
+    if len(period_start) == 0 or period_start[0] != 0:
+        period_start = np.concatenate(([0], period_start))
+    bounds = np.concatenate((period_start, [n]))
+
+    # Only periods holding frames of more than one ready time can reorder
+    mixed = ready[bounds[1:] - 1] != ready[bounds[:-1]]
+    if not mixed.any():
+        return start
+
+    ready_l, id_l, duration_l = ready.tolist(), can_id.tolist(), duration.tolist()
+    start = start.tolist()
+    for a, b in zip(bounds[:-1][mixed].tolist(), bounds[1:][mixed].tolist()):
+        t = max(ready_l[a], start[a])
+        k, pending = a, []
+        while k < b or pending:
+            while k < b and ready_l[k] <= t:
+                # Lowest ID first, then ready order among equal IDs
+                heapq.heappush(pending, (id_l[k] << 32) | (k - a))
+                k += 1
+            if not pending:
+                t = ready_l[k]
+                continue
+            i = a + (heapq.heappop(pending) & 0xFFFFFFFF)
+            start[i] = t
+            t += duration_l[i]
+    return np.array(start, dtype=np.int64)
+
+# --- MODEL ---
+
+class BusReport:
+    """
+    Bus statistics of a run: load, utilization series and per-PGN latency.
+    """
+    def __init__(self, bitrate, frames, busy_us, span_us, utilization, bin_ms, latency, warnings):
+        self.bitrate = bitrate
+        self.frames = frames
+        self.busy_us = busy_us
+        self.span_us = span_us
+        self.utilization = utilization
+        self.bin_ms = bin_ms
+        self.latency = latency
+        self.warnings = warnings
+
+    @property
+    def mean_load(self):
+        return self.busy_us / self.span_us if self.span_us else 0.0
+
+    @property
+    def peak_load(self):
+        return float(self.utilization.max()) if len(self.utilization) else 0.0
+
+    def to_dict(self):
+        return {
+            "bitrate": self.bitrate,
+            "frames": self.frames,
+            "mean_load": round(self.mean_load, 4),
+            "peak_load": round(self.peak_load, 4),
+            "bin_ms": self.bin_ms,
+            "utilization": [round(u, 4) for u in self.utilization.tolist()],
+            "latency_us": self.latency,
+            "warnings": self.warnings,
+        }
+
+    def summary(self):
+        """
+        Human-readable report lines.
+        """
+        lines = [f"bus {self.bitrate // 1000} kbit/s: {self.frames} frames, "
+                 f"load {self.mean_load:.1%} mean, {self.peak_load:.1%} peak per {self.bin_ms} ms"]
+        names = " ".join(f"p{p:<7}" for p in PERCENTILES)
+        lines.append(f"  {'PGN':>6} {'frames':>8} {names} {'max':<8}  (latency, us)")
+        for pgn_id, stats in sorted(self.latency.items()):
+            cells = " ".join(f"{stats[f'p{p}']:<8}" for p in PERCENTILES)
+            lines.append(f"  {pgn_id:>6} {stats['frames']:>8} {cells} {stats['max']:<8}")
+        lines.extend(f"warning: {w}" for w in self.warnings)
+        return lines
+
+class BusModel:
+    """
+    Retimes frame windows onto a bus of the given bit rate. One model
+    tracks one run: the bus state and statistics carry over from window
+    to window.
+    """
+    def __init__(self, bitrate=250000, bin_ms=UTILIZATION_BIN_MS):
+        if bitrate not in BITRATES:
+            raise ValueError(f"unsupported bit rate {bitrate}, expected one of {BITRATES}")
+        self.bitrate = bitrate
+        self.bit_us = 1000000 // bitrate
+        self.bin_us = int(bin_ms) * 1000
+        self.bin_ms = int(bin_ms)
+        self.bus_free = 0
+        self._first_ready = None
+        self._busy = np.zeros(0, dtype=np.int64)
+        self._pgns = []
+        self._latency = []
+
+    def _schedule(self, store, horizon=None):
+        """
+        Sends the frames of store that start before horizon. Returns them
+        retimed in bus order, and the not yet started rest with their
+        original timestamps.
+        """
+        frames = store.frames
+        ready = frames['time_us']
+        order = np.lexsort((frames['can_id'], ready))
+        ready = ready[order]
+        can_id = frames['can_id'][order].astype(np.int64)
+        duration = frame_bits(can_id, frames['dlc'][order], frames['data'][order]) * self.bit_us
+
+        start = _arbitrate(ready, can_id, duration, self.bus_free)
+        sent = np.flatnonzero(start < horizon) if horizon is not None else np.arange(len(start))
+        sent = sent[np.argsort(start[sent], kind='stable')]
+        waiting = np.setdiff1d(np.arange(len(start)), sent)
+
+        start, duration = start[sent], duration[sent]
+        done = store.take(order[sent])
+        done.frames['time_us'] = start + duration - IFS_BITS * self.bit_us
+        if len(sent):
+            self.bus_free = int(start[-1] + duration[-1])
+            if self._first_ready is None:
+                self._first_ready = int(ready[0])
+            self._account(start, duration, can_id[sent], done.frames['time_us'] - ready[sent])
+        return done, store.take(order[waiting])
+
+    def _account(self, start, duration, can_id, latency):
+        end = start + duration
+        first, last = start // self.bin_us, (end - 1) // self.bin_us
+        size = int(last.max()) + 1
+        if size > len(self._busy):
+            self._busy = np.concatenate([self._busy, np.zeros(size - len(self._busy), dtype=np.int64)])
+        # Frames are far shorter than a bin: at most two bins each
+        split = np.minimum(end, (first + 1) * self.bin_us)
+        self._busy += np.bincount(first, weights=split - start, minlength=len(self._busy)).astype(np.int64)
+        self._busy += np.bincount(last, weights=end - split, minlength=len(self._busy)).astype(np.int64)
+        self._pgns.append(pgn_of(can_id))
+        self._latency.append(latency)
+
+    def retime(self, store):
+        """
+        One whole run as a bus-timed FrameStore.
+        """
+        done, _ = self._schedule(store)
+        return done
+
+    def windows(self, windows):
+        """
+        Retimes a run given as time-ordered FrameStore windows. Each window
+        is held until the next one arrives, since frames still queued at the
+        window's end compete with the next window's frames.
+        """
+        pending = None
+        for store in windows:
+            if pending is not None:
+                horizon = int(store.frames['time_us'][0]) if len(store) else None
+                if horizon is None:
+                    continue
+                done, waiting = self._schedule(pending, horizon)
+                store = FrameStore.interleave([waiting, store])
+                if len(done):
+                    yield done
+            pending = store
+        if pending is not None and len(pending):
+            yield self.retime(pending)
+
+    def report(self):
+        """
+        BusReport of everything retimed so far.
+        """
+        pgns = np.concatenate(self._pgns) if self._pgns else np.zeros(0, dtype=np.int64)
+        latency = np.concatenate(self._latency) if self._latency else np.zeros(0, dtype=np.int64)
+        stats = {}
+        if len(pgns):
+            order = np.argsort(pgns, kind='stable')
+            ids, first = np.unique(pgns[order], return_index=True)
+            for pgn_id, group in zip(ids.tolist(), np.split(latency[order], first[1:])):
+                values = np.percentile(group, PERCENTILES)
+                stats[pgn_id] = {"frames": len(group), "max": int(group.max())}
+                stats[pgn_id].update({f"p{p}": int(v) for p, v in zip(PERCENTILES, values)})
+
+        busy_us = int(self._busy.sum())
+        span_us = self.bus_free - self._first_ready if self._first_ready is not None else 0
+        utilization = self._busy / self.bin_us
+        report = BusReport(self.bitrate, len(pgns), busy_us, span_us, utilization,
+                           self.bin_ms, stats, [])
+
+        if report.mean_load >= 1.0 or (len(utilization) > 2 and utilization[1:-1].min() >= 1.0):
+            report.warnings.append(f"bus overloaded: {report.mean_load:.0%} mean load, frames queue up "
+                                   f"without bound (worst latency {int(latency.max())} us)")
+        elif report.mean_load > LOAD_WARN:
+            report.warnings.append(f"bus load {report.mean_load:.0%} is above {LOAD_WARN:.0%}")
+        return report
@@ -0,0 +1,171 @@
+"""
+Bounded LRU cache for /generate responses.
+
+Entries are the complete encoded download, keyed on the normalized request
+(pgns, duration, format, seed). The in-memory tier is limited by total
+bytes; entries it evicts can spill to a directory on disk with its own
+byte limit. Only seeded requests are cacheable, since unseeded output is
+meant to differ on every call.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Read size when serving an entry from the disk tier
+SPILL_READ_BYTES = 1 << 20
+
+def cache_key(pgns, duration, file_format, seed, compression=None):
+    """
+    Normalized key: PGN IDs deduplicated in request order (order decides
+    the CSV column layout), plain numbers and a lower-case format.
+    """
+    return (tuple(dict.fromkeys(int(p) for p in pgns)), float(duration), file_format.lower(), int(seed),
+            compression)
+
+class ResultCache:
+    def __init__(self, max_bytes, max_entry_bytes=None, spill_dir=None, spill_max_bytes=0):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes or max_bytes
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes if spill_dir else 0
+
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+
+    def get(self, key):
+        """
+        Iterable of byte chunks for a cached entry, or None on a miss.
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return [self._memory[key]]
+            if key in self._disk:
+                self._disk.move_to_end(key)
+                self.hits += 1
+                self.disk_hits += 1
+                return self._read_spill(self._disk[key][0])
+            self.misses += 1
+            return None
+
+    def put(self, key, data):
+        if len(data) > self.max_entry_bytes:
+            return
+        evicted = []
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= len(self._memory.pop(key))
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+
+            while self._memory_bytes > self.max_bytes:
+                old_key, old_data = self._memory.popitem(last=False)
+                self._memory_bytes -= len(old_data)
+                self.evictions += 1
+                evicted.append((old_key, old_data))
+        # Disk writes happen outside the lock so lookups never wait on them
+        for old_key, old_data in evicted:
+            self._spill(old_key, old_data)
+
+    def tee(self, key, chunks):
+        """
+        Passes a response's chunks through and caches the whole body once the
+        stream completes; gives up early if it outgrows max_entry_bytes.
+        """
+        body = bytearray()
+        for chunk in chunks:
+            if body is not None:
+                body += chunk
+                if len(body) > self.max_entry_bytes:
+                    body = None
+            yield chunk
+        if body is not None:
+            self.put(key, bytes(body))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._memory),
+                "bytes": self._memory_bytes,
+                "max_bytes": self.max_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    # --- DISK TIER ---
+
+    def _spill(self, key, data):
+        """
+        Moves an entry evicted from memory to the disk tier. Takes the lock
+        only to update the index; the file is written to a temp file first.
+        """
+        if len(data) > self.spill_max_bytes:
+            return
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+                return
+
+        fd, tmp = tempfile.mkstemp(dir=self.spill_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+        except OSError:
+            _remove(tmp)
+            return
+
+        path = os.path.join(self.spill_dir, hashlib.sha1(repr(key).encode()).hexdigest() + ".bin")
+        stale = []
+        with self._lock:
+            if key in self._disk:
+                # Spilled by another thread meanwhile
+                stale.append(tmp)
+            else:
+                # Renamed under the lock so the index and the file never disagree
+                os.replace(tmp, path)
+                self._disk[key] = (path, len(data))
+                self._disk_bytes += len(data)
+                while self._disk_bytes > self.spill_max_bytes:
+                    _, (old_path, size) = self._disk.popitem(last=False)
+                    self._disk_bytes -= size
+                    stale.append(old_path)
+        # Readers open their file under the lock, so unlinking it now is safe
+        for old_path in stale:
+            _remove(old_path)
+
+    def _read_spill(self, path):
+        # Opened under the lock so a concurrent eviction cannot remove it first
+        f = open(path, 'rb')
+
+        def chunks():
+            with f:
+                while True:
+                    chunk = f.read(SPILL_READ_BYTES)
+                    if not chunk:
+                        break
+                    yield chunk
+        return chunks()
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
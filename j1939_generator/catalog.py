@@ -0,0 +1,247 @@
+"""
+Indexed PGN/SPN catalog.
+
+A Catalog holds a J1939 database as three flat tables: PGN rows, SPN rows
+grouped by PGN, and one string blob for names and units. It saves to and
+loads from a single .npz file, so even a full Digital Annex import loads
+in milliseconds. Nothing is turned into Python objects up front. The pgns
+and spns mappings build the j1939_db-style definition dicts one entry at a
+time, when a PGN is actually used (see codec.Codec).
+
+Lookups: by PGN, by SPN, by CAN ID (via its PGN), and by name.
+"""
+import numpy as np
+from collections.abc import Mapping
+from frames import pgn_of
+
+CATALOG_VERSION = 1
+
+PGN_ROW = np.dtype([
+    ('pgn', '<u4'),
+    ('can_id', '<u4'),
+    ('cycle_time_ms', '<u4'),
+    ('first_spn', '<u4'),
+    ('num_spns', '<u2'),
+    ('name', '<u4'),
+])
+
+SPN_ROW = np.dtype([
+    ('spn', '<u4'),
+    ('pgn', '<u4'),
+    ('start_byte', 'u1'),
+    ('start_bit', 'u1'),
+    ('len', 'u1'),
+    ('res', '<f8'),
+    ('offset', '<f8'),
+    ('min', '<f8'),
+    ('max', '<f8'),
+    ('name', '<u4'),
+    ('unit', '<u4'),
+])
+
+class _StringTable:
+    """
+    Deduplicated strings packed into one UTF-8 blob.
+    """
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, strings):
+        index, parts, offsets = {}, [], [0]
+        ids = []
+        for s in strings:
+            if s not in index:
+                index[s] = len(parts)
+                parts.append(s.encode("utf-8"))
+                offsets.append(offsets[-1] + len(parts[-1]))
+            ids.append(index[s])
+        blob = np.frombuffer(b"".join(parts), dtype=np.uint8)
+        return cls(blob, np.array(offsets, dtype=np.uint32)), np.array(ids, dtype=np.uint32)
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+class PGNDefs(Mapping):
+    """
+    PGN ID -> {"name", "hex", "cycle_time_ms", "spns"}, built on access.
+    """
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def __getitem__(self, pgn_id):
+        row = self.catalog._pgn_row(pgn_id)
+        if row is None:
+            raise KeyError(pgn_id)
+        c = self.catalog
+        r = c.pgn_table[row]
+        first, count = int(r['first_spn']), int(r['num_spns'])
+        return {
+            "name": c.strings[int(r['name'])],
+            "hex": f"0x{int(r['can_id']):08X}",
+            "cycle_time_ms": int(r['cycle_time_ms']),
+            "spns": c.spn_table['spn'][first:first + count].tolist(),
+        }
+
+    def __contains__(self, pgn_id):
+        return self.catalog._pgn_row(pgn_id) is not None
+
+    def __iter__(self):
+        return iter(self.catalog.pgn_table['pgn'].tolist())
+
+    def __len__(self):
+        return len(self.catalog.pgn_table)
+
+class SPNDefs(Mapping):
+    """
+    SPN ID -> j1939_db-style SPN dict (plus its "pgn"), built on access.
+    """
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def __getitem__(self, spn_id):
+        row = self.catalog._spn_row(spn_id)
+        if row is None:
+            raise KeyError(spn_id)
+        c = self.catalog
+        r = c.spn_table[row]
+        return {
+            "name": c.strings[int(r['name'])],
+            "pgn": int(r['pgn']),
+            "start_byte": int(r['start_byte']),
+            "start_bit": int(r['start_bit']),
+            "len": int(r['len']),
+            "res": float(r['res']),
+            "offset": float(r['offset']),
+            "min": float(r['min']),
+            "max": float(r['max']),
+            "unit": c.strings[int(r['unit'])],
+        }
+
+    def __contains__(self, spn_id):
+        return self.catalog._spn_row(spn_id) is not None
+
+    def __iter__(self):
+        return iter(self.catalog.spn_table['spn'].tolist())
+
+    def __len__(self):
+        return len(self.catalog.spn_table)
+
+class Catalog:
+    def __init__(self, pgn_table, spn_table, strings, source=None):
+        self.pgn_table = pgn_table
+        self.spn_table = spn_table
+        self.strings = strings
+        self.source = source
+
+        # Sorted views for binary-search lookups
+        self._pgn_order = np.argsort(pgn_table['pgn'], kind='stable')
+        self._pgn_sorted = pgn_table['pgn'][self._pgn_order]
+        self._spn_order = np.argsort(spn_table['spn'], kind='stable')
+        self._spn_sorted = spn_table['spn'][self._spn_order]
+        self._names = None
+
+        self.pgns = PGNDefs(self)
+        self.spns = SPNDefs(self)
+
+    @classmethod
+    def from_dicts(cls, pgns, spns, source=None):
+        """
+        Catalog of PGNS/SPNS dictionaries in the j1939_db layout.
+        """
+        pgn_rows, spn_rows, texts = [], [], []
+        for pgn_id, pgn_def in pgns.items():
+            pgn_rows.append((pgn_id, int(pgn_def['hex'], 16), pgn_def['cycle_time_ms'],
+                             len(spn_rows), len(pgn_def['spns']), len(texts)))
+            texts.append(pgn_def['name'])
+            for spn_id in pgn_def['spns']:
+                if spn_id not in spns:
+                    raise ValueError(f"PGN {pgn_id} references unknown SPN {spn_id}")
+                s = spns[spn_id]
+                spn_rows.append((spn_id, pgn_id, s['start_byte'], s['start_bit'], s['len'],
+                                 s['res'], s['offset'], s['min'], s['max'], len(texts), len(texts) + 1))
+                texts.extend((s['name'], s['unit']))
+
+        strings, ids = _StringTable.build(texts)
+        pgn_table = np.array(pgn_rows, dtype=PGN_ROW)
+        spn_table = np.array(spn_rows, dtype=SPN_ROW)
+        # Rows above point at positions in texts; swap in deduplicated IDs
+        pgn_table['name'] = ids[pgn_table['name']] if len(pgn_table) else []
+        if len(spn_table):
+            spn_table['name'] = ids[spn_table['name']]
+            spn_table['unit'] = ids[spn_table['unit']]
+        return cls(pgn_table, spn_table, strings, source)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as f:
+            if int(f['version']) != CATALOG_VERSION:
+                raise ValueError(f"{path}: catalog version {int(f['version'])}, expected {CATALOG_VERSION}")
+            return cls(f['pgns'], f['spns'], _StringTable(f['blob'], f['offsets']), str(f['source']))
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez(f, version=CATALOG_VERSION, pgns=self.pgn_table, spns=self.spn_table,
+                     blob=self.strings.blob, offsets=self.strings.offsets, source=str(self.source or ""))
+
+    # --- LOOKUPS ---
+
+    def _pgn_row(self, pgn_id):
+        i = np.searchsorted(self._pgn_sorted, pgn_id)
+        if i < len(self._pgn_sorted) and self._pgn_sorted[i] == pgn_id:
+            return int(self._pgn_order[i])
+        return None
+
+    def _spn_row(self, spn_id):
+        i = np.searchsorted(self._spn_sorted, spn_id)
+        if i < len(self._spn_sorted) and self._spn_sorted[i] == spn_id:
+            return int(self._spn_order[i])
+        return None
+
+    def pgn_for_can_id(self, can_id):
+        """
+        PGN ID carried by a 29-bit CAN ID, if the catalog has it.
+        """
+        pgn_id = int(pgn_of(can_id))
+        return pgn_id if pgn_id in self.pgns else None
+
+    def find(self, text):
+        """
+        PGN and SPN IDs whose name contains text (case-insensitive), as
+        (pgn_ids, spn_ids).
+        """
+        pgn_names, spn_names = self._name_index()
+        text = text.lower()
+        pgn_ids = self.pgn_table['pgn'][[text in n for n in pgn_names]] if len(pgn_names) else []
+        spn_ids = self.spn_table['spn'][[text in n for n in spn_names]] if len(spn_names) else []
+        return list(map(int, pgn_ids)), list(map(int, spn_ids))
+
+    def _name_index(self):
+        if self._names is None:
+            self._names = (
+                [self.strings[int(i)].lower() for i in self.pgn_table['name']],
+                [self.strings[int(i)].lower() for i in self.spn_table['name']],
+            )
+        return self._names
+
+    def page(self, page=1, per_page=50, query=None):
+        """
+        One page of the PGN list as ([{"id", "name", "hex"}], total),
+        optionally filtered by PGN number or name.
+        """
+        rows = np.arange(len(self.pgn_table))
+        if query:
+            pgn_names, _ = self._name_index()
+            query = query.strip().lower()
+            ids = self.pgn_table['pgn']
+            match = [query in name or query == str(pgn) for name, pgn in zip(pgn_names, ids.tolist())]
+            rows = rows[np.array(match, dtype=bool)] if len(rows) else rows
+
+        start = max(page - 1, 0) * per_page
+        items = []
+        for row in rows[start:start + per_page].tolist():
+            r = self.pgn_table[row]
+            items.append({"id": int(r['pgn']), "name": self.strings[int(r['name'])],
+                          "hex": f"0x{int(r['can_id']):08X}"})
+        return items, len(rows)
@@ -0,0 +1,381 @@
+"""
+Resumable, incremental generation from a saved checkpoint.
+
+A checkpointed run writes its trace as usual plus two files next to the
+checkpoint path:
+
+    <path>         JSON engine state: seed, duration, PGNs, scenario, the
+                   number of samples emitted per PGN, the last timestamp
+                   and the size of the output file
+    <path>.frames  frame log, the raw FRAME_DTYPE records of the trace
+
+Running again with the same checkpoint continues the run instead of
+starting over:
+
+  * a longer duration generates only the samples after the checkpoint
+    and appends them to the output (CSV, TRC, TXT, ASC and BLF; gzip/zstd
+    output gets new members);
+  * extra PGNs are generated from t=0 and merged with the logged frames
+    in the timeline tie order, and the output is rewritten from the log.
+
+Either way the trace is identical to a fresh checkpointed run of the full
+duration and PGN set with the same seed. That needs a time axis that
+doesn't depend on the duration, so checkpointed runs put every sample on
+the sample clock (engine.CLOCK_AXIS) rather than spreading the samples
+over [0, duration] like plain runs do.
+
+Fault injection, transport sessions, bus retiming and fleets have state
+across the cut that isn't captured here and are not supported.
+"""
+import hashlib
+import json
+import os
+import numpy as np
+from engine import CLOCK_AXIS, J1939Engine
+from exporters import ASC_FOOTER, EXPORTERS, iter_trc
+from frames import FRAME_DTYPE, FrameStore, pgn_of
+from compression import compress
+from noise import new_seed
+from scenario import Scenario
+from timeline import can_priority
+
+CHECKPOINT_VERSION = 1
+
+# Formats a longer run can be appended to: name -> (header blocks the writer
+# yields first, trailer it ends with). The rest are rewritten from the log.
+APPENDABLE = {
+    'csv': (1, b""),
+    'trc': (1, b""),
+    'txt': (0, b""),
+    'asc': (1, ASC_FOOTER),
+    'blf': (1, b""),
+}
+
+def codec_fingerprint(codec, pgns):
+    """
+    Short hash of the compiled layouts of pgns; a resume against a changed
+    database would not continue the same trace.
+    """
+    spec = []
+    for pgn_id in sorted(pgns):
+        layout = codec.pgn(pgn_id)
+        spec.append([pgn_id, layout.can_id, layout.cycle_time_ms,
+                     [[s.spn_id, s.name, s.shift, s.length, s.res, s.offset, s.min, s.max] for s in layout.spns]])
+    return hashlib.sha1(json.dumps(spec).encode('utf-8')).hexdigest()[:16]
+
+def frame_log_path(path):
+    return path + ".frames"
+
+class Checkpoint:
+    """
+    Engine state at the end of a checkpointed run.
+    """
+    def __init__(self, seed, duration_sec, pgns, file_format, compression=None, window_sec=10, scenario=None,
+                 samples=None, last_time_us=-1, frames=0, output_bytes=0, fingerprint=None):
+        self.seed = seed
+        self.duration_sec = duration_sec
+        self.pgns = list(pgns)
+        self.file_format = file_format
+        self.compression = compression
+        self.window_sec = window_sec
+        # Scenario spec dict (Scenario.to_dict()), or None
+        self.scenario = scenario
+        # Samples emitted so far per PGN: the next sample index to generate
+        self.samples = samples or {}
+        self.last_time_us = last_time_us
+        self.frames = frames
+        self.output_bytes = output_bytes
+        self.fingerprint = fingerprint
+
+    def to_dict(self):
+        return {
+            "version": CHECKPOINT_VERSION,
+            "seed": self.seed,
+            "duration_sec": self.duration_sec,
+            "pgns": self.pgns,
+            "format": self.file_format,
+            "compression": self.compression,
+            "window_sec": self.window_sec,
+            "scenario": self.scenario,
+            "samples": {str(p): n for p, n in self.samples.items()},
+            "last_time_us": self.last_time_us,
+            "frames": self.frames,
+            "output_bytes": self.output_bytes,
+            "fingerprint": self.fingerprint,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        if state.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version {state.get('version')!r}, "
+                             f"expected {CHECKPOINT_VERSION}")
+        return cls(state["seed"], state["duration_sec"], state["pgns"], state["format"], state.get("compression"),
+                   state.get("window_sec", 10), state.get("scenario"),
+                   {int(p): n for p, n in state["samples"].items()}, state["last_time_us"], state["frames"],
+                   state["output_bytes"], state.get("fingerprint"))
+
+    def save(self, path):
+        # Written aside and renamed so a crash never leaves half a checkpoint
+        tmp = path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            try:
+                return cls.from_dict(json.load(f))
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f"invalid checkpoint {path}: {e}") from None
+
+    def engine(self, codec=None):
+        scenario = Scenario.from_dict(self.scenario) if self.scenario is not None else None
+        return J1939Engine(codec, scenario=scenario, time_axis=CLOCK_AXIS)
+
+    def read_frames(self, path):
+        """
+        The logged frames of the run, memory-mapped.
+        """
+        log = frame_log_path(path)
+        if os.path.getsize(log) != self.frames * FRAME_DTYPE.itemsize:
+            raise ValueError(f"frame log {log} does not match the checkpoint ({self.frames} frames)")
+        if not self.frames:
+            return np.zeros(0, dtype=FRAME_DTYPE)
+        return np.memmap(log, dtype=FRAME_DTYPE, mode='r')
+
+class _LoggedFrames:
+    """
+    Passes FrameStore windows through while appending their frames to the
+    frame log and tracking the state the checkpoint needs.
+    """
+    def __init__(self, windows, log):
+        self.windows = windows
+        self.log = log
+        self.frames = 0
+        self.last_time_us = -1
+
+    def __iter__(self):
+        for store in self.windows:
+            if len(store):
+                self.log.write(store.frames.tobytes())
+                self.frames += len(store)
+                self.last_time_us = int(store.frames['time_us'][-1])
+            yield store
+
+def _blocks(file_format, compression, stores, columns, first_msg_num=1, skip=0):
+    """
+    Writer output of stores, without the first skip blocks, compressed.
+    """
+    if file_format == 'trc':
+        blocks = iter_trc(stores, columns, first_msg_num)
+    else:
+        blocks = EXPORTERS[file_format][0](stores, columns)
+    if skip:
+        blocks = _skip(blocks, skip)
+    if compression:
+        blocks = compress(blocks, compression)
+    return blocks
+
+def _skip(blocks, count):
+    for i, block in enumerate(blocks):
+        if i >= count:
+            yield block
+
+def _write(blocks, out):
+    written = 0
+    for block in blocks:
+        out.write(block)
+        written += len(block)
+    return written
+
+def _sample_counts(engine, pgns, duration_sec):
+    return {p: engine.sample_count(duration_sec, engine.codec.pgn(p).cycle_time_ms) for p in pgns}
+
+def _tie_sorted(frames):
+    """
+    frames in trace order: by time, ties by (priority, PGN, source address)
+    like timeline.block_order. Each PGN's frames keep their order.
+    """
+    can_id = frames['can_id']
+    order = np.lexsort((can_id & 0xFF, pgn_of(can_id), can_priority(can_id), frames['time_us']))
+    return frames[order]
+
+def _rewrite_windows(frames, window_sec):
+    """
+    frames cut at the same window edges engine.iter_frames() uses, so
+    block-structured output (BLF containers, compressed members) matches.
+    """
+    window_us = max(int(window_sec * 1000), 1) * 1000
+    time_us = frames['time_us']
+    if not len(time_us):
+        return
+    edges = np.arange(window_us, int(time_us[-1]) + window_us, window_us)
+    bounds = [0] + np.searchsorted(time_us, edges).tolist()
+    for start, stop in zip(bounds, bounds[1:]):
+        if start < stop:
+            yield FrameStore(frames[start:stop])
+
+class CheckpointedRun:
+    """
+    A generation run that saves a checkpoint at path and resumes from it.
+
+    prepare() works out what the run has to do (fresh, append or rewrite)
+    and raises ValueError before anything is written if the request can't
+    continue the checkpointed trace; run() then writes the output.
+    """
+    def __init__(self, path, output, pgns=None, duration_sec=None, seed=None, file_format=None, compression=None,
+                 window_sec=None, scenario=None, codec=None):
+        self.path = path
+        self.output = output
+        self.pgns = list(pgns) if pgns is not None else None
+        self.duration_sec = duration_sec
+        self.seed = seed
+        self.file_format = file_format
+        self.compression = compression
+        self.window_sec = window_sec
+        self.scenario = scenario
+        self.codec = codec
+        self.checkpoint = None
+        self.mode = None
+
+    def prepare(self):
+        previous = Checkpoint.load(self.path) if os.path.exists(self.path) else None
+        if previous is None:
+            self._prepare_fresh()
+        else:
+            self._prepare_resume(previous)
+        return self.mode
+
+    def _prepare_fresh(self):
+        if self.pgns is None or self.duration_sec is None:
+            raise ValueError("a new checkpointed run needs PGNs and a duration")
+        self.seed = self.seed if self.seed is not None else new_seed()
+        self.file_format = self.file_format or 'csv'
+        self.window_sec = self.window_sec or 10
+        self.engine = J1939Engine(self.codec, scenario=self.scenario, time_axis=CLOCK_AXIS)
+        self.mode = "fresh"
+
+    def _prepare_resume(self, previous):
+        # Anything not given continues as checkpointed
+        for name, saved in (("seed", previous.seed), ("file_format", previous.file_format),
+                            ("compression", previous.compression)):
+            given = getattr(self, name)
+            if given is not None and given != saved:
+                raise ValueError(f"the checkpoint was written with {name} {saved!r}, not {given!r}")
+            setattr(self, name, saved)
+        self.window_sec = self.window_sec or previous.window_sec
+        if self.scenario is not None and self.scenario.to_dict() != previous.scenario:
+            raise ValueError("the checkpoint was written with a different scenario")
+        self.duration_sec = self.duration_sec if self.duration_sec is not None else previous.duration_sec
+        if self.duration_sec < previous.duration_sec:
+            raise ValueError(f"the checkpoint already covers {previous.duration_sec} s, "
+                             f"can't shorten it to {self.duration_sec} s")
+        self.pgns = self.pgns if self.pgns is not None else previous.pgns
+        missing = [p for p in previous.pgns if p not in self.pgns]
+        if missing:
+            raise ValueError(f"the checkpointed run has PGN(s) {missing}; PGNs can be added but not removed")
+
+        self.engine = previous.engine(self.codec)
+        if previous.fingerprint != codec_fingerprint(self.engine.codec, previous.pgns):
+            raise ValueError("the PGN/SPN database changed since the checkpoint was written")
+        if not os.path.exists(self.output) or os.path.getsize(self.output) < previous.output_bytes:
+            raise ValueError(f"{self.output} is missing or shorter than the checkpointed output "
+                             f"({previous.output_bytes} bytes)")
+        self.checkpoint = previous
+
+        added = [p for p in self.pgns if p not in previous.pgns]
+        if not added and self.duration_sec == previous.duration_sec:
+            self.mode = "done"
+            return
+        # Appending needs every new frame to come after the last written one:
+        # the old duration has to end on a whole cycle of every PGN
+        next_us = min((n * self.engine.codec.pgn(p).cycle_time_ms * 1000
+                       for p, n in previous.samples.items()), default=0)
+        header_blocks, trailer = APPENDABLE.get(self.file_format, (None, b""))
+        if (not added and header_blocks is not None and next_us > previous.last_time_us
+                and not (trailer and self.compression)):
+            self.mode = "append"
+            return
+        if self.file_format == 'csv':
+            raise ValueError("a CSV trace can only be extended at a point where every PGN's cycle has ended "
+                             "(a duration that is a multiple of every cycle time) and without adding PGNs; "
+                             "use another format or start a new checkpoint")
+        self.mode = "rewrite"
+
+    def run(self):
+        """
+        Writes the output and the new checkpoint. Returns (frames added,
+        bytes written).
+        """
+        if self.mode is None:
+            self.prepare()
+        if self.mode == "done":
+            return 0, 0
+        return getattr(self, f"_run_{self.mode}")()
+
+    def _columns(self):
+        return self.engine.dataset_columns(self.pgns)
+
+    def _windows(self, first_samples=None):
+        return self.engine.iter_frames(self.pgns, duration_sec=self.duration_sec, window_sec=self.window_sec,
+                                       seed=self.seed, signals=self.file_format == 'csv',
+                                       first_samples=first_samples)
+
+    def _run_fresh(self):
+        with open(frame_log_path(self.path), 'wb') as log, open(self.output, 'wb') as out:
+            windows = _LoggedFrames(self._windows(), log)
+            written = _write(_blocks(self.file_format, self.compression, windows, self._columns()), out)
+        self._save(windows.frames, windows.last_time_us, written)
+        return windows.frames, written
+
+    def _run_append(self):
+        previous = self.checkpoint
+        header_blocks, trailer = APPENDABLE[self.file_format]
+        with open(self.output, 'r+b') as out:
+            end = previous.output_bytes
+            if trailer:
+                out.seek(end - len(trailer))
+                if out.read(len(trailer)) != trailer:
+                    raise ValueError(f"{self.output} does not end like a {self.file_format} trace")
+                end -= len(trailer)
+            # Anything after the checkpointed size is from an interrupted resume
+            out.truncate(end)
+            out.seek(end)
+            with open(frame_log_path(self.path), 'r+b') as log:
+                log.truncate(previous.frames * FRAME_DTYPE.itemsize)
+                log.seek(0, os.SEEK_END)
+                windows = _LoggedFrames(self._windows(previous.samples), log)
+                written = _write(_blocks(self.file_format, self.compression, windows, self._columns(),
+                                         first_msg_num=previous.frames + 1, skip=header_blocks), out)
+        last_time_us = windows.last_time_us if windows.frames else previous.last_time_us
+        self._save(previous.frames + windows.frames, last_time_us, end + written)
+        return windows.frames, written
+
+    def _run_rewrite(self):
+        previous = self.checkpoint
+        logged = previous.read_frames(self.path)
+        new = [store.frames for store in self._windows(previous.samples)]
+        frames = _tie_sorted(np.concatenate([logged] + new))
+        added = len(frames) - previous.frames
+
+        # New output and log aside first, so a failure leaves the checkpoint usable
+        tmp_output, tmp_log = self.output + ".tmp", frame_log_path(self.path) + ".tmp"
+        with open(tmp_log, 'wb') as log:
+            log.write(frames.tobytes())
+        with open(tmp_output, 'wb') as out:
+            written = _write(_blocks(self.file_format, self.compression, _rewrite_windows(frames, self.window_sec), None), out)
+        del logged
+        os.replace(tmp_output, self.output)
+        os.replace(tmp_log, frame_log_path(self.path))
+        self._save(len(frames), int(frames['time_us'][-1]) if len(frames) else -1, written)
+        return added, written
+
+    def _save(self, frames, last_time_us, output_bytes):
+        scenario = self.engine.scenario.to_dict() if self.engine.scenario is not None else None
+        self.checkpoint = Checkpoint(
+            self.seed, self.duration_sec, self.pgns, self.file_format, self.compression, self.window_sec, scenario,
+            _sample_counts(self.engine, self.pgns, self.duration_sec), last_time_us, frames, output_bytes,
+            codec_fingerprint(self.engine.codec, self.pgns)
+        )
+        self.checkpoint.save(self.path)
@@ -0,0 +1,322 @@
+"""
+Headless batch generator.
+
+Writes a generated trace straight to a file (or stdout) window by window,
+reusing J1939Engine and the download format writers, so memory stays
+bounded however long the run is. Throughput is reported on stderr.
+
+Usage (from the repository root):
+    python -m j1939_generator --pgns 61444 65265 --duration 3600 --format trc -o trace.trc
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from arrow_export import ARROW_EXPORTERS, SignalTableWriter
+from busmodel import BITRATES, BusModel, LOAD_WARN, estimate_load
+from checkpoint import CheckpointedRun
+from compression import CODECS, compress
+from db_import import configure_from_env
+from engine import J1939Engine
+from exporters import EXPORTERS
+from faults import FaultPlan, FaultSpec, labels_dataframe
+from fleet import FleetInstance, generate_fleet
+from frames import BASE_COLUMNS, FrameStore
+from noise import new_seed, parse_seed
+from playback import open_sink, play
+from scenario import DRIVE_CYCLES, Scenario
+from transport import TransportScheduler, TransportSpec
+
+DEFAULT_CHUNK_BYTES = 1 << 20
+
+class _CountingFrames:
+    """
+    Passes FrameStore windows through while counting frames.
+    """
+    def __init__(self, windows):
+        self.windows = windows
+        self.frames = 0
+
+    def __iter__(self):
+        for store in self.windows:
+            self.frames += len(store)
+            yield store
+
+def write_chunks(blocks, out, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Re-chunks writer output into fixed-size writes; returns bytes written.
+    """
+    pending = bytearray()
+    written = 0
+    for block in blocks:
+        pending += block
+        while len(pending) >= chunk_bytes:
+            out.write(pending[:chunk_bytes])
+            del pending[:chunk_bytes]
+            written += chunk_bytes
+    if pending:
+        out.write(pending)
+        written += len(pending)
+    out.flush()
+    return written
+
+def _seed(value):
+    # argparse reports ArgumentTypeError messages through parser.error
+    try:
+        return parse_seed(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+def parse_args(argv=None):
+    engine = J1939Engine()
+    parser = argparse.ArgumentParser(
+        prog="python -m j1939_generator",
+        description="Generate a J1939 trace without the web app."
+    )
+    parser.add_argument('--pgns', type=int, nargs='+', default=None,
+                        help="PGN IDs to simulate (default: all)")
+    parser.add_argument('--duration', type=float, default=None, help="simulated seconds (default: 10)")
+    parser.add_argument('--seed', type=_seed, default=None, help="random seed for reproducible output")
+    parser.add_argument('--format', choices=sorted(EXPORTERS), default=None, help="output format (default: csv)")
+    parser.add_argument('-o', '--output', default='-', help="output file, '-' for stdout")
+    parser.add_argument('--compress', choices=sorted(CODECS), help="compress the output (block-parallel)")
+    parser.add_argument('--signal-tables', metavar='DIR',
+                        help="also write the frame table and one decoded signal table per PGN into DIR "
+                             "(Parquet, or Arrow files with --format arrow; needs pyarrow)")
+    parser.add_argument('--window', type=float, default=10, help="simulated seconds per generation window")
+    parser.add_argument('--chunk-bytes', type=int, default=DEFAULT_CHUNK_BYTES, help="size of each write")
+    parser.add_argument('--fleet', metavar='FILE',
+                        help="JSON list of {source_address, pgns, seed, time_offset_ms} ECU instances; "
+                             "replaces --pgns/--seed")
+    parser.add_argument('--workers', type=int, default=None, help="processes for --fleet (default: all cores)")
+    parser.add_argument('--transport', metavar='FILE',
+                        help="JSON list of multi-packet session specs {pgn, mode: bam|cmdt, source_addresses, "
+                             "period_ms, ...} to add TP.CM/TP.DT traffic")
+    parser.add_argument('--scenario', metavar='CYCLE',
+                        help=f"drive cycle that drives speed, throttle, torque and fuel SPNs: "
+                             f"{', '.join(sorted(DRIVE_CYCLES))} or a JSON file of segments")
+    parser.add_argument('--faults', metavar='FILE',
+                        help="JSON list of fault specs {kind: stuck|out_of_range|error|not_available|jitter|drop|dm1, "
+                             "spn or pgn, start_s, stop_s, probability, ...} to inject")
+    parser.add_argument('--fault-labels', metavar='FILE',
+                        help="write the ground-truth table of faulted frames to this CSV file")
+    parser.add_argument('--bitrate', type=int, choices=BITRATES,
+                        help="retime frames by arbitration on a bus of this bit rate and report bus load "
+                             "and per-PGN latency on stderr")
+    parser.add_argument('--play', metavar='SINK',
+                        help="send frames in real time instead of writing a file: "
+                             "udp://host:port, unix:///path, can://vcan0 or null://")
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help="playback speed vs. wall clock for --play; 0 = as fast as possible")
+    parser.add_argument('--checkpoint', metavar='FILE',
+                        help="save the engine state to FILE (and its frame log to FILE.frames) after the run; "
+                             "if FILE exists, continue that run instead: a longer --duration appends to -o, "
+                             "extra --pgns are merged in. Samples sit on the sample clock in checkpointed runs")
+    parser.add_argument('-q', '--quiet', action='store_true', help="no throughput report")
+    args = parser.parse_args(argv)
+
+    if args.checkpoint:
+        unsupported = [name for name in ('fleet', 'transport', 'faults', 'bitrate', 'play', 'signal_tables')
+                       if getattr(args, name)]
+        if unsupported:
+            parser.error(f"--checkpoint does not apply to --{unsupported[0].replace('_', '-')}")
+        if args.output == '-':
+            parser.error("--checkpoint needs an output file (-o)")
+    # A resumed run takes what isn't given from its checkpoint
+    if not (args.checkpoint and os.path.exists(args.checkpoint)):
+        args.pgns = args.pgns if args.pgns is not None else list(engine.codec.pgns)
+        args.duration = args.duration if args.duration is not None else 10
+        args.format = args.format or 'csv'
+
+    if args.fleet:
+        with open(args.fleet) as f:
+            try:
+                args.instances = [FleetInstance.from_dict(spec) for spec in json.load(f)]
+            except (KeyError, TypeError, ValueError) as e:
+                parser.error(f"invalid fleet file {args.fleet}: {e}")
+        args.pgns = [p for inst in args.instances for p in inst.pgns]
+
+    args.transport_specs = None
+    if args.transport:
+        with open(args.transport) as f:
+            try:
+                args.transport_specs = [TransportSpec.from_dict(spec) for spec in json.load(f)]
+            except (KeyError, TypeError, ValueError) as e:
+                parser.error(f"invalid transport file {args.transport}: {e}")
+
+    args.fault_specs = None
+    if args.faults:
+        if args.fleet:
+            parser.error("--faults does not apply to --fleet")
+        with open(args.faults) as f:
+            try:
+                args.fault_specs = [FaultSpec.from_dict(spec) for spec in json.load(f)]
+            except (KeyError, TypeError, ValueError) as e:
+                parser.error(f"invalid fault file {args.faults}: {e}")
+    elif args.fault_labels:
+        parser.error("--fault-labels needs --faults")
+
+    if args.signal_tables:
+        if args.fleet:
+            parser.error("--signal-tables does not apply to --fleet")
+        if not ARROW_EXPORTERS:
+            parser.error("--signal-tables needs pyarrow (pip install pyarrow)")
+
+    if args.scenario:
+        if args.fleet:
+            parser.error("--scenario does not apply to --fleet")
+        try:
+            args.scenario = Scenario.load(args.scenario)
+        except (OSError, KeyError, TypeError, ValueError) as e:
+            parser.error(f"invalid scenario {args.scenario}: {e}")
+
+    unknown = [p for p in args.pgns or [] if p not in engine.codec.pgns]
+    if unknown:
+        parser.error(f"unknown PGN(s): {unknown}")
+    if args.rate < 0:
+        parser.error("--rate must not be negative")
+    if (args.duration is not None and args.duration <= 0) or args.window <= 0 or args.chunk_bytes <= 0:
+        parser.error("--duration, --window and --chunk-bytes must be positive")
+    return args
+
+def make_engine(args):
+    """
+    Engine for the run described by args, with its --scenario and --faults.
+    Fixes args.seed so the fault plan and the trace share it.
+    """
+    if args.seed is None:
+        args.seed = new_seed()
+    faults = FaultPlan(args.fault_specs, args.seed) if args.fault_specs else None
+    return J1939Engine(scenario=args.scenario, faults=faults)
+
+def write_fault_labels(args, engine):
+    if args.fault_labels:
+        labels = engine.faults.labels(engine, args.pgns, args.duration)
+        labels_dataframe(labels).to_csv(args.fault_labels, index=False)
+
+def trace_windows(args, engine, signals, bus=None):
+    """
+    FrameStore windows of the run described by args, with any --transport
+    sessions merged into the timeline, retimed by bus if given.
+    """
+    seed = args.seed if args.seed is not None else new_seed()
+    transport = TransportScheduler(args.transport_specs, seed) if args.transport_specs else None
+
+    if args.fleet:
+        store = generate_fleet(args.instances, args.duration, args.workers, codec=engine.codec)
+        if transport is not None:
+            store = FrameStore.interleave([store, transport.frames(args.duration)])
+        return [store] if bus is None else [bus.retime(store)]
+    return engine.iter_frames(args.pgns, duration_sec=args.duration, window_sec=args.window,
+                              seed=seed, signals=signals, transport=transport, bus=bus)
+
+def bus_model(args, engine):
+    """
+    BusModel for --bitrate, or None. Warns up front when the periodic
+    traffic of the selected PGNs alone may not fit on the bus.
+    """
+    if not args.bitrate:
+        return None
+    load = estimate_load(engine.codec, args.pgns, args.bitrate)
+    if load > LOAD_WARN and not args.quiet:
+        print(f"warning: worst-case load of the selected PGNs is {load:.0%} of {args.bitrate // 1000} kbit/s"
+              + (", frames will queue up without bound" if load >= 1.0 else ""), file=sys.stderr)
+    return BusModel(args.bitrate)
+
+def run(args, out):
+    """
+    Generates the trace described by args into the binary stream out.
+    Returns (frames, bytes_written, seconds).
+    """
+    engine = make_engine(args)
+    writer = EXPORTERS[args.format][0]
+    start = time.perf_counter()
+
+    args.bus = bus_model(args, engine)
+    windows = trace_windows(args, engine, signals=args.format == 'csv' or bool(args.signal_tables), bus=args.bus)
+    tables = None
+    if args.signal_tables:
+        tables = SignalTableWriter(args.signal_tables, 'arrow' if args.format == 'arrow' else 'parquet')
+        windows = tables.tee(windows)
+    windows = _CountingFrames(windows)
+    # Fleet traces carry frames only; the CSV has no per-SPN columns
+    columns = BASE_COLUMNS if args.fleet else engine.dataset_columns(args.pgns)
+
+    blocks = writer(windows, columns)
+    if args.compress:
+        blocks = compress(blocks, args.compress)
+    try:
+        written = write_chunks(blocks, out, args.chunk_bytes)
+    finally:
+        if tables is not None:
+            tables.close()
+    write_fault_labels(args, engine)
+    return windows.frames, written, time.perf_counter() - start
+
+def run_checkpointed(args):
+    """
+    Generates, extends or adds PGNs to the checkpointed run of args.
+    Returns (frames added, bytes written, seconds).
+    """
+    start = time.perf_counter()
+    args.bus = None
+    job = CheckpointedRun(args.checkpoint, args.output, args.pgns, args.duration, args.seed, args.format,
+                          args.compress, args.window, args.scenario)
+    mode = job.prepare()
+    if not args.quiet:
+        print(f"checkpoint {args.checkpoint}: {mode}", file=sys.stderr)
+    frames, written = job.run()
+    return frames, written, time.perf_counter() - start
+
+def run_playback(args):
+    """
+    Plays the trace described by args into the --play sink in real time.
+    """
+    engine = make_engine(args)
+    args.bus = bus_model(args, engine)
+    windows = trace_windows(args, engine, signals=False, bus=args.bus)
+    stats = play(windows, open_sink(args.play), rate=args.rate)
+    write_fault_labels(args, engine)
+    return stats
+
+def report_bus(args):
+    if args.bus is not None and not args.quiet:
+        for line in args.bus.report().summary():
+            print(line, file=sys.stderr)
+
+def main(argv=None):
+    configure_from_env()
+    args = parse_args(argv)
+
+    if args.play:
+        stats = run_playback(args).to_dict()
+        if not args.quiet:
+            print(" ".join(f"{k}={v}" for k, v in stats.items()), file=sys.stderr)
+        report_bus(args)
+        return 0
+
+    if args.checkpoint:
+        try:
+            frames, written, elapsed = run_checkpointed(args)
+        except ValueError as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 2
+    elif args.output == '-':
+        frames, written, elapsed = run(args, sys.stdout.buffer)
+    else:
+        with open(args.output, 'wb') as out:
+            frames, written, elapsed = run(args, out)
+
+    if not args.quiet:
+        elapsed = max(elapsed, 1e-9)
+        print(
+            f"{frames} frames, {written / 1e6:.2f} MB in {elapsed:.2f} s "
+            f"({frames / elapsed:,.0f} frames/sec, {written / 1e6 / elapsed:.2f} MB/sec)",
+            file=sys.stderr
+        )
+    report_bus(args)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""
+Compiled signal-layout codec.
+
+Turns the PGN/SPN definitions of a catalog (by default the j1939_db
+tables) into per-PGN numpy arrays (shift, mask, resolution, offset, min,
+max) plus per-SPN pattern and scenario channel dispatch tables. Each PGN is compiled and
+validated the first time it is used, so large imported databases cost
+nothing for PGNs a run never touches. reload() swaps in new definitions;
+the engine and exporters only read the compiled form.
+"""
+from collections.abc import Mapping
+import numpy as np
+from catalog import Catalog
+from j1939_db import PGNS, SPNS
+from patterns import select_pattern
+from scenario import select_channel
+
+PAYLOAD_BITS = 64
+
+def build_can_id(priority, pgn, source_address):
+    """
+    29-bit J1939 CAN ID from priority, PGN and source address. PDU1 PGNs
+    carry destination 0 in their low byte here.
+    """
+    return ((priority & 0x7) << 26) | ((pgn & 0x3FFFF) << 8) | (source_address & 0xFF)
+
+class SPNLayout:
+    """
+    Compiled definition of one SPN inside its PGN's payload.
+    """
+    __slots__ = ("spn_id", "name", "unit", "shift", "length", "mask",
+                 "res", "offset", "min", "max", "pattern", "channel")
+
+    def __init__(self, spn_id, spec):
+        self.spn_id = spn_id
+        self.name = spec['name']
+        self.unit = spec['unit']
+        self.shift = (spec['start_byte'] * 8) + spec['start_bit']
+        self.length = spec['len']
+        self.mask = (1 << spec['len']) - 1
+        self.res = float(spec['res'])
+        self.offset = float(spec['offset'])
+        self.min = spec['min']
+        self.max = spec['max']
+        self.pattern = select_pattern(spec['name'])
+        self.channel = select_channel(spec['name'])
+
+class PGNLayout:
+    """
+    Compiled PGN: metadata plus column arrays over its SPNs, in DB order.
+    """
+    def __init__(self, pgn_id, pgn_def, spns):
+        self.pgn_id = pgn_id
+        self.name = pgn_def['name']
+        self.hex = pgn_def['hex']
+        self.can_id = int(pgn_def['hex'], 16)
+        self.priority = (self.can_id >> 26) & 0x7
+        self.source_address = self.can_id & 0xFF
+        self.cycle_time_ms = pgn_def['cycle_time_ms']
+        self.spns = spns
+        self.spn_ids = [s.spn_id for s in spns]
+        self.names = [s.name for s in spns]
+
+        self.shift = np.array([s.shift for s in spns], dtype=np.uint64)
+        self.mask = np.array([s.mask for s in spns], dtype=np.uint64)
+        self.res = np.array([s.res for s in spns], dtype=np.float64)
+        self.offset = np.array([s.offset for s in spns], dtype=np.float64)
+        self.min = np.array([s.min for s in spns], dtype=np.float64)
+        self.max = np.array([s.max for s in spns], dtype=np.float64)
+
+    def can_id_for(self, source_address):
+        """
+        This PGN's CAN ID as sent by another ECU source address.
+        """
+        return build_can_id(self.priority, self.pgn_id, source_address)
+
+class _LazyLayouts(Mapping):
+    """
+    PGN ID -> PGNLayout, compiling each PGN on first access. Membership,
+    iteration and len() only touch the catalog index.
+    """
+    def __init__(self, codec):
+        self.codec = codec
+        self.compiled = {}
+
+    def __getitem__(self, pgn_id):
+        layout = self.compiled.get(pgn_id)
+        if layout is None:
+            layout = self.codec._compile(pgn_id)
+        return layout
+
+    def __contains__(self, pgn_id):
+        return pgn_id in self.codec.catalog.pgns
+
+    def __iter__(self):
+        return iter(self.codec.catalog.pgns)
+
+    def __len__(self):
+        return len(self.codec.catalog.pgns)
+
+class Codec:
+    """
+    Compiled view of a PGN/SPN catalog.
+    """
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.pgns = _LazyLayouts(self)
+        self.spns = {}
+
+    def _compile(self, pgn_id):
+        pgn_def = self.catalog.pgns[pgn_id]
+        layouts = []
+        for spn_id in pgn_def['spns']:
+            if spn_id not in self.catalog.spns:
+                raise ValueError(f"PGN {pgn_id} references unknown SPN {spn_id}")
+            layouts.append(SPNLayout(spn_id, self.catalog.spns[spn_id]))
+
+        _check_layout(pgn_id, layouts)
+        layout = PGNLayout(pgn_id, pgn_def, layouts)
+        for spn in layouts:
+            self.spns[spn.spn_id] = spn
+        self.pgns.compiled[pgn_id] = layout
+        return layout
+
+    def compile_all(self):
+        """
+        Compiles and validates every PGN now instead of on first use.
+        """
+        for pgn_id in self.pgns:
+            self.pgns[pgn_id]
+        return self
+
+    def pgn(self, pgn_id):
+        return self.pgns[pgn_id]
+
+    def spn(self, spn_id):
+        if spn_id not in self.spns and spn_id in self.catalog.spns:
+            self.pgn(self.catalog.spns[spn_id]['pgn'])
+        return self.spns.get(spn_id)
+
+def _check_layout(pgn_id, layouts):
+    """
+    Rejects SPNs that overflow the 8-byte payload or share payload bits.
+    """
+    used = 0
+    owner = {}
+    for spn in layouts:
+        if spn.length <= 0:
+            raise ValueError(f"SPN {spn.spn_id} in PGN {pgn_id} has non-positive length {spn.length}")
+        if spn.shift + spn.length > PAYLOAD_BITS:
+            raise ValueError(
+                f"SPN {spn.spn_id} in PGN {pgn_id} overflows the payload: "
+                f"bits {spn.shift}..{spn.shift + spn.length - 1} exceed {PAYLOAD_BITS}"
+            )
+
+        bits = spn.mask << spn.shift
+        if used & bits:
+            clash = [s for s, b in owner.items() if b & bits]
+            raise ValueError(f"SPN {spn.spn_id} in PGN {pgn_id} overlaps bits of SPN {clash[0]}")
+        used |= bits
+        owner[spn.spn_id] = bits
+
+def compile_codec(pgns=PGNS, spns=SPNS, catalog=None):
+    return Codec(catalog if catalog is not None else Catalog.from_dicts(pgns, spns))
+
+_CODEC = compile_codec().compile_all()
+
+def get_codec():
+    """
+    The codec compiled from the current catalog.
+    """
+    return _CODEC
+
+def reload(pgns=PGNS, spns=SPNS, catalog=None):
+    """
+    Recompiles the codec, e.g. after the PGN/SPN tables were modified or
+    to switch to an imported catalog.
+    """
+    global _CODEC
+    _CODEC = compile_codec(pgns, spns, catalog)
+    return _CODEC
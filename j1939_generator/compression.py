@@ -0,0 +1,86 @@
+"""
+Block-parallel gzip/zstd compression of exporter output.
+
+Writer blocks are regrouped into blocks of about BLOCK_BYTES and every
+block is compressed on its own, on a small thread pool (zlib and zstd
+release the GIL). Both formats allow independently compressed members or
+frames back to back, so the joined output decompresses with plain gunzip
+or zstd -d to exactly the uncompressed download.
+
+zstd needs the optional zstandard package; without it the codec is not
+offered (see CODECS).
+"""
+import gzip
+import importlib.util
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+BLOCK_BYTES = int(os.environ.get("J1939_COMPRESS_BLOCK_BYTES", 1 << 20))
+WORKERS = int(os.environ.get("J1939_COMPRESS_WORKERS", min(os.cpu_count() or 1, 4)))
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+_pool = None
+
+def _gzip(block):
+    # mtime=0 keeps seeded downloads byte-identical
+    return gzip.compress(block, GZIP_LEVEL, mtime=0)
+
+def _zstd(block):
+    import zstandard
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(block)
+
+# Codec name -> (compress one block, mimetype, file extension)
+CODECS = {'gzip': (_gzip, 'application/gzip', '.gz')}
+if importlib.util.find_spec("zstandard") is not None:
+    CODECS['zstd'] = (_zstd, 'application/zstd', '.zst')
+
+def _executor():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="j1939-compress")
+    return _pool
+
+def ordered_map(fn, items, workers=WORKERS):
+    """
+    Yields fn(item) for every item in order, with up to workers calls
+    running at once on the shared pool.
+    """
+    if workers <= 1:
+        for item in items:
+            yield fn(item)
+        return
+
+    pool = _executor()
+    pending = []
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) > workers:
+            yield pending.pop(0).result()
+    for future in pending:
+        yield future.result()
+
+def rechunk(blocks, block_bytes=BLOCK_BYTES):
+    """
+    Joins consecutive writer blocks into blocks of at least block_bytes
+    (the last one may be smaller).
+    """
+    pending, size = [], 0
+    for block in blocks:
+        if not block:
+            continue
+        pending.append(block)
+        size += len(block)
+        if size >= block_bytes:
+            yield b"".join(pending)
+            pending, size = [], 0
+    if pending:
+        yield b"".join(pending)
+
+def compress(blocks, codec, workers=WORKERS):
+    """
+    Compressed byte stream of the writer blocks.
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unknown compression '{codec}', expected one of {', '.join(CODECS)}")
+    return ordered_map(CODECS[codec][0], rechunk(blocks), workers)
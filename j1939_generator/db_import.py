@@ -0,0 +1,355 @@
+"""
+Bulk import of J1939 databases into a Catalog.
+
+Sources:
+    .dbc         Vector DBC. Little-endian (Intel) signals of extended-ID
+                 messages. SPN numbers come from the "SPN" signal attribute,
+                 and signals without one get IDs from SYNTHETIC_SPN_BASE (or
+                 above the largest SPN attribute) up. A signal whose SPN is
+                 already taken by an earlier signal is skipped.
+                 Cycle times come from GenMsgCycleTime.
+    .csv/.xlsx   Digital Annex style exports, one row per SPN. Both the DA's
+                 own wording ("4-5", "16 bits", "0.125 rpm/bit",
+                 "0 to 8,031.875 rpm") and the plain j1939_db fields
+                 (start_byte, start_bit, len, res, ...) are understood.
+
+Every PGN is validated with the codec, and SPNs that overflow the payload
+or overlap others are dropped and reported. The result is cached as a
+.npz next to the source and reused while it is newer than the source.
+
+Usage: python db_import.py SOURCE [-o CACHE]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from catalog import Catalog
+from codec import SPNLayout, _check_layout, build_can_id, reload
+from frames import pgn_of
+
+# Signals without an SPN attribute get IDs from here up
+SYNTHETIC_SPN_BASE = 1 << 24
+
+DEFAULT_CYCLE_TIME_MS = 1000
+DEFAULT_PRIORITY = 6
+
+class ImportReport:
+    def __init__(self):
+        self.pgns = 0
+        self.spns = 0
+        self.skipped = []
+
+    def skip(self, what, reason):
+        self.skipped.append(f"{what}: {reason}")
+
+# --- DBC ---
+
+_BO = re.compile(r'^BO_\s+(\d+)\s+(\w+)\s*:\s*(\d+)')
+_SG = re.compile(
+    r'^SG_\s+(\w+)\s*(?:\w+\s*)?:\s*(\d+)\|(\d+)@([01])([+-])\s*'
+    r'\(\s*([^,]+?)\s*,\s*([^)]+?)\s*\)\s*\[\s*([^|]*?)\s*\|\s*([^\]]*?)\s*\]\s*"([^"]*)"'
+)
+_BA_SG = re.compile(r'^BA_\s+"SPN"\s+SG_\s+(\d+)\s+(\w+)\s+(\d+)\s*;')
+_BA_BO = re.compile(r'^BA_\s+"GenMsgCycleTime"\s+BO_\s+(\d+)\s+(\d+)\s*;')
+
+def import_dbc(path, report):
+    """
+    DBC file -> (PGNS, SPNS) dicts in the j1939_db layout.
+    """
+    messages, spn_attr, cycle_attr = [], {}, {}
+    current = None
+    with open(path, encoding="latin-1") as f:
+        for line in f:
+            line = line.strip()
+            m = _BO.match(line)
+            if m:
+                current = {"id": int(m.group(1)), "name": m.group(2), "signals": []}
+                messages.append(current)
+                continue
+            m = _SG.match(line)
+            if m and current is not None:
+                current["signals"].append(m.groups())
+                continue
+            m = _BA_SG.match(line)
+            if m:
+                spn_attr[(int(m.group(1)), m.group(2))] = int(m.group(3))
+                continue
+            m = _BA_BO.match(line)
+            if m:
+                cycle_attr[int(m.group(1))] = int(m.group(2))
+
+    pgns, spns = {}, {}
+    synthetic = max([SYNTHETIC_SPN_BASE] + [spn_id + 1 for spn_id in spn_attr.values()])
+    for msg in messages:
+        # Bit 31 marks extended IDs in DBC files
+        if not msg["id"] & 0x80000000:
+            report.skip(msg["name"], "standard (11-bit) ID")
+            continue
+        can_id = msg["id"] & 0x1FFFFFFF
+        pgn_id = int(pgn_of(can_id))
+        if pgn_id in pgns:
+            report.skip(msg["name"], f"PGN {pgn_id} already imported from another source address")
+            continue
+
+        spn_ids = []
+        for name, start, length, byte_order, _sign, factor, offset, lo, hi, unit in msg["signals"]:
+            if byte_order == "0":
+                report.skip(f"{msg['name']}.{name}", "big-endian (Motorola) signal")
+                continue
+            spn_id = spn_attr.get((msg["id"], name))
+            if spn_id is None:
+                spn_id, synthetic = synthetic, synthetic + 1
+            if spn_id in spns:
+                report.skip(f"{msg['name']}.{name}", f"SPN {spn_id} already defined by {spns[spn_id]['name']}")
+                continue
+            start, length = int(start), int(length)
+            spns[spn_id] = {
+                "name": name, "start_byte": start // 8, "start_bit": start % 8, "len": length,
+                "res": float(factor), "offset": float(offset),
+                "min": _float(lo, float(offset)), "max": _float(hi, float(offset) + float(factor) * ((1 << length) - 1)),
+                "unit": unit,
+            }
+            spn_ids.append(spn_id)
+
+        pgns[pgn_id] = {
+            "name": msg["name"], "hex": f"0x{can_id:08X}",
+            "cycle_time_ms": cycle_attr.get(msg["id"], DEFAULT_CYCLE_TIME_MS) or DEFAULT_CYCLE_TIME_MS,
+            "spns": spn_ids,
+        }
+    return pgns, spns
+
+# --- DIGITAL ANNEX TABLES ---
+
+# Normalized header -> field, for DA exports and the plain j1939_db names
+COLUMN_ALIASES = {
+    "pgn": "pgn",
+    "parametergrouplabel": "pgn_name", "pgnname": "pgn_name", "pglabel": "pgn_name", "pgname": "pgn_name",
+    "transmissionrate": "rate", "cycletimems": "rate", "cycletime": "rate", "rate": "rate",
+    "defaultpriority": "priority", "priority": "priority",
+    "hex": "hex", "canid": "hex",
+    "spn": "spn",
+    "spnname": "spn_name", "parametername": "spn_name", "spnlabel": "spn_name", "name": "spn_name",
+    "spnpositioninpg": "position", "positioninpg": "position", "position": "position", "spnposition": "position",
+    "startbyte": "start_byte", "startbit": "start_bit",
+    "spnlength": "length", "length": "length", "len": "length", "bitlength": "length",
+    "resolution": "res", "res": "res", "scaling": "res",
+    "offset": "offset",
+    "datarange": "range", "range": "range", "operationalrange": "range",
+    "min": "min", "max": "max",
+    "units": "unit", "unit": "unit",
+}
+
+_NUMBER = re.compile(r'[-+]?\d[\d,]*(?:\.\d+)?(?:[eE][-+]?\d+)?(?:\s*/\s*\d+(?:\.\d+)?)?')
+
+def _number(text, default=None):
+    """
+    First number in a DA cell: "0.125 rpm/bit" -> 0.125, "1/8 %/bit" -> 0.125,
+    "-125 %" -> -125, "8,031.875" -> 8031.875.
+    """
+    if text is None or (isinstance(text, float) and text != text):
+        return default
+    if isinstance(text, (int, float)):
+        return float(text)
+    m = _NUMBER.search(str(text))
+    if not m:
+        return default
+    value = m.group(0).replace(",", "").replace(" ", "")
+    if "/" in value:
+        num, den = value.split("/")
+        return float(num) / float(den)
+    return float(value)
+
+def _float(text, default):
+    value = _number(text)
+    return default if value is None else value
+
+def _length_bits(text):
+    value = _number(text)
+    if value is None:
+        return None
+    return int(value * 8) if "byte" in str(text).lower() else int(value)
+
+def _position(text):
+    """
+    DA position (1-indexed) -> (start_byte, start_bit): "4-5" -> (3, 0),
+    "1.5" -> (0, 4), "2" -> (1, 0).
+    """
+    m = re.match(r'\s*(\d+)(?:\.(\d+))?', str(text))
+    if not m:
+        return None
+    return int(m.group(1)) - 1, int(m.group(2) or 1) - 1
+
+def _cycle_time_ms(text):
+    value = _number(text)
+    if value is None or value <= 0:
+        return DEFAULT_CYCLE_TIME_MS
+    unit = str(text).lower()
+    return int(value * 1000) if re.search(r'\d\s*s(ec)?\b', unit) and "ms" not in unit else int(value)
+
+def _read_table(path):
+    import pandas as pd
+    if path.lower().endswith((".xlsx", ".xls")):
+        try:
+            return pd.read_excel(path, dtype=object)
+        except ImportError as e:
+            raise ValueError(f"Reading {path} needs openpyxl (pip install openpyxl): {e}") from None
+    return pd.read_csv(path, dtype=object, encoding_errors="replace")
+
+def import_table(path, report):
+    """
+    CSV/XLSX Digital Annex export -> (PGNS, SPNS) dicts.
+    """
+    df = _read_table(path)
+    columns = {}
+    for col in df.columns:
+        key = COLUMN_ALIASES.get(re.sub(r'[^a-z0-9]', '', str(col).lower()))
+        if key and key not in columns:
+            columns[key] = col
+    missing = [k for k in ("pgn", "spn") if k not in columns]
+    if missing:
+        raise ValueError(f"{path}: no column for {', '.join(missing)} (have {list(df.columns)})")
+
+    def cell(row, key):
+        col = columns.get(key)
+        return None if col is None else row[col]
+
+    pgns, spns = {}, {}
+    for row in df.to_dict('records'):
+        pgn_id, spn_id = _number(cell(row, "pgn")), _number(cell(row, "spn"))
+        if pgn_id is None or spn_id is None:
+            continue
+        pgn_id, spn_id = int(pgn_id), int(spn_id)
+        name = str(cell(row, "spn_name") or f"SPN {spn_id}")
+
+        if "start_byte" in columns:
+            start = (int(_number(cell(row, "start_byte"), 0)), int(_number(cell(row, "start_bit"), 0)))
+        else:
+            start = _position(cell(row, "position")) if cell(row, "position") is not None else None
+        length = _length_bits(cell(row, "length"))
+        if start is None or not length:
+            report.skip(f"SPN {spn_id}", "no fixed position or length")
+            continue
+
+        res = cell(row, "res")
+        # Status fields ("4 states/2 bit") are plain enumerations
+        res = 1.0 if "state" in str(res).lower() else _float(res, 1.0)
+        offset = _float(cell(row, "offset"), 0.0)
+        lo, hi = offset, offset + res * ((1 << length) - 1)
+        bounds = _NUMBER.findall(str(cell(row, "range") or ""))
+        if len(bounds) >= 2:
+            lo, hi = _number(bounds[0]), _number(bounds[1])
+        lo, hi = _float(cell(row, "min"), lo), _float(cell(row, "max"), hi)
+
+        if pgn_id not in pgns:
+            hex_id = cell(row, "hex")
+            priority = int(_float(cell(row, "priority"), DEFAULT_PRIORITY))
+            can_id = int(str(hex_id), 16) if hex_id else build_can_id(priority, pgn_id, 0)
+            pgns[pgn_id] = {
+                "name": str(cell(row, "pgn_name") or f"PGN {pgn_id}"), "hex": f"0x{can_id:08X}",
+                "cycle_time_ms": _cycle_time_ms(cell(row, "rate")), "spns": [],
+            }
+        if spn_id in spns:
+            report.skip(f"SPN {spn_id}", "duplicate row")
+            continue
+        spns[spn_id] = {
+            "name": name, "start_byte": start[0], "start_bit": start[1], "len": length,
+            "res": res, "offset": offset, "min": lo, "max": hi, "unit": str(cell(row, "unit") or ""),
+        }
+        pgns[pgn_id]["spns"].append(spn_id)
+    return pgns, spns
+
+# --- VALIDATION AND CACHING ---
+
+def _validate(pgns, spns, report):
+    """
+    Drops SPNs the codec would reject, keeping the rest of each PGN.
+    """
+    for pgn_id, pgn_def in pgns.items():
+        kept = []
+        for spn_id in pgn_def['spns']:
+            try:
+                _check_layout(pgn_id, kept + [SPNLayout(spn_id, spns[spn_id])])
+            except (ValueError, KeyError) as e:
+                report.skip(f"SPN {spn_id} in PGN {pgn_id}", str(e))
+                continue
+            kept.append(SPNLayout(spn_id, spns[spn_id]))
+        pgn_def['spns'] = [s.spn_id for s in kept]
+    report.pgns = len(pgns)
+    report.spns = sum(len(p['spns']) for p in pgns.values())
+
+def import_database(path, report=None):
+    """
+    Parses a DBC/CSV/XLSX database into a Catalog.
+    """
+    report = report if report is not None else ImportReport()
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".dbc":
+        pgns, spns = import_dbc(path, report)
+    elif ext in (".csv", ".xlsx", ".xls"):
+        pgns, spns = import_table(path, report)
+    else:
+        raise ValueError(f"Unsupported database '{path}' (use .dbc, .csv or .xlsx)")
+    _validate(pgns, spns, report)
+    return Catalog.from_dicts(pgns, spns, source=os.path.abspath(path))
+
+def load_catalog(source, cache_path=None):
+    """
+    Catalog for source: a saved .npz, or a database imported once and then
+    served from its cache while the cache is newer than the source.
+    """
+    if source.endswith(".npz"):
+        return Catalog.load(source)
+
+    cache_path = cache_path or f"{source}.catalog.npz"
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(source):
+        try:
+            return Catalog.load(cache_path)
+        except (OSError, ValueError, KeyError):
+            pass
+
+    catalog = import_database(source)
+    try:
+        catalog.save(cache_path)
+    except OSError:
+        # Read-only next to the source; the import still works, just uncached
+        pass
+    return catalog
+
+def configure_from_env():
+    """
+    Switches the codec to the catalog named by J1939_CATALOG, if set.
+    """
+    source = os.environ.get("J1939_CATALOG")
+    if not source:
+        return None
+    catalog = load_catalog(source, os.environ.get("J1939_CATALOG_CACHE"))
+    reload(catalog=catalog)
+    return catalog
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('source', help=".dbc, .csv or .xlsx database")
+    parser.add_argument('-o', '--output', help="catalog cache (default: SOURCE.catalog.npz)")
+    args = parser.parse_args()
+
+    report = ImportReport()
+    start = time.perf_counter()
+    catalog = import_database(args.source, report)
+    output = args.output or f"{args.source}.catalog.npz"
+    catalog.save(output)
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    Catalog.load(output)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    print(f"{report.pgns} PGNs, {report.spns} SPNs imported in {elapsed:.2f} s -> {output} "
+          f"(loads in {load_ms:.1f} ms)")
+    for line in report.skipped[:20]:
+        print(f"  skipped {line}", file=sys.stderr)
+    if len(report.skipped) > 20:
+        print(f"  ... {len(report.skipped) - 20} more skipped", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,382 @@
+"""
+Trace decoder: TRC, TXT and candump files back into frames and physical values.
+
+The file is memory-mapped and parsed in line-aligned chunks. Each chunk is
+tokenized with NumPy. Whitespace runs split it into tokens, and every token
+knows its line. Fields are then pulled out as columns: hex IDs and
+payload bytes through a nibble lookup table, timestamps through one
+vectorized float conversion. No Python code runs per line.
+
+Payloads are unpacked into SPN values with J1939Engine.unpack_batch, the
+inverse of pack_batch. The result is a FrameStore per chunk with one
+SignalTable per known PGN, so decoded traces work wherever generated ones
+do (to_dataframe, the exporters, ...).
+
+Supported formats:
+    trc      PCAN-View v1.1 ("1) 12.3 Rx 0CF00400 8 37 AF ..."), as written by exporters
+    txt      "0x0CF00400h" line followed by the payload line; the format has
+             no timestamps, so every frame decodes with time 0
+    candump  candump -l log lines "(1600000000.123456) can0 0CF00400#37AF..."
+             or screen lines "(...) can0 0CF00400 [8] 37 AF ...";
+             times are relative to the first frame of the file
+"""
+import mmap
+import os
+import numpy as np
+from engine import J1939Engine
+from frames import FrameStore, SignalTable
+
+FORMATS = ("trc", "txt", "candump")
+
+# Bytes per parse chunk; chunks end on a line boundary
+CHUNK_BYTES = 16 * 2**20
+
+# Widest timestamp token we convert, e.g. "(1600000000.123456)"
+TIME_WIDTH = 24
+
+# ASCII -> nibble value, 255 for non-hex characters
+HEX_VALUE = np.full(256, 255, dtype=np.uint8)
+for _i, _c in enumerate(b"0123456789ABCDEF"):
+    HEX_VALUE[_c] = _i
+    HEX_VALUE[ord(chr(_c).lower())] = _i
+
+class TraceFormatError(ValueError):
+    pass
+
+# --- TOKENS ---
+
+class Tokens:
+    """
+    Whitespace-separated tokens of a byte buffer, grouped by line.
+    """
+    def __init__(self, buf):
+        self.buf = buf
+        space = buf <= 32
+        edges = np.diff(np.concatenate(([True], space, [True])).view(np.int8))
+        self.starts = np.flatnonzero(edges == -1)
+        self.ends = np.flatnonzero(edges == 1)
+
+        # The first token after each newline opens a line (blank lines
+        # give duplicates, dropped by the diff on the sorted positions)
+        first = np.searchsorted(self.starts, np.flatnonzero(buf == ord("\n")))
+        first = np.concatenate(([0], first[first < len(self.starts)]))
+        first = first[np.concatenate(([True], np.diff(first) > 0))] if len(self.starts) else first[:0]
+        self.first = first
+        self.count = np.diff(np.concatenate((first, [len(self.starts)])))
+
+    def field(self, lines, k):
+        """
+        (starts, ends) of token k of the given lines (indices into first).
+        """
+        token = self.first[lines] + k
+        return self.starts[token], self.ends[token]
+
+    def first_char(self, lines):
+        return self.buf[self.starts[self.first[lines]]]
+
+def parse_hex(buf, starts, ends, width):
+    """
+    Hex text buf[starts:ends] (at most width digits) -> uint64 values.
+    """
+    if np.any(ends - starts > width) or np.any(ends <= starts):
+        raise TraceFormatError("hex field of unexpected width")
+    idx = ends[:, None] - width + np.arange(width)
+    nibbles = HEX_VALUE[buf[np.maximum(idx, 0)]]
+    nibbles[idx < starts[:, None]] = 0
+    if np.any(nibbles == 255):
+        raise TraceFormatError("invalid hex digit")
+    if width == 1:
+        return nibbles[:, 0].astype(np.uint64)
+    # Digit pairs -> bytes, read back as one big-endian integer
+    packed = np.ascontiguousarray((nibbles[:, 0::2] << 4) | nibbles[:, 1::2])
+    return packed.view(f">u{width // 2}").ravel().astype(np.uint64)
+
+def parse_byte_run(buf, pos, count, step):
+    """
+    (N, count) bytes written as two hex digits every step characters from
+    pos, e.g. "37 AF FA" (step 3) or "37AFFA" (step 2); None when any row
+    does not follow that layout.
+    """
+    idx = pos[:, None] + step * np.arange(count)
+    if len(idx) and idx[:, -1].max() + 1 >= len(buf):
+        return None
+    hi = HEX_VALUE[buf[idx]]
+    lo = HEX_VALUE[buf[idx + 1]]
+    if np.any(hi == 255) or np.any(lo == 255):
+        return None
+    if step > 2 and np.any(buf[idx[:, :-1] + 2] > 32):
+        return None
+    return (hi << 4) | lo
+
+def parse_float(buf, starts, ends):
+    """
+    Decimal text buf[starts:ends] -> float64 values.
+    """
+    lengths = ends - starts
+    if np.any(lengths > TIME_WIDTH):
+        raise TraceFormatError("number too long")
+    width = int(lengths.max()) if len(lengths) else 1
+    idx = ends[:, None] - width + np.arange(width)
+    chars = np.where(idx >= starts[:, None], buf[np.maximum(idx, 0)], ord("0")).astype(np.uint8)
+
+    # Plain "123.456" with up to 18 digits: exact integer mantissa over a
+    # power of ten, correctly rounded like a string parse
+    digits = chars - np.uint8(ord("0"))
+    dot = chars == ord(".")
+    if np.all((digits <= 9) | dot) and np.all(dot.sum(axis=1) <= 1) and np.all(lengths - dot.any(axis=1) <= 18):
+        mantissa = np.zeros(len(chars), dtype=np.int64)
+        for col in range(width):
+            mantissa = np.where(dot[:, col], mantissa, mantissa * 10 + digits[:, col])
+        after = np.where(dot.any(axis=1), width - 1 - dot.argmax(axis=1), 0)
+        return mantissa / 10.0 ** after
+
+    # Anything else (signs, exponents) goes through numpy's string parser
+    idx = starts[:, None] + np.arange(TIME_WIDTH)
+    text = np.where(idx < ends[:, None], buf[np.minimum(idx, len(buf) - 1)], 0).astype(np.uint8)
+    try:
+        return text.view(f"S{TIME_WIDTH}").ravel().astype(np.float64)
+    except ValueError as e:
+        raise TraceFormatError(f"invalid number: {e}") from None
+
+def _payloads(buf, tokens, lines, first_byte, dlc):
+    """
+    (N, 8) payload matrix from dlc two-digit hex tokens per line.
+    """
+    if len(lines) and np.all(dlc == 8) and np.all(tokens.count[lines] == first_byte + 8):
+        # Usual layout, "XX XX .. XX" from the first data token
+        data = parse_byte_run(buf, tokens.field(lines, first_byte)[0], 8, 3)
+        if data is not None:
+            return data
+
+    data = np.zeros((len(lines), 8), dtype=np.uint8)
+    for j in range(8):
+        rows = np.flatnonzero(dlc > j)
+        if len(rows):
+            data[rows, j] = parse_hex(buf, *tokens.field(lines[rows], first_byte + j), 2)
+    return data
+
+# --- FORMATS ---
+
+def _parse_trc(buf):
+    tokens = Tokens(buf)
+    lines = np.flatnonzero(tokens.first_char(np.arange(len(tokens.first))) != ord(";"))
+    if np.any(tokens.count[lines] < 5):
+        raise TraceFormatError("TRC line with fewer than 5 fields")
+
+    time_ms = parse_float(buf, *tokens.field(lines, 1))
+    can_id = parse_hex(buf, *tokens.field(lines, 3), 8)
+    dlc = parse_hex(buf, *tokens.field(lines, 4), 1).astype(np.uint8)
+    if np.any(dlc > 8) or np.any(tokens.count[lines] < 5 + dlc):
+        raise TraceFormatError("TRC line with missing data bytes")
+    return time_ms, can_id, dlc, _payloads(buf, tokens, lines, 5, dlc)
+
+def _is_txt_header(buf, pos):
+    """
+    Whether the text at each position starts with "0x" (a TXT ID line).
+    """
+    n = len(buf)
+    return (pos + 1 < n) & (buf[np.minimum(pos, n - 1)] == ord("0")) & (buf[np.minimum(pos + 1, n - 1)] == ord("x"))
+
+def _parse_txt(buf):
+    tokens = Tokens(buf)
+    all_lines = np.arange(len(tokens.first))
+    starts, ends = tokens.field(all_lines, 0)
+    header = _is_txt_header(buf, starts)
+    ids = np.flatnonzero(header)
+    if np.any(ids + 1 >= len(all_lines)) or np.any(header[np.minimum(ids + 1, len(header) - 1)]):
+        raise TraceFormatError("TXT ID line without a payload line")
+
+    id_starts, id_ends = starts[ids] + 2, ends[ids]
+    id_ends = id_ends - (buf[id_ends - 1] == ord("h"))
+    can_id = parse_hex(buf, id_starts, id_ends, 8)
+    payload_lines = ids + 1
+    dlc = np.minimum(tokens.count[payload_lines], 8).astype(np.uint8)
+    return np.zeros(len(ids)), can_id, dlc, _payloads(buf, tokens, payload_lines, 0, dlc)
+
+def _parse_candump(buf):
+    tokens = Tokens(buf)
+    lines = np.arange(len(tokens.first))
+    # Optional "(seconds)" timestamp first, then the interface name
+    timed = tokens.first_char(lines) == ord("(")
+    if len(lines) and not (np.all(timed) or not np.any(timed)):
+        raise TraceFormatError("candump lines with and without timestamps")
+    timed = bool(len(lines)) and bool(timed[0])
+    k = 2 if timed else 1
+
+    if timed:
+        starts, ends = tokens.field(lines, 0)
+        time_ms = parse_float(buf, starts + 1, ends - 1) * 1000
+    else:
+        time_ms = np.zeros(len(lines))
+
+    starts, ends = tokens.field(lines, k)
+    hashes = np.flatnonzero(buf == ord("#"))
+    if len(hashes):
+        # Log format: ID#DATA in one token
+        idx = np.searchsorted(hashes, starts)
+        if np.any(idx >= len(hashes)) or np.any(hashes[np.minimum(idx, len(hashes) - 1)] >= ends):
+            raise TraceFormatError("candump log line without '#'")
+        split = hashes[idx]
+        can_id = parse_hex(buf, starts, split, 8)
+        dlc = ((ends - split - 1) // 2).astype(np.uint8)
+        if np.any(dlc > 8):
+            raise TraceFormatError("candump frame longer than 8 bytes")
+        data = np.zeros((len(lines), 8), dtype=np.uint8)
+        for size in np.unique(dlc).tolist():
+            rows = np.flatnonzero(dlc == size)
+            run = parse_byte_run(buf, split[rows] + 1, size, 2) if size else np.zeros((len(rows), 0), np.uint8)
+            if run is None:
+                raise TraceFormatError("invalid candump payload")
+            data[rows, :size] = run
+    else:
+        # Screen format: ID [DLC] bytes...
+        can_id = parse_hex(buf, starts, ends, 8)
+        dlc_starts, dlc_ends = tokens.field(lines, k + 1)
+        dlc = parse_hex(buf, dlc_starts + 1, dlc_ends - 1, 1).astype(np.uint8)
+        data = _payloads(buf, tokens, lines, k + 2, dlc)
+    return time_ms, can_id, dlc, data
+
+PARSERS = {"trc": _parse_trc, "txt": _parse_txt, "candump": _parse_candump}
+
+def detect_format(path):
+    """
+    Trace format from the extension, else from the first non-comment line.
+    """
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    if ext in ("trc", "txt"):
+        return ext
+    if ext in ("log", "candump"):
+        return "candump"
+    with open(path, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith(b";"):
+                if line.startswith(b";$FILEVERSION"):
+                    return "trc"
+                continue
+            if line.startswith(b"0x"):
+                return "txt"
+            if line.startswith(b"(") or b"#" in line or b"[" in line:
+                return "candump"
+            return "trc"
+    return "trc"
+
+# --- DECODING ---
+
+class TraceDecoder:
+    def __init__(self, engine=None, chunk_bytes=CHUNK_BYTES):
+        self.engine = engine or J1939Engine()
+        self.chunk_bytes = chunk_bytes
+
+    def decode_buffer(self, buf, file_format, signals=True):
+        """
+        One chunk of trace text (uint8 array of whole lines) -> FrameStore.
+        """
+        time_ms, can_id, dlc, data = PARSERS[file_format](buf)
+        store = FrameStore.allocate(len(can_id))
+        frames = store.frames
+        frames['time_us'] = np.round(time_ms * 1000)
+        frames['can_id'] = can_id
+        frames['dlc'] = dlc
+        frames['data'] = data
+        if signals:
+            self._add_signals(store)
+        return store
+
+    def _add_signals(self, store):
+        codec = self.engine.codec
+        pgns = store.pgn
+        for pgn_id in np.unique(pgns).tolist():
+            if pgn_id not in codec.pgns:
+                continue
+            layout = codec.pgn(pgn_id)
+            rows = np.flatnonzero(pgns == pgn_id)
+            store.signals[pgn_id] = SignalTable(
+                pgn_id, layout.spn_ids, layout.names, [s.unit for s in layout.spns],
+                rows, self.engine.unpack_batch(pgn_id, store.data[rows])
+            )
+
+    def iter_decode(self, path, file_format=None, signals=True):
+        """
+        Yields one FrameStore per chunk of the memory-mapped file.
+        """
+        file_format = file_format or detect_format(path)
+        if file_format not in PARSERS:
+            raise ValueError(f"Unknown trace format '{file_format}' (use one of {', '.join(FORMATS)})")
+        if os.path.getsize(path) == 0:
+            return
+
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            buf = np.frombuffer(mm, dtype=np.uint8)
+            t0 = None
+            try:
+                for start, stop in self._chunks(buf, file_format):
+                    store = self.decode_buffer(buf[start:stop], file_format, signals)
+                    if file_format == "candump" and len(store):
+                        # candump stamps are epoch seconds; rebase on the first frame
+                        t0 = store.frames['time_us'][0] if t0 is None else t0
+                        store.frames['time_us'] -= t0
+                    yield store
+            finally:
+                del buf
+
+    def decode(self, path, file_format=None, signals=True):
+        """
+        Whole trace as one FrameStore.
+        """
+        return concat_stores(list(self.iter_decode(path, file_format, signals)))
+
+    def _chunks(self, buf, file_format):
+        """
+        (start, stop) chunk bounds at line ends; TXT chunks also end before
+        an ID line so no frame is split across chunks.
+        """
+        n = len(buf)
+        start = 0
+        while start < n:
+            stop = min(start + self.chunk_bytes, n)
+            if stop < n:
+                window = buf[start:stop]
+                marks = np.flatnonzero(window == ord("\n"))
+                if file_format == "txt":
+                    marks = marks[_is_txt_header(buf, start + marks + 1)]
+                if not len(marks):
+                    stop = self._next_txt_header(buf, stop) if file_format == "txt" else n
+                else:
+                    stop = start + int(marks[-1]) + 1
+            yield start, stop
+            start = stop
+
+    @staticmethod
+    def _next_txt_header(buf, pos):
+        marks = pos + np.flatnonzero(buf[pos:] == ord("\n")) + 1
+        marks = marks[_is_txt_header(buf, marks)]
+        return int(marks[0]) if len(marks) else len(buf)
+
+def concat_stores(stores):
+    """
+    Consecutive FrameStores as one, signal tables joined per PGN.
+    """
+    if len(stores) == 1:
+        return stores[0]
+    store = FrameStore.allocate(sum(len(s) for s in stores))
+    if stores:
+        store.frames[:] = np.concatenate([s.frames for s in stores])
+
+    tables = {}
+    base = 0
+    for s in stores:
+        for pgn_id, table in s.signals.items():
+            tables.setdefault(pgn_id, []).append((table, base))
+        base += len(s)
+    for pgn_id, parts in tables.items():
+        first = parts[0][0]
+        store.signals[pgn_id] = SignalTable(
+            pgn_id, first.spn_ids, first.names, first.units,
+            np.concatenate([t.frame_index + b for t, b in parts]),
+            np.concatenate([t.values for t, _ in parts], axis=1),
+        )
+    return store
+
+def decode_trace(path, file_format=None, signals=True):
+    return TraceDecoder().decode(path, file_format, signals)
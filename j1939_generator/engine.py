@@ -1,125 +1,347 @@
 import numpy as np
-import pandas as pd
-import struct
-from j1939_db import PGNS, SPNS
+import metrics
+from codec import get_codec
+from frames import BASE_COLUMNS, FrameStore, PGNBlock
+from noise import SampleNoise, new_seed
+from parallel import generate_sliced
+from scenario import CHANNEL_NOISE, cache as scenario_cache
+from timeline import block_order, merge_index
+
+# Time axes of the signal patterns: samples spread evenly over [0, duration]
+# (the original behaviour), or on the sample clock i * cycle time, which
+# doesn't move when the duration changes (needed to resume a run)
+RUN_AXIS, CLOCK_AXIS = "run", "clock"
 
 class J1939Engine:
-    def __init__(self):
-        pass
+    def __init__(self, codec=None, scenario=None, faults=None, time_axis=RUN_AXIS):
+        # None follows codec.reload(); pass a Codec to pin a specific layout
+        self._codec = codec
+        # A scenario.Scenario drives the SPNs it models instead of their patterns
+        self.scenario = scenario
+        # A faults.FaultPlan is applied to every block between generation and packing
+        self.faults = faults
+        if time_axis not in (RUN_AXIS, CLOCK_AXIS):
+            raise ValueError(f"Unknown time axis '{time_axis}', expected '{RUN_AXIS}' or '{CLOCK_AXIS}'")
+        self.time_axis = time_axis
+
+    @property
+    def codec(self):
+        return self._codec or get_codec()
+
+    def sample_count(self, duration_sec, sample_rate_ms):
+        """
+        Number of frames a PGN at sample_rate_ms emits over duration_sec.
+        """
+        num_samples = int((duration_sec * 1000) / sample_rate_ms)
+        # Handle case where duration is too short for rate
+        if num_samples == 0: num_samples = 1
+        return num_samples
 
-    def get_smart_pattern(self, spn_id, duration_sec, sample_rate_ms):
+    def sample_times(self, duration_sec, num_samples, start=0, stop=None):
+        """
+        Slice [start:stop] of np.linspace(0, duration_sec, num_samples),
+        computed without materialising the full time axis.
+        """
+        if stop is None:
+            stop = num_samples
+        if num_samples == 1:
+            return np.zeros(stop - start)
+
+        step = duration_sec / (num_samples - 1)
+        t = np.arange(start, stop) * step
+        if stop == num_samples and stop > start:
+            t[-1] = duration_sec
+        return t
+
+    @metrics.staged("pattern")
+    def get_smart_pattern(self, spn_id, duration_sec, sample_rate_ms, start=0, stop=None, seed=None):
         """
         Automatically selects the best pattern based on the SPN ID/Name.
         Returns a numpy array of values.
+
+        start/stop select a sample range of the full-duration pattern so
+        long runs can be generated window by window. The same seed always
+        gives the same values; None draws a fresh one.
         """
-        spn = SPNS.get(spn_id)
+        spn = self.codec.spn(spn_id)
         if not spn:
             return np.zeros(1)
-            
-        num_samples = int((duration_sec * 1000) / sample_rate_ms)
-        # Handle case where duration is too short for rate
-        if num_samples == 0: num_samples = 1
-            
-        t = np.linspace(0, duration_sec, num_samples)
-        
-        name = spn['name'].lower()
-        
-        # --- SMART LOGIC ---
-        
-        if "speed" in name and "engine" in name: 
-            pattern = 600 + 1000 * np.sin(0.1 * t) + 200 * np.random.normal(0, 0.1, num_samples)
-            pattern = np.clip(pattern, 600, 2500) 
-            
-        elif "vehicle speed" in name:
-            pattern = 100 * (1 - np.exp(-0.1 * t)) 
-            
-        elif "throttle" in name or "demand" in name:
-            pattern = 50 + 40 * np.sin(0.2 * t)
-            pattern = np.clip(pattern, 0, 100)
-            
-        elif "temperature" in name:
-            base_temp = 80 if "coolant" in name else 90
-            pattern = base_temp + 10 * (1 - np.exp(-0.05 * t)) + np.random.normal(0, 0.2, num_samples)
-            
-        elif "pressure" in name:
-            base_p = 300
-            pattern = base_p + 100 * np.sin(0.1 * t)
-            
-        elif "level" in name:
-            pattern = 100 - (0.5 * t) 
-            
+
+        num_samples = self.sample_count(duration_sec, sample_rate_ms)
+        if self.time_axis == CLOCK_AXIS:
+            t = np.arange(start, num_samples if stop is None else stop) * (sample_rate_ms / 1000)
+            axis = (CLOCK_AXIS, sample_rate_ms, start, len(t))
         else:
-            mid = (spn['max'] - spn['min']) / 2
-            amp = mid * 0.5
-            pattern = mid + amp * np.sin(t)
+            t = self.sample_times(duration_sec, num_samples, start, stop)
+            axis = (duration_sec, num_samples, start, len(t))
+        if seed is None:
+            seed = new_seed()
 
-        return np.clip(pattern, spn['min'], spn['max'])
+        noise = SampleNoise(seed, spn_id, start, start + len(t))
+        if self.scenario is not None and spn.channel is not None:
+            channels = scenario_cache.channels(self.scenario, t, axis)
+            pattern = channels[spn.channel]
+            if spn.channel in CHANNEL_NOISE:
+                pattern = pattern + noise.normal(0, CHANNEL_NOISE[spn.channel], len(t))
+        else:
+            pattern = spn.pattern(t, spn, noise)
+        return np.clip(pattern, spn.min, spn.max)
 
     def pack_message(self, pgn_id, spn_values):
         """
         Pack physical values into 8 bytes (64 bits) Little Endian
         """
         data_int = 0
-        
-        target_spns = PGNS[pgn_id]['spns']
-        
-        for spn_id in target_spns:
-            if spn_id not in spn_values:
+
+        for spn in self.codec.pgn(pgn_id).spns:
+            if spn.spn_id not in spn_values:
                 continue
-                
-            val = spn_values[spn_id]
-            spec = SPNS[spn_id]
-            
+
+            val = spn_values[spn.spn_id]
+
             # 1. Physical to Raw
-            raw = int((val - spec['offset']) / spec['res'])
-            
-            # Mask to ensure it fits length
-            mask = (1 << spec['len']) - 1
-            raw = raw & mask
-            
-            # 2. Shift to position
-            global_shift = (spec['start_byte'] * 8) + spec['start_bit']
-            
-            data_int |= (raw << global_shift)
-            
+            raw = int((val - spn.offset) / spn.res)
+
+            # Mask to ensure it fits length, 2. Shift to position
+            data_int |= (raw & spn.mask) << spn.shift
+
         return data_int.to_bytes(8, byteorder='little')
 
-    def generate_dataset(self, selected_pgns, duration_sec=10):
-        messages = []
-        
+    @metrics.staged("pack")
+    def pack_batch(self, pgn_id, spn_arrays):
+        """
+        Vectorized pack_message: takes one array of physical values per SPN
+        and returns an (N, 8) uint8 payload matrix, byte-for-byte identical
+        to calling pack_message on every sample.
+        """
+        layout = self.codec.pgn(pgn_id)
+        cols = [i for i, spn_id in enumerate(layout.spn_ids) if spn_id in spn_arrays]
+        num_samples = len(next(iter(spn_arrays.values()))) if spn_arrays else 0
+
+        if not cols:
+            return np.zeros((num_samples, 8), dtype=np.uint8)
+
+        vals = np.array([spn_arrays[layout.spn_ids[i]] for i in cols], dtype=np.float64)
+
+        # 1. Physical to Raw (astype truncates toward zero, like int())
+        raw = ((vals - layout.offset[cols, None]) / layout.res[cols, None]).astype(np.int64)
+
+        # Negative raws wrap to two's complement before masking, 2. Shift to position
+        raw = (raw.astype(np.uint64) & layout.mask[cols, None]) << layout.shift[cols, None]
+        data = np.bitwise_or.reduce(raw, axis=0)
+
+        return data.astype('<u8').view(np.uint8).reshape(num_samples, 8)
+
+    def unpack_batch(self, pgn_id, payloads):
+        """
+        Inverse of pack_batch: (N, 8) uint8 payloads -> (k, N) physical
+        values, one row per SPN of the PGN in DB order.
+        """
+        layout = self.codec.pgn(pgn_id)
+        payloads = np.ascontiguousarray(payloads, dtype=np.uint8)
+        data = payloads.view('<u8').reshape(len(payloads))
+
+        raw = (data[None, :] >> layout.shift[:, None]) & layout.mask[:, None]
+        return raw * layout.res[:, None] + layout.offset[:, None]
+
+    def dataset_columns(self, selected_pgns):
+        """
+        Column layout of generate_dataset() for this PGN selection.
+        """
+        columns = list(BASE_COLUMNS)
         for pgn_id in selected_pgns:
-            pgn_def = PGNS[pgn_id]
-            rate = pgn_def['cycle_time_ms']
-            
-            spn_data = {}
-            for spn_id in pgn_def['spns']:
-                spn_data[spn_id] = self.get_smart_pattern(spn_id, duration_sec, rate)
-                
-            num_samples = len(list(spn_data.values())[0])
-            
-            for i in range(num_samples):
-                timestamp = i * rate
-                
-                current_values = {k: v[i] for k, v in spn_data.items()}
-                
-                payload_bytes = self.pack_message(pgn_id, current_values)
-                payload_hex = " ".join([f"{b:02X}" for b in payload_bytes])
-                
-                msg = {
-                    "time_ms": timestamp,
-                    "pgn_dec": pgn_id,
-                    "pgn_hex": pgn_def['hex'],
-                    "dlc": 8,
-                    "payload_hex": payload_hex,
-                    "payload_bytes": payload_bytes
-                }
-                
-                for spn_id, val in current_values.items():
-                    msg[SPNS[spn_id]['name']] = val
-                    
-                messages.append(msg)
-                
-        df = pd.DataFrame(messages)
-        if not df.empty:
-            df = df.sort_values(by="time_ms")
-        return df
+            for name in self.codec.pgn(pgn_id).names:
+                if name not in columns:
+                    columns.append(name)
+        return columns
+
+    def _pgn_block(self, pgn_id, duration_sec, seed, start=0, stop=None, source_address=None, time_offset_ms=0):
+        """
+        Frames and signal values for samples [start:stop] of a single PGN,
+        optionally as sent by another source address and shifted in time.
+        """
+        layout = self.codec.pgn(pgn_id)
+        rate = layout.cycle_time_ms
+
+        spn_data = {}
+        for spn_id in layout.spn_ids:
+            spn_data[spn_id] = self.get_smart_pattern(spn_id, duration_sec, rate, start, stop, seed)
+
+        num_samples = len(list(spn_data.values())[0])
+        time_us = np.arange(start, start + num_samples, dtype=np.int64) * int(rate * 1000)
+        time_us += int(time_offset_ms * 1000)
+        can_id = layout.can_id if source_address is None else layout.can_id_for(source_address)
+        metrics.FRAMES.inc(num_samples)
+        if self.faults is not None:
+            with metrics.stage("faults"):
+                return self.faults.inject(self, layout, spn_data, time_us, can_id, start, duration_sec, seed)
+
+        payloads = self.pack_batch(pgn_id, spn_data)
+        return PGNBlock(layout, time_us, payloads, np.array(list(spn_data.values())), can_id)
+
+    def generate_blocks(self, selected_pgns, duration_sec=10, seed=None, source_address=None, time_offset_ms=0):
+        """
+        Unmerged per-PGN blocks of a whole run, in selection order.
+        """
+        if seed is None:
+            seed = new_seed()
+        return [
+            self._pgn_block(pgn_id, duration_sec, seed, source_address=source_address,
+                            time_offset_ms=time_offset_ms)
+            for pgn_id in selected_pgns
+        ]
+
+    @metrics.staged("merge")
+    def _merge_blocks(self, blocks, path=None, signals=True):
+        """
+        Merges per-PGN blocks into one FrameStore in timeline order with a
+        k-way merge instead of a global sort.
+        """
+        ordered = block_order(blocks)
+        order = merge_index([b.time_us for b in ordered])
+        return FrameStore.merge(ordered, order, path=path, signals=signals)
+
+    def generate_frames(self, selected_pgns, duration_sec=10, seed=None, path=None, signals=True, workers=1,
+                        transport=None, bus=None):
+        """
+        Whole run as a FrameStore, memory-mapped to path if given. With
+        workers > 1 the time axis is split into slices generated on a
+        process pool; the result is identical to a single-process run.
+        transport (a transport.TransportScheduler) adds its multi-packet
+        sessions to the timeline, as do the DM1 bursts of the engine's
+        fault plan. bus (a busmodel.BusModel) retimes the frames to when
+        they get through arbitration on a real bus.
+        """
+        if bus is not None:
+            store = self.generate_frames(selected_pgns, duration_sec, seed, signals=signals, workers=workers,
+                                         transport=transport)
+            with metrics.stage("bus"):
+                return bus.retime(store)
+
+        sources = self._extra_sources(transport)
+        if sources:
+            store = self._periodic_frames(selected_pgns, duration_sec, seed, None, signals, workers)
+            return FrameStore.interleave([store] + [s.frames(duration_sec) for s in sources], path=path)
+        return self._periodic_frames(selected_pgns, duration_sec, seed, path, signals, workers)
+
+    def _extra_sources(self, transport):
+        """
+        Frame sources merged into the periodic timeline: transport
+        sessions, then injected DM1 bursts.
+        """
+        return [s for s in (transport, self.faults) if s is not None]
+
+    def _periodic_frames(self, selected_pgns, duration_sec, seed, path, signals, workers):
+        # Slices are laid out by frame count, which drops and jitter change
+        if workers > 1 and not (self.faults is not None and self.faults.moves_frames):
+            if seed is None:
+                seed = new_seed()
+            return generate_sliced(self, selected_pgns, duration_sec, seed, workers, path=path, signals=signals)
+
+        blocks = self.generate_blocks(selected_pgns, duration_sec, seed)
+        return self._merge_blocks(blocks, path=path, signals=signals)
+
+    def generate_dataset(self, selected_pgns, duration_sec=10, seed=None, workers=1):
+        if not selected_pgns:
+            import pandas as pd
+            return pd.DataFrame()
+
+        store = self.generate_frames(selected_pgns, duration_sec, seed, workers=workers)
+        return store.to_dataframe(self.dataset_columns(selected_pgns))
+
+    def time_slices(self, selected_pgns, duration_sec, slice_ms, first_samples=None):
+        """
+        Splits the run into consecutive [t, t + slice_ms) slices. Yields
+        {pgn_id: (start, stop)} sample ranges for every non-empty slice,
+        leaving out the samples of each PGN before first_samples[pgn_id].
+        """
+        first_samples = first_samples or {}
+        counts = {
+            pgn_id: self.sample_count(duration_sec, self.codec.pgn(pgn_id).cycle_time_ms)
+            for pgn_id in selected_pgns
+        }
+        end_ms = max(
+            [counts[p] * self.codec.pgn(p).cycle_time_ms for p in selected_pgns], default=0
+        )
+        slice_ms = max(int(slice_ms), 1)
+
+        for w_start in range(0, end_ms, slice_ms):
+            w_stop = w_start + slice_ms
+            ranges = {}
+            for pgn_id in selected_pgns:
+                rate = self.codec.pgn(pgn_id).cycle_time_ms
+                # Sample indices whose timestamp i * rate falls in the slice
+                start = max(-(-w_start // rate), first_samples.get(pgn_id, 0))
+                stop = min(-(-w_stop // rate), counts[pgn_id])
+                if start < stop:
+                    ranges[pgn_id] = (start, stop)
+            if ranges:
+                yield ranges
+
+    def generate_slice(self, ranges, duration_sec, seed, signals=True):
+        """
+        FrameStore for one time slice, given its {pgn_id: (start, stop)}.
+        """
+        blocks = [
+            self._pgn_block(pgn_id, duration_sec, seed, start, stop)
+            for pgn_id, (start, stop) in ranges.items()
+        ]
+        return self._merge_blocks(blocks, signals=signals)
+
+    def iter_frames(self, selected_pgns, duration_sec=10, window_sec=10, seed=None, signals=True, transport=None,
+                    bus=None, first_samples=None):
+        """
+        Yields the run as time-ordered FrameStores covering consecutive
+        [t, t + window_sec) windows, so memory stays bounded by the window
+        size rather than the total duration. With the same seed the windows
+        concatenate to exactly generate_frames().
+
+        first_samples ({pgn_id: sample index}) skips the samples a resumed
+        run already wrote, see checkpoint.py.
+        """
+        if seed is None:
+            seed = new_seed()
+        if first_samples and (transport is not None or bus is not None or self.faults is not None):
+            raise ValueError("first_samples only applies to periodic traffic without transport, bus or faults")
+        if bus is not None:
+            windows = self.iter_frames(selected_pgns, duration_sec, window_sec, seed, signals, transport)
+            yield from metrics.timed_iter("bus", bus.windows(windows))
+            return
+
+        window_ms = window_sec * 1000
+        sources = self._extra_sources(transport)
+        # Jittered frames can cross a window edge by up to this much
+        margin_us = self.faults.jitter_margin_us(self.codec) if self.faults is not None else 0
+        done_us = 0
+        held = None
+        for ranges in self.time_slices(selected_pgns, duration_sec, window_ms, first_samples):
+            store = self.generate_slice(ranges, duration_sec, seed, signals=signals)
+            first_ms = min(start * self.codec.pgn(p).cycle_time_ms for p, (start, _) in ranges.items())
+            stop_us = int((first_ms // window_ms + 1) * window_ms * 1000)
+            if sources:
+                # Extra frames up to this window's end, including any that
+                # fell into skipped empty windows before it
+                store = FrameStore.interleave([store] + [s.frames(duration_sec, done_us, stop_us) for s in sources])
+                done_us = stop_us
+            if margin_us:
+                if held is not None:
+                    store = FrameStore.interleave([held, store])
+                cut = int(np.searchsorted(store.frames['time_us'], stop_us - margin_us))
+                held = store.take(np.arange(cut, len(store)))
+                store = store.take(np.arange(cut))
+            yield store
+
+        tail = [held] if held is not None else []
+        tail += [s.frames(duration_sec, done_us) for s in sources]
+        if tail:
+            tail = FrameStore.interleave(tail)
+            if len(tail):
+                yield tail
+
+    def iter_dataset(self, selected_pgns, duration_sec=10, window_sec=10, seed=None):
+        """
+        iter_frames() windows as generate_dataset()-style DataFrames.
+        """
+        columns = self.dataset_columns(selected_pgns)
+        for store in self.iter_frames(selected_pgns, duration_sec, window_sec, seed):
+            yield store.to_dataframe(columns)
@@ -0,0 +1,273 @@
+"""
+Column-wise exporters for the download formats.
+
+Each exporter consumes time-ordered FrameStore windows (see
+J1939Engine.iter_frames) and yields one preformatted bytes block per
+window. TRC, TXT and ASC rows are assembled as fixed-width ASCII matrices
+in numpy instead of formatting one f-string per row. The binary formats
+live in blf.py and arrow_export.py; any format can be compressed with
+compression.py.
+"""
+import io
+import numpy as np
+from arrow_export import ARROW_EXPORTERS
+from blf import iter_blf
+from compression import CODECS
+
+TRC_HEADER = (
+    b";$FILEVERSION=1.1\n"
+    b";$STARTTIME=0\n"
+    b";   Message Number  Time(ms)   Type    ID     DLC  Data Bytes\n"
+)
+
+SPACE = ord(" ")
+NEWLINE = ord("\n")
+
+# Vector ASC header; absolute timestamps from the same zero time as the TRC
+ASC_HEADER = (
+    b"date Thu Jan 01 12:00:00.000 am 1970\n"
+    b"base hex  timestamps absolute\n"
+    b"internal events logged\n"
+    b"// version 9.0.0\n"
+    b"Begin Triggerblock Thu Jan 01 12:00:00.000 am 1970\n"
+    b"   0.000000 Start of measurement\n"
+)
+ASC_FOOTER = b"End TriggerBlock\n"
+
+# "XX " for every byte value; indexing with a payload matrix gives hex text
+HEX_LUT = np.array([list(f"{b:02X} ".encode("ascii")) for b in range(256)], dtype=np.uint8)
+
+# Powers of ten used to count decimal digits without string conversion
+POW10 = 10 ** np.arange(19, dtype=np.int64)
+
+# --- COLUMN HELPERS ---
+
+def hex_matrix(payloads):
+    """
+    (N, DLC) uint8 payloads -> (N, DLC * 3) ASCII rows "XX XX .. XX\\n".
+    """
+    n, dlc = payloads.shape
+    out = HEX_LUT[payloads].reshape(n, dlc * 3)
+    out[:, -1] = NEWLINE
+    return out
+
+def digit_count(values):
+    """
+    Number of decimal digits of each non-negative integer (0 counts as 1).
+    """
+    return np.maximum(np.searchsorted(POW10, values, side='right'), 1)
+
+def digits_matrix(values, width):
+    """
+    Right-aligned decimal ASCII of non-negative integers as an (N, width)
+    uint8 matrix, i.e. f"{v:>{width}}" for each value that fits.
+    """
+    rem = np.asarray(values, dtype=np.int64).copy()
+    out = np.full((len(rem), width), SPACE, dtype=np.uint8)
+    for col in range(width - 1, -1, -1):
+        present = (rem > 0) | (col == width - 1)
+        out[:, col] = np.where(present, (rem % 10) + ord("0"), SPACE)
+        rem //= 10
+    return out
+
+def text_matrix(strings, index):
+    """
+    Rows of a small vocabulary of equal-length strings, picked by index.
+    """
+    table = np.array([list(s.encode("ascii")) for s in strings], dtype=np.uint8)
+    return table[index]
+
+def _segments(*widths):
+    """
+    Split row indices into runs where every per-row field width is constant,
+    so each run can be laid out as one fixed-width matrix.
+    """
+    n = len(widths[0])
+    if n == 0:
+        return []
+    change = np.zeros(n, dtype=bool)
+    for w in widths:
+        change[1:] |= w[1:] != w[:-1]
+    bounds = np.concatenate(([0], np.flatnonzero(change), [n]))
+    return [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:])]
+
+def _time_column(time_ms):
+    """
+    Per-row widths and a matrix builder for f"{t:>10.1f}".
+    """
+    time_ms = np.asarray(time_ms)
+    integral = np.issubdtype(time_ms.dtype, np.integer) or bool(np.all(time_ms == np.floor(time_ms)))
+
+    if integral and (len(time_ms) == 0 or time_ms.min() >= 0):
+        ticks = time_ms.astype(np.int64)
+        widths = np.maximum(digit_count(ticks), 8)
+
+        def build(sl):
+            frac = np.tile(np.frombuffer(b".0", dtype=np.uint8), (sl.stop - sl.start, 1))
+            return np.hstack([digits_matrix(ticks[sl], int(widths[sl.start])), frac])
+
+        return widths, build
+
+    # Fractional timestamps keep Python's rounding rules exactly
+    text = [f"{t:>10.1f}".encode("ascii") for t in time_ms.tolist()]
+    widths = np.array([len(t) for t in text], dtype=np.int64)
+
+    def build(sl):
+        block = b"".join(text[sl])
+        return np.frombuffer(block, dtype=np.uint8).reshape(sl.stop - sl.start, -1)
+
+    return widths, build
+
+def _seconds_column(time_us):
+    """
+    Per-row widths and a matrix builder for f"{t / 1e6:>11.6f}" of
+    non-negative integer microseconds.
+    """
+    time_us = np.asarray(time_us, dtype=np.int64)
+    seconds, micros = np.divmod(time_us, 1000000)
+    widths = np.maximum(digit_count(seconds), 4)
+
+    def build(sl):
+        # Zero-padded fraction: the digits of 10**6 + micros without the 1
+        frac = digits_matrix(micros[sl] + 1000000, 7)
+        frac[:, 0] = ord(".")
+        return np.hstack([digits_matrix(seconds[sl], int(widths[sl.start])), frac])
+
+    return widths, build
+
+def _id_column(can_ids, fmt):
+    """
+    Per-row widths and a matrix builder for a formatted CAN ID column.
+    """
+    uniques, index = np.unique(np.asarray(can_ids, dtype=np.uint32), return_inverse=True)
+    texts = [fmt(u) for u in uniques]
+    lengths = np.array([len(t) for t in texts], dtype=np.int64)
+    widths = lengths[index] if len(index) else np.zeros(0, dtype=np.int64)
+
+    def build(sl):
+        rows = index[sl]
+        width = int(widths[sl.start])
+        vocab = [t if len(t) == width else " " * width for t in texts]
+        return text_matrix(vocab, rows)
+
+    return widths, build
+
+# --- BLOCK FORMATTERS ---
+
+def format_trc_block(time_ms, can_ids, payloads, first_msg_num=1):
+    """
+    TRC 1.1 rows for a block of frames:
+    f"{msg_num:>6} {time_ms:>10.1f} Rx {can_id:08X} 8 {payload_hex}\\n"
+    """
+    n = len(payloads)
+    msg_nums = np.arange(first_msg_num, first_msg_num + n, dtype=np.int64)
+    msg_widths = np.maximum(digit_count(msg_nums), 6)
+    time_widths, build_time = _time_column(time_ms)
+    id_widths, build_id = _id_column(can_ids, lambda i: f"{i:08X}")
+    hexes = hex_matrix(payloads)
+
+    blocks = []
+    for sl in _segments(msg_widths, time_widths, id_widths):
+        rows = sl.stop - sl.start
+        blocks.append(np.hstack([
+            digits_matrix(msg_nums[sl], int(msg_widths[sl.start])),
+            np.full((rows, 1), SPACE, dtype=np.uint8),
+            build_time(sl),
+            np.tile(np.frombuffer(b" Rx ", dtype=np.uint8), (rows, 1)),
+            build_id(sl),
+            np.tile(np.frombuffer(b" 8 ", dtype=np.uint8), (rows, 1)),
+            hexes[sl],
+        ]).tobytes())
+    return b"".join(blocks)
+
+def format_txt_block(can_ids, payloads):
+    """
+    Hex dump rows for a block of frames: f"0x{can_id:08X}h\\n{payload_hex}\\n".
+    """
+    id_widths, build_id = _id_column(can_ids, lambda i: f"0x{i:08X}h\n")
+    hexes = hex_matrix(payloads)
+
+    blocks = []
+    for sl in _segments(id_widths):
+        blocks.append(np.hstack([build_id(sl), hexes[sl]]).tobytes())
+    return b"".join(blocks)
+
+def format_asc_block(time_us, can_ids, payloads):
+    """
+    Vector ASC rows for a block of frames:
+    f"{t:>11.6f} 1  {f'{can_id:X}x':<15} Rx   d 8 {payload_hex}\n"
+    """
+    time_widths, build_time = _seconds_column(time_us)
+    id_widths, build_id = _id_column(can_ids, lambda i: f"{f'{i:X}x':<15}")
+    hexes = hex_matrix(payloads)
+
+    blocks = []
+    for sl in _segments(time_widths, id_widths):
+        rows = sl.stop - sl.start
+        blocks.append(np.hstack([
+            build_time(sl),
+            np.tile(np.frombuffer(b" 1  ", dtype=np.uint8), (rows, 1)),
+            build_id(sl),
+            np.tile(np.frombuffer(b" Rx   d 8 ", dtype=np.uint8), (rows, 1)),
+            hexes[sl],
+        ]).tobytes())
+    return b"".join(blocks)
+
+# --- STREAMING WRITERS ---
+
+def iter_csv(stores, columns):
+    columns = [c for c in columns if c != 'payload_bytes']
+    yield (",".join(columns) + "\n").encode('utf-8')
+    for store in stores:
+        buffer = io.StringIO()
+        store.to_dataframe(columns).to_csv(buffer, header=False, index=False)
+        yield buffer.getvalue().encode('utf-8')
+
+def iter_trc(stores, columns=None, first_msg_num=1):
+    yield TRC_HEADER
+    msg_num = first_msg_num
+    for store in stores:
+        yield format_trc_block(store.time_ms, store.can_id, store.data, msg_num)
+        msg_num += len(store)
+
+def iter_txt(stores, columns=None):
+    for store in stores:
+        yield format_txt_block(store.can_id, store.data)
+
+def iter_asc(stores, columns=None):
+    yield ASC_HEADER
+    for store in stores:
+        yield format_asc_block(store.frames['time_us'], store.can_id, store.data)
+    yield ASC_FOOTER
+
+# Format selector: name -> (writer, mimetype, download name)
+EXPORTERS = {
+    'csv': (iter_csv, 'text/csv', 'j1939_data.csv'),
+    'trc': (iter_trc, 'text/plain', 'j1939_trace.trc'),
+    'txt': (iter_txt, 'text/plain', 'j1939_dump.txt'),
+    'asc': (iter_asc, 'text/plain', 'j1939_trace.asc'),
+    'blf': (iter_blf, 'application/octet-stream', 'j1939_trace.blf'),
+}
+# Parquet/Arrow only when pyarrow is installed
+EXPORTERS.update(ARROW_EXPORTERS)
+
+def download_info(file_format, compression=None):
+    """
+    (mimetype, download name) of a format, optionally compressed.
+    """
+    _, mimetype, fname = EXPORTERS[file_format]
+    if compression:
+        _, mimetype, extension = CODECS[compression]
+        fname += extension
+    return mimetype, fname
+
+# Labels of the UI format dropdown
+FORMAT_LABELS = {
+    'csv': 'CSV (Excel Readable)',
+    'trc': '.TRC (Vector/Peak)',
+    'txt': '.TXT (Hex Dump)',
+    'asc': '.ASC (Vector ASCII log)',
+    'blf': '.BLF (Vector binary log)',
+    'parquet': 'Parquet (frame table)',
+    'arrow': 'Arrow IPC stream (frame table)',
+}
@@ -0,0 +1,330 @@
+"""
+Fault injection for diagnostics testing.
+
+A FaultPlan is a list of declarative FaultSpecs, applied by J1939Engine
+between signal generation and packing:
+
+    stuck          an SPN freezes at its value at fault onset (or value)
+    out_of_range   an SPN sends a raw value in the reserved band above its
+                   valid range (or the raw of value, unclipped)
+    error          an SPN sends the J1939 error indicator (0xFE then 0x00
+                   bytes, e.g. 0xFE00 for 16 bits; 0b10 for 2 bits)
+    not_available  an SPN sends "not available" (all bits set)
+    jitter         a PGN's frames move by a normal offset of sigma_ms,
+                   kept under half a cycle so the PGN stays in order
+    drop           a PGN's frames are not sent
+    dm1            DM1 frames with one active DTC (spn, fmi) every
+                   period_ms, from source_address
+
+Every fault has a [start_s, stop_s) window and a per-frame probability.
+Which frames are hit comes from a counter-based hash of (seed, fault,
+PGN, source address, sample index), so every step is a boolean mask over
+whole arrays, and any time window gets the same faults as a full run.
+
+labels() returns the ground truth: one row per changed, dropped or
+injected frame, keyed by its timestamp and CAN ID.
+"""
+import numpy as np
+from codec import build_can_id
+from frames import FrameStore, PGNBlock
+from transport import mix
+
+FAULT_KINDS = ("stuck", "out_of_range", "error", "not_available", "jitter", "drop", "dm1")
+VALUE_FAULTS = ("stuck", "out_of_range", "error", "not_available")
+FRAME_FAULTS = ("jitter", "drop")
+
+DM1_PGN = 65226
+DM1_PRIORITY = 6
+# Amber warning lamp on, lamps not flashing
+DM1_LAMPS = 0x04
+
+LABEL_DTYPE = np.dtype([
+    ('time_us', '<i8'),
+    ('can_id', '<u4'),
+    ('spn', '<u4'),
+    ('kind', 'u1'),
+    ('fault', '<u2'),
+])
+
+def error_raw(length):
+    """
+    J1939 error indicator of a length-bit field: 0xFE followed by 0x00
+    bytes (0xFE, 0xFE00, 0xFE000000), or all ones but the last bit for
+    fields under a byte (0b10, 0xE).
+    """
+    if length < 8:
+        return (1 << length) - 2
+    return 0xFE << (length - 8)
+
+def out_of_range_raw(length):
+    """
+    Top of the reserved band between the valid range and the error
+    indicator (0xFD, 0xFDFF, 0xFDFFFFFF) of a length-bit field.
+    """
+    if length < 3:
+        # 2-bit states are 00/01 valid, 10 error, 11 not available
+        raise ValueError(f"a {length}-bit field has no reserved values above its valid range; "
+                         f"give the out_of_range fault a value")
+    if length < 8:
+        return (1 << length) - 3
+    return (0xFE << (length - 8)) - 1
+
+class FaultSpec:
+    """
+    One fault: what it does, to which SPN or PGN, and when.
+    """
+    def __init__(self, kind, spn=None, pgn=None, start_s=0, stop_s=None, probability=1.0, value=None,
+                 sigma_ms=1.0, fmi=31, period_ms=100, source_address=0):
+        if kind not in FAULT_KINDS:
+            raise ValueError(f"Unknown fault kind '{kind}' (use one of {', '.join(FAULT_KINDS)})")
+        if kind in VALUE_FAULTS + ("dm1",) and spn is None:
+            raise ValueError(f"{kind} faults need an spn")
+        if kind in FRAME_FAULTS and pgn is None:
+            raise ValueError(f"{kind} faults need a pgn")
+        if not 0 < probability <= 1:
+            raise ValueError("probability must be in (0, 1]")
+        if kind == "dm1" and period_ms <= 0:
+            raise ValueError("dm1 faults need a positive period_ms")
+        self.kind = kind
+        self.spn = None if spn is None else int(spn)
+        self.pgn = None if pgn is None else int(pgn)
+        self.start_us = int(start_s * 1e6)
+        self.stop_us = None if stop_s is None else int(stop_s * 1e6)
+        self.probability = probability
+        self.value = value
+        self.sigma_us = sigma_ms * 1000
+        self.fmi = int(fmi) & 0x1F
+        self.period_us = int(period_ms * 1000)
+        self.source_address = int(source_address)
+
+    @classmethod
+    def from_dict(cls, spec):
+        return cls(**spec)
+
+    def window(self, time_us):
+        hit = time_us >= self.start_us
+        if self.stop_us is not None:
+            hit &= time_us < self.stop_us
+        return hit
+
+def _uniform(*keys):
+    return (mix(*keys) >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+class FaultPlan:
+    def __init__(self, specs, seed=0):
+        self.specs = list(specs)
+        self.seed = seed
+
+    @property
+    def moves_frames(self):
+        """
+        True if the plan drops or shifts frames rather than just changing
+        their payloads.
+        """
+        return any(s.kind in FRAME_FAULTS for s in self.specs)
+
+    def jitter_margin_us(self, codec):
+        """
+        Largest jitter any frame can get, 0 without jitter faults.
+        """
+        return max([int(codec.pgn(s.pgn).cycle_time_ms * 1000) // 2 - 1
+                    for s in self.specs if s.kind == "jitter" and s.pgn in codec.pgns], default=0)
+
+    def _faults_for(self, layout):
+        """
+        (index, spec, SPN row or None) of the faults touching a PGN.
+        """
+        out = []
+        for index, spec in enumerate(self.specs):
+            if spec.kind in VALUE_FAULTS and spec.spn in layout.spn_ids:
+                out.append((index, spec, layout.spn_ids.index(spec.spn)))
+            elif spec.kind in FRAME_FAULTS and spec.pgn == layout.pgn_id:
+                out.append((index, spec, None))
+        return out
+
+    def _hits(self, index, spec, can_id, sample, time_us):
+        """
+        Frames of one PGN stream hit by a fault, given their sample indices
+        and scheduled timestamps.
+        """
+        hit = spec.window(time_us)
+        if spec.probability < 1:
+            hit &= _uniform(self.seed, index, can_id, sample) < spec.probability
+        return hit
+
+    def _jitter(self, index, spec, can_id, sample, rate_us):
+        # Box-Muller from two hashed uniforms
+        u1 = _uniform(self.seed, index, can_id, sample, 1)
+        u2 = _uniform(self.seed, index, can_id, sample, 2)
+        z = np.sqrt(-2 * np.log1p(-u1)) * np.cos(2 * np.pi * u2)
+        limit = rate_us // 2 - 1
+        return np.clip(np.round(z * spec.sigma_us), -limit, limit).astype(np.int64)
+
+    def _offsets(self, layout, can_id, sample, time_us):
+        """
+        Total jitter of each frame, from every jitter fault of its PGN.
+        """
+        rate_us = int(layout.cycle_time_ms * 1000)
+        offset = np.zeros(len(sample), dtype=np.int64)
+        for index, spec, _ in self._faults_for(layout):
+            if spec.kind == "jitter":
+                hit = self._hits(index, spec, can_id, sample, time_us)
+                offset += np.where(hit, self._jitter(index, spec, can_id, sample, rate_us), 0)
+        # Nothing goes out before the run starts
+        return np.maximum(offset, -time_us)
+
+    def _stuck_value(self, engine, spec, layout, duration_sec, seed):
+        if spec.value is not None:
+            return float(spec.value)
+        rate_us = int(layout.cycle_time_ms * 1000)
+        count = engine.sample_count(duration_sec, layout.cycle_time_ms)
+        onset = min(-(-spec.start_us // rate_us), count - 1)
+        return float(engine.get_smart_pattern(spec.spn, duration_sec, layout.cycle_time_ms, onset, onset + 1, seed)[0])
+
+    def inject(self, engine, layout, spn_data, time_us, can_id, start, duration_sec, seed):
+        """
+        PGNBlock of one PGN's samples [start:start + n] with the plan's
+        faults applied: values, then packing, then raw bits, then frames.
+        """
+        values = np.array(list(spn_data.values()), dtype=np.float64).reshape(len(layout.spn_ids), len(time_us))
+        sample = np.arange(start, start + len(time_us), dtype=np.int64)
+        faults = self._faults_for(layout)
+
+        for index, spec, row in faults:
+            if spec.kind == "stuck":
+                hit = self._hits(index, spec, can_id, sample, time_us)
+                if hit.any():
+                    values[row, hit] = self._stuck_value(engine, spec, layout, duration_sec, seed)
+
+        payloads = engine.pack_batch(layout.pgn_id, dict(zip(layout.spn_ids, values)))
+
+        data = payloads.view('<u8').reshape(len(payloads))
+        for index, spec, row in faults:
+            if spec.kind not in ("out_of_range", "error", "not_available"):
+                continue
+            hit = self._hits(index, spec, can_id, sample, time_us)
+            mask = int(layout.mask[row])
+            if spec.kind == "not_available":
+                raw = mask
+            elif spec.kind == "error":
+                raw = error_raw(mask.bit_length())
+            elif spec.value is not None:
+                raw = int((spec.value - layout.offset[row]) / layout.res[row]) & mask
+            else:
+                raw = out_of_range_raw(mask.bit_length())
+            shift = int(layout.shift[row])
+            data[hit] = (data[hit] & np.uint64(~(mask << shift) & (2**64 - 1))) | np.uint64(raw << shift)
+            values[row, hit] = np.nan if spec.kind in ("error", "not_available") else \
+                raw * layout.res[row] + layout.offset[row]
+
+        keep = None
+        for index, spec, _ in faults:
+            if spec.kind == "drop":
+                dropped = self._hits(index, spec, can_id, sample, time_us)
+                keep = ~dropped if keep is None else keep & ~dropped
+        if any(spec.kind == "jitter" for _, spec, _ in faults):
+            time_us = time_us + self._offsets(layout, can_id, sample, time_us)
+        if keep is not None:
+            time_us, payloads, values = time_us[keep], payloads[keep], values[:, keep]
+        return PGNBlock(layout, time_us, payloads, values, can_id)
+
+    # --- DM1 BURSTS ---
+
+    def _dm1_specs(self):
+        return [(i, s) for i, s in enumerate(self.specs) if s.kind == "dm1"]
+
+    def _dm1_times(self, spec, end_us, start_us, stop_us):
+        first = max(spec.start_us, start_us)
+        last = min(spec.stop_us if spec.stop_us is not None else end_us, end_us, stop_us)
+        k0 = -(-(first - spec.start_us) // spec.period_us)
+        k1 = -(-(last - spec.start_us) // spec.period_us)
+        k = np.arange(k0, max(k1, k0), dtype=np.int64)
+        return spec.start_us + k * spec.period_us, k
+
+    def frames(self, duration_sec, start_us=0, stop_us=None):
+        """
+        FrameStore of the DM1 burst frames with a timestamp in
+        [start_us, stop_us).
+        """
+        end_us = int(duration_sec * 1e6)
+        stop_us = end_us if stop_us is None else stop_us
+        parts = []
+        for index, spec in self._dm1_specs():
+            times, k = self._dm1_times(spec, end_us, start_us, stop_us)
+            data = np.full((len(times), 8), 0xFF, dtype=np.uint8)
+            data[:, 0] = DM1_LAMPS
+            data[:, 2] = spec.spn & 0xFF
+            data[:, 3] = (spec.spn >> 8) & 0xFF
+            data[:, 4] = ((spec.spn >> 16) & 0x7) << 5 | spec.fmi
+            # Occurrence count goes up with every frame of the burst
+            data[:, 5] = np.minimum(k + 1, 126)
+            can_id = build_can_id(DM1_PRIORITY, DM1_PGN, spec.source_address)
+            parts.append((times, np.full(len(times), can_id, dtype=np.uint32), data, np.full(len(times), index)))
+
+        if not parts:
+            return FrameStore.allocate(0)
+        time_us, can_id, data, key = (np.concatenate(c) for c in zip(*parts))
+        order = np.lexsort((key, time_us))
+        store = FrameStore.allocate(len(order))
+        store.frames['time_us'] = time_us[order]
+        store.frames['can_id'] = can_id[order]
+        store.frames['dlc'] = 8
+        store.frames['data'] = data[order]
+        return store
+
+    # --- GROUND TRUTH ---
+
+    def labels(self, engine, selected_pgns, duration_sec):
+        """
+        Ground-truth table (LABEL_DTYPE) of a run generated with this plan:
+        every frame a fault changed, dropped or added, in time order. Times
+        are the frames' timestamps; dropped frames keep the one they would
+        have had.
+        """
+        parts = []
+        for pgn_id in dict.fromkeys(selected_pgns):
+            layout = engine.codec.pgn(pgn_id)
+            rate_us = int(layout.cycle_time_ms * 1000)
+            count = engine.sample_count(duration_sec, layout.cycle_time_ms)
+            for index, spec, row in self._faults_for(layout):
+                # Only the samples inside the fault window
+                first = min(-(-spec.start_us // rate_us), count)
+                last = count if spec.stop_us is None else min(-(-spec.stop_us // rate_us), count)
+                sample = np.arange(first, max(last, first), dtype=np.int64)
+                time_us = sample * rate_us
+                hit = self._hits(index, spec, layout.can_id, sample, time_us)
+                sample, time_us = sample[hit], time_us[hit]
+                time_us = time_us + self._offsets(layout, layout.can_id, sample, time_us)
+                spn = spec.spn if row is not None else 0
+                parts.append(self._label_rows(time_us, layout.can_id, spn, spec.kind, index))
+
+        for index, spec in self._dm1_specs():
+            times, _ = self._dm1_times(spec, int(duration_sec * 1e6), 0, int(duration_sec * 1e6))
+            parts.append(self._label_rows(times, build_can_id(DM1_PRIORITY, DM1_PGN, spec.source_address),
+                                          spec.spn, "dm1", index))
+
+        labels = np.concatenate(parts) if parts else np.zeros(0, dtype=LABEL_DTYPE)
+        return labels[np.lexsort((labels['fault'], labels['can_id'], labels['time_us']))]
+
+    @staticmethod
+    def _label_rows(time_us, can_id, spn, kind, index):
+        rows = np.zeros(len(time_us), dtype=LABEL_DTYPE)
+        rows['time_us'] = time_us
+        rows['can_id'] = can_id
+        rows['spn'] = spn
+        rows['kind'] = FAULT_KINDS.index(kind)
+        rows['fault'] = index
+        return rows
+
+def labels_dataframe(labels):
+    """
+    Label table as a DataFrame: time_ms, pgn_hex, spn, fault kind, fault index.
+    """
+    import pandas as pd
+    return pd.DataFrame({
+        "time_ms": labels['time_us'] / 1000,
+        "pgn_hex": [f"0x{c:08X}" for c in labels['can_id'].tolist()],
+        "spn": labels['spn'].astype(np.int64),
+        "fault": np.array(FAULT_KINDS, dtype=object)[labels['kind']],
+        "fault_index": labels['fault'].astype(np.int64),
+    })
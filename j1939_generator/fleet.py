@@ -0,0 +1,137 @@
+"""
+Fleet mode: many virtual ECUs on one bus.
+
+Each FleetInstance is one ECU (source address) sending its own PGN set with
+its own seed and start-time offset. Instances are generated in parallel on
+a process pool. Workers write raw frames straight into one shared-memory
+segment allocated by the parent, so no frame data is pickled. The parent
+then k-way merges every (instance, PGN) stream into one time-ordered trace.
+The caller's codec is handed to each worker once, so workers use the same
+PGN/SPN database as the parent even after codec.reload() or an import.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from engine import J1939Engine
+from frames import FRAME_DTYPE, FrameStore
+from noise import new_seed, parse_seed
+from parallel import attach_shared
+from timeline import can_priority, merge_index
+
+class FleetInstance:
+    """
+    One virtual ECU: source address, PGN set, seed and start-time offset.
+    """
+    def __init__(self, source_address, pgns, seed=None, time_offset_ms=0):
+        if not 0 <= source_address <= 0xFD:
+            raise ValueError(f"Source address {source_address} outside 0..253")
+        self.source_address = source_address
+        self.pgns = list(pgns)
+        self.seed = new_seed() if seed is None else parse_seed(seed)
+        self.time_offset_ms = time_offset_ms
+
+    @classmethod
+    def from_dict(cls, spec):
+        return cls(int(spec['source_address']), [int(p) for p in spec['pgns']],
+                   spec.get('seed'), spec.get('time_offset_ms', 0))
+
+# Codec of the parent's generate_fleet() call, set in each worker process
+_worker_codec = None
+
+def _init_worker(codec):
+    global _worker_codec
+    _worker_codec = codec
+
+def _write_instance(buf, job, codec):
+    frames = np.ndarray(job['total'], dtype=FRAME_DTYPE, buffer=buf)
+    pos = job['offset']
+    engine = J1939Engine(codec)
+    blocks = engine.generate_blocks(job['pgns'], job['duration_sec'], job['seed'],
+                                    job['source_address'], job['time_offset_ms'])
+    for block in blocks:
+        out = frames[pos:pos + len(block)]
+        out['time_us'] = block.time_us
+        out['can_id'] = block.can_id
+        out['dlc'] = 8
+        out['data'] = block.payloads
+        pos += len(block)
+
+def _generate_instance(job):
+    """
+    Worker: generates one instance's PGN blocks into its slice of the
+    shared frame buffer, unmerged, in the order of job['pgns'].
+    """
+    shm = attach_shared(job['shm_name'])
+    try:
+        # Views into shm.buf must be gone before close(), hence the helper
+        _write_instance(shm.buf, job, _worker_codec)
+    finally:
+        shm.close()
+    return job['offset']
+
+def _merge_shared(buf, total, streams, path):
+    """
+    Timeline merge of the (key, start, count) streams laid out in buf.
+    """
+    frames = np.ndarray(total, dtype=FRAME_DTYPE, buffer=buf)
+
+    # Stable sort keeps instance order for identical (priority, PGN, SA)
+    streams = sorted(streams, key=lambda s: s[0])
+    order = merge_index([frames['time_us'][start:start + n] for _, start, n in streams])
+    starts = np.concatenate([np.arange(start, start + n, dtype=np.int64) for _, start, n in streams])
+
+    store = FrameStore.allocate(total, path)
+    store.frames[:] = frames[starts[order]]
+    return store
+
+def generate_fleet(instances, duration_sec=10, workers=None, path=None, codec=None):
+    """
+    Bus trace of all instances as one time-ordered FrameStore (frames only,
+    no signal tables), memory-mapped to path if given. Every instance is
+    generated with codec (default: the current one).
+    """
+    engine = J1939Engine(codec)
+    codec = engine.codec
+    if not instances:
+        return FrameStore.allocate(0, path)
+
+    # Stream sizes are known up front, so one buffer can be laid out for all
+    jobs, streams = [], []
+    total = 0
+    for inst in instances:
+        unknown = [p for p in inst.pgns if p not in engine.codec.pgns]
+        if unknown:
+            raise ValueError(f"Unknown PGN(s) for source address {inst.source_address}: {unknown}")
+
+        jobs.append({
+            "pgns": inst.pgns, "duration_sec": duration_sec, "seed": inst.seed,
+            "source_address": inst.source_address, "time_offset_ms": inst.time_offset_ms,
+            "offset": total,
+        })
+        for pgn_id in inst.pgns:
+            layout = engine.codec.pgn(pgn_id)
+            count = engine.sample_count(duration_sec, layout.cycle_time_ms)
+            key = (can_priority(layout.can_id_for(inst.source_address)), pgn_id, inst.source_address)
+            streams.append((key, total, count))
+            total += count
+
+    shm = shared_memory.SharedMemory(create=True, size=max(total * FRAME_DTYPE.itemsize, 1))
+    try:
+        for job in jobs:
+            job.update(shm_name=shm.name, total=total)
+
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(jobs) == 1:
+            for job in jobs:
+                _write_instance(shm.buf, job, codec)
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), initializer=_init_worker,
+                                     initargs=(codec,)) as pool:
+                list(pool.map(_generate_instance, jobs))
+
+        store = _merge_shared(shm.buf, total, streams, path)
+    finally:
+        shm.close()
+        shm.unlink()
+    return store
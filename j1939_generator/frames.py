@@ -0,0 +1,225 @@
+"""
+Compact frame store: the engine's internal representation of a trace.
+
+Frames live in one NumPy structured array of 24 bytes per frame
+(timestamp, 29-bit CAN ID, DLC, 8 data bytes), optionally backed by a
+memory-mapped .npy file. Decoded physical values are kept apart in one
+SignalTable per PGN, and the wide pandas DataFrame is only built when a
+caller asks for it with to_dataframe(); pandas itself is imported then too,
+since it costs a few hundred milliseconds of start-up.
+"""
+import numpy as np
+import metrics
+from exporters import hex_matrix
+from timeline import merge_index
+
+FRAME_DTYPE = np.dtype([
+    ('time_us', '<i8'),
+    ('can_id', '<u4'),
+    ('dlc', 'u1'),
+    ('data', 'u1', (8,)),
+], align=True)
+
+BASE_COLUMNS = ["time_ms", "pgn_dec", "pgn_hex", "dlc", "payload_hex", "payload_bytes"]
+
+def pgn_of(can_id):
+    """
+    PGN carried in 29-bit CAN IDs; PDU1 (PF < 240) drops the destination byte.
+    """
+    can_id = np.asarray(can_id, dtype=np.int64)
+    pgn = (can_id >> 8) & 0x3FFFF
+    pdu_format = (can_id >> 16) & 0xFF
+    return np.where(pdu_format < 240, pgn & 0x3FF00, pgn)
+
+class PGNBlock:
+    """
+    One PGN's frames in time order, as produced by the engine before the
+    streams are merged into a timeline.
+    """
+    def __init__(self, layout, time_us, payloads, values, can_id=None):
+        self.layout = layout
+        self.time_us = time_us
+        self.payloads = payloads
+        self.values = values
+        self.can_id = layout.can_id if can_id is None else can_id
+
+    def __len__(self):
+        return len(self.time_us)
+
+class SignalTable:
+    """
+    Decoded SPN values of one PGN: values[j] is the series of names[j], and
+    frame_index maps each sample to its row in the frame store.
+    """
+    def __init__(self, pgn_id, spn_ids, names, units, frame_index, values):
+        self.pgn_id = pgn_id
+        self.spn_ids = spn_ids
+        self.names = names
+        self.units = units
+        self.frame_index = frame_index
+        self.values = values
+
+    def __len__(self):
+        return len(self.frame_index)
+
+    def column(self, name):
+        return self.values[self.names.index(name)]
+
+class FrameStore:
+    def __init__(self, frames, signals=None):
+        self.frames = frames
+        self.signals = signals if signals is not None else {}
+
+    @classmethod
+    def allocate(cls, num_frames, path=None):
+        """
+        Empty store for num_frames frames, memory-mapped to path if given.
+        """
+        if path is None:
+            frames = np.zeros(num_frames, dtype=FRAME_DTYPE)
+        else:
+            frames = np.lib.format.open_memmap(path, mode='w+', dtype=FRAME_DTYPE, shape=(num_frames,))
+        return cls(frames)
+
+    @classmethod
+    def open(cls, path, mode='r'):
+        """
+        Memory-maps a frame array previously written with allocate(path=...).
+        """
+        return cls(np.load(path, mmap_mode=mode))
+
+    @classmethod
+    def merge(cls, blocks, order, path=None, signals=True):
+        """
+        Builds a store from per-PGN blocks; order is the timeline merge index
+        into the concatenation of the blocks (see timeline.merge_index).
+        """
+        store = cls.allocate(len(order), path)
+        frames = store.frames
+
+        frames['time_us'] = np.concatenate([b.time_us for b in blocks])[order] if blocks else []
+        frames['can_id'] = np.concatenate([np.broadcast_to(b.can_id, len(b)) for b in blocks])[order] if blocks else []
+        frames['dlc'] = 8
+        if blocks:
+            frames['data'] = np.concatenate([b.payloads for b in blocks])[order]
+
+        if signals:
+            position = np.empty(len(order), dtype=np.int64)
+            position[order] = np.arange(len(order))
+            base = 0
+            for b in blocks:
+                layout = b.layout
+                store.signals[layout.pgn_id] = SignalTable(
+                    layout.pgn_id, layout.spn_ids, layout.names,
+                    [s.unit for s in layout.spns], position[base:base + len(b)], b.values
+                )
+                base += len(b)
+        return store
+
+    @classmethod
+    @metrics.staged("merge")
+    def interleave(cls, stores, path=None):
+        """
+        Time-ordered union of time-ordered stores; on equal timestamps the
+        earlier store's frame comes first. Signal tables follow their frames.
+        """
+        order = merge_index([s.frames['time_us'] for s in stores])
+        store = cls.allocate(len(order), path)
+        if len(order):
+            store.frames[:] = np.concatenate([s.frames for s in stores])[order]
+
+        position = np.empty(len(order), dtype=np.int64)
+        position[order] = np.arange(len(order))
+        base = 0
+        for s in stores:
+            for pgn_id, table in s.signals.items():
+                store.signals[pgn_id] = SignalTable(
+                    pgn_id, table.spn_ids, table.names, table.units,
+                    position[base + table.frame_index], table.values
+                )
+            base += len(s)
+        return store
+
+    def take(self, index):
+        """
+        Store of frames[index], in that order. Signal tables keep the rows
+        of taken frames only, re-pointed at their new positions.
+        """
+        index = np.asarray(index, dtype=np.int64)
+        store = FrameStore(self.frames[index])
+        position = np.full(len(self), -1, dtype=np.int64)
+        position[index] = np.arange(len(index))
+        for pgn_id, table in self.signals.items():
+            new = position[table.frame_index]
+            keep = np.flatnonzero(new >= 0)
+            keep = keep[np.argsort(new[keep], kind='stable')]
+            store.signals[pgn_id] = SignalTable(
+                pgn_id, table.spn_ids, table.names, table.units,
+                new[keep], table.values[:, keep]
+            )
+        return store
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def nbytes(self):
+        return self.frames.nbytes
+
+    @property
+    def time_ms(self):
+        """
+        Timestamps in ms: integers while every frame sits on a whole ms.
+        """
+        time_us = self.frames['time_us']
+        if np.all(time_us % 1000 == 0):
+            return time_us // 1000
+        return time_us / 1000
+
+    @property
+    def can_id(self):
+        return self.frames['can_id']
+
+    @property
+    def data(self):
+        return self.frames['data']
+
+    @property
+    def pgn(self):
+        return pgn_of(self.frames['can_id'])
+
+    @metrics.staged("dataframe")
+    def to_dataframe(self, columns=None):
+        """
+        Wide DataFrame in the layout of J1939Engine.generate_dataset(): one
+        row per frame and one column per SPN name, NaN for other PGNs' rows.
+        """
+        n = len(self.frames)
+        data = self.frames['data']
+        width = data.shape[1] * 3 - 1
+        hex_text = hex_matrix(data)[:, :-1].copy().view(f"S{width}").ravel()
+        ids, id_index = np.unique(self.frames['can_id'], return_inverse=True)
+        id_text = np.array([f"0x{i:08X}" for i in ids], dtype="U10")
+
+        df = {
+            "time_ms": self.time_ms,
+            "pgn_dec": self.pgn,
+            "pgn_hex": id_text[id_index],
+            "dlc": self.frames['dlc'].astype(np.int64),
+            "payload_hex": hex_text.astype(f"U{width}"),
+            "payload_bytes": [row.tobytes() for row in data],
+        }
+
+        for table in self.signals.values():
+            for name, values in zip(table.names, table.values):
+                column = df.get(name)
+                if column is None:
+                    column = np.full(n, np.nan)
+                    df[name] = column
+                column[table.frame_index] = values
+
+        import pandas as pd
+        df = pd.DataFrame(df)
+        if columns is not None:
+            df = df.reindex(columns=columns)
+        return df
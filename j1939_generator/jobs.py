@@ -0,0 +1,278 @@
+"""
+Background generation jobs.
+
+Long generations run on a bounded thread pool instead of inside the request
+handler. Each job streams its download format into a temp file while
+recording progress, and the finished file is served from disk (with HTTP
+Range support, see app.py). A cap on queued plus running jobs protects the
+server; finished jobs and their files expire after a TTL, checked by a
+background sweeper as well as on every submit.
+
+Job state is also written next to the output file, so with several
+gunicorn worker processes sharing one job directory, any of them can
+answer status and download requests. It records the owning process, so a
+job whose worker died is reported as failed rather than running forever.
+"""
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from compression import compress
+from exporters import EXPORTERS
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+# How often the sweeper looks for expired jobs (at most every ttl_sec)
+SWEEP_INTERVAL_SEC = 60
+# Progress of a running job is saved at most this often
+SAVE_INTERVAL_SEC = 2.0
+
+class JobQueueFull(Exception):
+    pass
+
+class Job:
+    def __init__(self, pgns, duration, file_format, seed, total_frames, compression=None):
+        self.id = uuid.uuid4().hex
+        self.pgns = pgns
+        self.duration = duration
+        self.format = file_format
+        self.compression = compression
+        self.seed = seed
+        self.total_frames = total_frames
+
+        self.status = QUEUED
+        self.frames = 0
+        self.bytes = 0
+        self.error = None
+        self.path = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        # Process running the job
+        self.owner_pid = os.getpid()
+        self.owner_host = socket.gethostname()
+
+    @property
+    def progress(self):
+        if self.status == DONE:
+            return 1.0
+        return self.frames / self.total_frames if self.total_frames else 0.0
+
+    @property
+    def frames_per_sec(self):
+        if self.started is None:
+            return 0.0
+        elapsed = (self.finished or time.time()) - self.started
+        return self.frames / elapsed if elapsed > 0 else 0.0
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            state = json.load(f)
+        job = cls(state['pgns'], state['duration'], state['format'], state['seed'], state['total_frames'],
+                  state.get('compression'))
+        for name in ("id", "status", "frames", "bytes", "error", "path", "created", "started", "finished"):
+            setattr(job, name, state[name])
+        job.owner_pid = state.get('owner_pid')
+        job.owner_host = state.get('owner_host')
+        return job
+
+    def orphaned(self):
+        """
+        True if the job is queued or running but its process on this host
+        has exited. Jobs of other hosts can't be checked.
+        """
+        if self.status not in (QUEUED, RUNNING) or not self.owner_pid or self.owner_host != socket.gethostname():
+            return False
+        try:
+            os.kill(self.owner_pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        return False
+
+    def save(self, path):
+        state = self.to_dict()
+        state.update(pgns=self.pgns, duration=self.duration, format=self.format, compression=self.compression,
+                     path=self.path, owner_pid=self.owner_pid, owner_host=self.owner_host,
+                     created=self.created, started=self.started, finished=self.finished)
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "progress": round(self.progress, 4),
+            "frames": self.frames,
+            "total_frames": self.total_frames,
+            "frames_per_sec": round(self.frames_per_sec, 1),
+            "bytes": self.bytes,
+            "seed": self.seed,
+            "error": self.error,
+        }
+
+class JobManager:
+    def __init__(self, engine, max_workers=2, max_jobs=8, ttl_sec=3600, workdir=None, window_sec=10):
+        self.engine = engine
+        self.max_jobs = max_jobs
+        self.ttl_sec = ttl_sec
+        self.window_sec = window_sec
+        self.workdir = workdir or os.path.join(tempfile.gettempdir(), "j1939_jobs")
+        os.makedirs(self.workdir, exist_ok=True)
+
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="j1939-job")
+        self._stop = threading.Event()
+        self._sweeper = threading.Thread(target=self._sweep, name="j1939-job-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def submit(self, pgns, duration, file_format, seed, compression=None):
+        """
+        Queues a generation and returns its Job at once; raises JobQueueFull
+        when max_jobs are already queued or running.
+        """
+        self._expire()
+        total = sum(
+            self.engine.sample_count(duration, self.engine.codec.pgn(p).cycle_time_ms) for p in pgns
+        )
+        job = Job(pgns, duration, file_format, seed, total, compression)
+
+        with self._lock:
+            active = sum(1 for j in self._jobs.values() if j.status in (QUEUED, RUNNING))
+            if active >= self.max_jobs:
+                raise JobQueueFull(f"{active} jobs already queued or running")
+            self._jobs[job.id] = job
+
+        self._save(job)
+        self._pool.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        """
+        Job by ID, including jobs run by other processes on the same workdir.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+
+        if not job_id.isalnum():
+            return None
+        return self._load(job_id)
+
+    def stats(self):
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+    def _state_path(self, job_id):
+        return os.path.join(self.workdir, f"{job_id}.json")
+
+    def _output_path(self, job):
+        return os.path.join(self.workdir, f"{job.id}.{job.format}")
+
+    def _load(self, job_id):
+        """
+        Job from its state file, or None if it is gone or unreadable.
+        """
+        try:
+            job = Job.load(self._state_path(job_id))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if job.orphaned():
+            job.status = FAILED
+            job.error = "the worker process running this job exited"
+            job.finished = time.time()
+            self._save(job)
+        return job
+
+    def _save(self, job):
+        job.save(self._state_path(job.id))
+
+    def _run(self, job):
+        job.status = RUNNING
+        job.started = time.time()
+        self._save(job)
+        path = self._output_path(job)
+        writer = EXPORTERS[job.format][0]
+
+        try:
+            windows = self.engine.iter_frames(job.pgns, duration_sec=job.duration, window_sec=self.window_sec,
+                                              seed=job.seed, signals=job.format == 'csv')
+            blocks = writer(self._track(job, windows), self.engine.dataset_columns(job.pgns))
+            if job.compression:
+                blocks = compress(blocks, job.compression)
+            with open(path, 'wb') as out:
+                for block in blocks:
+                    out.write(block)
+                    job.bytes += len(block)
+            job.path = path
+            job.status = DONE
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+            if os.path.exists(path):
+                os.remove(path)
+        finally:
+            job.finished = time.time()
+            self._save(job)
+
+    def _track(self, job, windows):
+        # _run saves the final state; in between, progress every SAVE_INTERVAL_SEC
+        saved = time.monotonic()
+        for store in windows:
+            job.frames += len(store)
+            if time.monotonic() - saved >= SAVE_INTERVAL_SEC:
+                self._save(job)
+                saved = time.monotonic()
+            yield store
+
+    def _expire(self):
+        """
+        Drops finished jobs older than ttl_sec together with their files,
+        including the jobs of other processes sharing the workdir.
+        """
+        now = time.time()
+        with self._lock:
+            expired = [j for j in self._jobs.values() if j.finished and now - j.finished > self.ttl_sec]
+            for job in expired:
+                del self._jobs[job.id]
+            own = set(self._jobs)
+
+        for name in os.listdir(self.workdir):
+            job_id, ext = os.path.splitext(name)
+            if ext != ".json" or job_id in own or any(j.id == job_id for j in expired):
+                continue
+            job = self._load(job_id)
+            if job is not None and job.finished and now - job.finished > self.ttl_sec:
+                expired.append(job)
+
+        for job in expired:
+            for path in (self._output_path(job), self._state_path(job.id)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    # Already swept by another process
+                    pass
+
+    def _sweep(self):
+        while not self._stop.wait(min(SWEEP_INTERVAL_SEC, self.ttl_sec)):
+            try:
+                self._expire()
+            except OSError:
+                pass
+
+    def shutdown(self):
+        self._stop.set()
+        self._pool.shutdown(wait=False, cancel_futures=True)
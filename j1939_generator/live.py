@@ -0,0 +1,279 @@
+"""
+Live streaming of generated traffic to many watchers.
+
+A LiveStream runs one generation pass in a background thread, paced
+against the wall clock. Every batch_ms of simulated time becomes one batch
+of frames plus decoded SPN values (names and units from the codec),
+serialized once and fanned out to every subscriber. Each subscriber has a
+bounded queue. When a slow consumer's queue is full, its oldest batches
+are dropped ("drop"), or the backlog is folded into one batch holding the
+latest value of every signal ("coalesce"). The generator never waits for
+a client.
+
+LiveHub shares streams: clients asking for the same PGNs, seed, rate and
+batch interval watch the same instance.
+"""
+import json
+import threading
+import time
+import uuid
+from collections import deque
+import numpy as np
+from noise import new_seed
+
+DROP, COALESCE = "drop", "coalesce"
+POLICIES = (DROP, COALESCE)
+
+class LiveBusy(Exception):
+    pass
+
+def sse_event(event, data, event_id=None):
+    """
+    One server-sent event as bytes.
+    """
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+class LiveBatch:
+    """
+    One published batch: the shared SSE bytes plus the last value of each
+    signal, which is all a coalesced batch keeps.
+    """
+    def __init__(self, seq, t_ms, event, latest):
+        self.seq = seq
+        self.t_ms = t_ms
+        self.event = event
+        self.latest = latest
+
+    @classmethod
+    def coalesce(cls, batches):
+        latest = {}
+        for batch in batches:
+            latest.update(batch.latest)
+        last = batches[-1]
+        data = {
+            "seq": last.seq, "t_ms": last.t_ms, "coalesced": len(batches),
+            "signals": {name: {"unit": unit, "t_ms": [t], "values": [v]} for name, (unit, t, v) in latest.items()},
+        }
+        return cls(last.seq, last.t_ms, sse_event("batch", data, last.seq), latest)
+
+class Subscriber:
+    """
+    Bounded per-client queue of LiveBatches.
+    """
+    def __init__(self, max_queue=32, policy=COALESCE):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy '{policy}' (use {' or '.join(POLICIES)})")
+        self.max_queue = max(max_queue, 1)
+        self.policy = policy
+        self.dropped = 0
+        self.closed = False
+        self._queue = deque()
+        self._cond = threading.Condition()
+
+    def put(self, batch):
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                if self.policy == DROP:
+                    self._queue.popleft()
+                    self.dropped += 1
+                else:
+                    backlog = list(self._queue) + [batch]
+                    self._queue.clear()
+                    self.dropped += len(backlog) - 1
+                    batch = LiveBatch.coalesce(backlog)
+            self._queue.append(batch)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """
+        Next batch; None on timeout or once the stream has ended and the
+        queue is drained (check .closed to tell them apart).
+        """
+        with self._cond:
+            if not self._queue and not self.closed:
+                self._cond.wait(timeout)
+            return self._queue.popleft() if self._queue else None
+
+class LiveStream:
+    def __init__(self, engine, pgns, seed=None, duration_sec=3600, rate=1.0, batch_ms=200,
+                 window_sec=1, frames=True):
+        self.id = uuid.uuid4().hex
+        self.engine = engine
+        self.pgns = list(pgns)
+        self.seed = new_seed() if seed is None else seed
+        self.duration_sec = duration_sec
+        self.rate = rate
+        self.batch_ms = batch_ms
+        self.window_sec = window_sec
+        self.frames = frames
+
+        self.seq = 0
+        self.t_ms = 0
+        self.started = None
+        self.done = False
+        # Message of the exception that ended the generator, if any
+        self.error = None
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"j1939-live-{self.id[:8]}", daemon=True)
+
+    @property
+    def watchers(self):
+        return len(self._subscribers)
+
+    def describe(self):
+        signals = []
+        for pgn_id in self.pgns:
+            layout = self.engine.codec.pgn(pgn_id)
+            signals.extend({"pgn": pgn_id, "name": s.name, "unit": s.unit} for s in layout.spns)
+        return {
+            "stream": self.id, "seed": self.seed, "pgns": self.pgns, "duration": self.duration_sec,
+            "rate": self.rate, "batch_ms": self.batch_ms, "frames": self.frames, "t_ms": self.t_ms,
+            "subscribers": self.watchers, "signals": signals,
+        }
+
+    def subscribe(self, max_queue=32, policy=COALESCE):
+        sub = Subscriber(max_queue, policy)
+        with self._lock:
+            self._subscribers.append(sub)
+            if self.done:
+                sub.close()
+        if not self._thread.is_alive() and self.started is None:
+            self.started = time.perf_counter()
+            self._thread.start()
+        return sub
+
+    def unsubscribe(self, sub):
+        """
+        Removes sub; returns True when nobody is left watching, which stops
+        the generator.
+        """
+        with self._lock:
+            if sub in self._subscribers:
+                self._subscribers.remove(sub)
+            idle = not self._subscribers
+        if idle:
+            self._stop.set()
+        return idle
+
+    def _publish(self, batch):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            sub.put(batch)
+
+    def _run(self):
+        try:
+            windows = self.engine.iter_frames(self.pgns, duration_sec=self.duration_sec,
+                                              window_sec=self.window_sec, seed=self.seed)
+            for store in windows:
+                for batch in self._batches(store):
+                    # Absolute due times, so pacing does not drift
+                    delay = self.started + batch.t_ms / 1000 / self.rate - time.perf_counter()
+                    if self._stop.wait(max(delay, 0)):
+                        return
+                    self.t_ms = batch.t_ms
+                    self._publish(batch)
+        except Exception as e:
+            # Subscribers see the stream close with error set, not a normal end
+            self.error = str(e) or type(e).__name__
+        finally:
+            with self._lock:
+                self.done = True
+                subscribers = list(self._subscribers)
+            for sub in subscribers:
+                sub.close()
+
+    def _batches(self, store):
+        """
+        Splits a FrameStore window into batch_ms LiveBatches.
+        """
+        if not len(store):
+            return
+        time_ms = store.frames['time_us'] / 1000
+        first = int(time_ms[0] // self.batch_ms)
+        last = int(time_ms[-1] // self.batch_ms)
+        edges = np.arange(first, last + 2) * self.batch_ms
+        bounds = np.searchsorted(time_ms, edges)
+
+        payload_hex = store.data.tobytes().hex() if self.frames else ""
+        for i in range(len(edges) - 1):
+            lo, hi = int(bounds[i]), int(bounds[i + 1])
+            if lo == hi:
+                continue
+            self.seq += 1
+            t_end = int(edges[i + 1])
+            data = {"seq": self.seq, "t_ms": t_end, "signals": {}}
+            latest = {}
+
+            if self.frames:
+                ids = store.frames['can_id'][lo:hi].tolist()
+                data["frames"] = [
+                    [t, f"{can_id:08X}", payload_hex[row * 16:row * 16 + 16]]
+                    for row, t, can_id in zip(range(lo, hi), time_ms[lo:hi].tolist(), ids)
+                ]
+
+            for table in store.signals.values():
+                a, b = np.searchsorted(table.frame_index, [lo, hi])
+                if a == b:
+                    continue
+                t = time_ms[table.frame_index[a:b]].tolist()
+                for name, unit, values in zip(table.names, table.units, table.values[:, a:b]):
+                    values = values.tolist()
+                    data["signals"][name] = {"unit": unit, "t_ms": t, "values": values}
+                    latest[name] = (unit, t[-1], values[-1])
+
+            yield LiveBatch(self.seq, t_end, sse_event("batch", data, self.seq), latest)
+
+class LiveHub:
+    """
+    Registry of running LiveStreams, shared by identical requests.
+    """
+    def __init__(self, engine, max_streams=16):
+        self.engine = engine
+        self.max_streams = max_streams
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def open(self, pgns, seed=None, duration_sec=3600, rate=1.0, batch_ms=200, frames=True,
+             max_queue=32, policy=COALESCE):
+        """
+        (stream, subscriber) for a new watcher, joining a running stream
+        with the same parameters when there is one.
+        """
+        key = (tuple(pgns), seed, duration_sec, rate, batch_ms, frames)
+        with self._lock:
+            self._prune()
+            stream = self._streams.get(key)
+            if stream is None or stream.done:
+                running = sum(1 for s in self._streams.values() if not s.done)
+                if running >= self.max_streams:
+                    raise LiveBusy(f"{running} live streams already running")
+                stream = LiveStream(self.engine, pgns, seed, duration_sec, rate, batch_ms, frames=frames)
+                self._streams[key] = stream
+            sub = stream.subscribe(max_queue, policy)
+        return stream, sub
+
+    def _prune(self):
+        # Finished streams nobody is reading any more; caller holds the lock
+        for key, s in list(self._streams.items()):
+            if s.done and not s.watchers:
+                del self._streams[key]
+
+    def close(self, stream, sub):
+        with self._lock:
+            if stream.unsubscribe(sub):
+                for key, s in list(self._streams.items()):
+                    if s is stream:
+                        del self._streams[key]
+
+    def stats(self):
+        with self._lock:
+            return [s.describe() for s in self._streams.values()]
@@ -0,0 +1,365 @@
+"""
+Lightweight instrumentation: stage timers, counters and histograms,
+rendered in the Prometheus text exposition format.
+
+Stage timers record self time, the time spent in a stage minus its nested
+stages, so the stages of one request add up to its total. Every thread
+keeps its own stage stack, and a Profile activated on a thread collects
+the breakdown of the request it belongs to. Work done in process-pool
+workers (J1939Engine.generate_frames(workers > 1)) is not seen.
+
+J1939_METRICS=0 turns everything off: staged() returns the function
+undecorated, stage() a shared no-op context manager, and counters and
+histograms return before taking their lock.
+
+tracemalloc slows allocation-heavy code several times over, so peak memory
+is only traced for profiled requests and for every
+J1939_METRICS_MEMORY_SAMPLE-th request (0 = never). It is process-wide:
+other requests running at the same time add to the peak.
+"""
+import functools
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import nullcontext
+
+ENABLED = os.environ.get("J1939_METRICS", "1").lower() not in ("0", "false", "no")
+MEMORY_SAMPLE = int(os.environ.get("J1939_METRICS_MEMORY_SAMPLE", 0))
+
+# Request latency buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Peak memory buckets, in bytes
+MEMORY_BUCKETS = tuple(2**20 * mb for mb in (1, 4, 16, 64, 256, 1024, 4096))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_NO_STAGE = nullcontext()
+_local = threading.local()
+
+# --- METRIC TYPES ---
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labels):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [bucket counts..., sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        if not ENABLED:
+            return
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.label_names + ("le",)
+        with self._lock:
+            for labels, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, state):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_labels(names, labels + (_number(bound),))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_labels(names, labels + ('+Inf',))} {state[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(state[-2])}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {state[-1]}")
+        return lines
+
+class StageTotals:
+    """
+    Self seconds and calls per stage, updated together under one lock.
+    """
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            entry = self._values.get(name)
+            if entry is None:
+                self._values[name] = [seconds, 1]
+            else:
+                entry[0] += seconds
+                entry[1] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((name, list(entry)) for name, entry in self._values.items())
+        lines = ["# HELP j1939_stage_seconds_total Self time spent in each generation stage.",
+                 "# TYPE j1939_stage_seconds_total counter"]
+        lines += [f'j1939_stage_seconds_total{{stage="{_escape(name)}"}} {_number(s)}' for name, (s, _) in items]
+        lines += ["# HELP j1939_stage_calls_total Calls of each generation stage.",
+                  "# TYPE j1939_stage_calls_total counter"]
+        lines += [f'j1939_stage_calls_total{{stage="{_escape(name)}"}} {n}' for name, (_, n) in items]
+        return lines
+
+# --- REGISTRY ---
+
+STAGES = StageTotals()
+FRAMES = Counter("j1939_frames_generated_total", "Periodic frames generated.")
+BYTES = Counter("j1939_bytes_written_total", "Response bytes written, by download format.", ("format",))
+REQUESTS = Counter("j1939_requests_total", "Downloads served, by format and cache result.", ("format", "cache"))
+REQUEST_SECONDS = Histogram("j1939_request_seconds", "Time to produce a whole download, by format.",
+                            ("format",))
+REQUEST_PEAK_BYTES = Histogram("j1939_request_peak_memory_bytes",
+                               "Peak traced memory of sampled downloads, by format.", ("format",),
+                               buckets=MEMORY_BUCKETS)
+
+METRICS = [STAGES, FRAMES, BYTES, REQUESTS, REQUEST_SECONDS, REQUEST_PEAK_BYTES]
+
+# Callables returning [(name, type, help, [(labels dict, value)])] at scrape time
+_collectors = []
+
+def register_collector(collect):
+    _collectors.append(collect)
+
+def stats_family(prefix, stats, help_text, counters=()):
+    """
+    Collector output for a flat stats() dict: one gauge per key, or a
+    counter (with a _total suffix) for the keys listed in counters.
+    """
+    families = []
+    for key, value in stats.items():
+        if not isinstance(value, (int, float)):
+            continue
+        kind = "counter" if key in counters else "gauge"
+        name = f"{prefix}_{key}_total" if kind == "counter" else f"{prefix}_{key}"
+        families.append((name, kind, f"{help_text} ({key}).", [({}, value)]))
+    return families
+
+def render():
+    """
+    All metrics in the Prometheus text format.
+    """
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for collect in _collectors:
+        for name, kind, help_text, samples in collect():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+# --- STAGE TIMERS ---
+
+class Profile:
+    """
+    Stage breakdown of one request: self seconds and calls per stage.
+    """
+    def __init__(self):
+        self.stages = {}
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.peak_bytes = None
+
+    def add(self, name, seconds):
+        entry = self.stages.get(name)
+        if entry is None:
+            self.stages[name] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+
+    def to_dict(self):
+        return {
+            "seconds": self.seconds,
+            "peak_bytes": self.peak_bytes,
+            "stages": {name: {"seconds": s, "calls": n} for name, (s, n) in self.stages.items()},
+        }
+
+    def server_timing(self):
+        """
+        Server-Timing header value; durations in milliseconds, "other" is
+        the time outside any stage.
+        """
+        parts = [f"{name};dur={s * 1000:.3f}" for name, (s, _) in sorted(self.stages.items(), key=lambda i: -i[1][0])]
+        if self.seconds is not None:
+            other = self.seconds - sum(s for s, _ in self.stages.values())
+            parts.append(f"other;dur={max(other, 0) * 1000:.3f}")
+            parts.append(f"total;dur={self.seconds * 1000:.3f}")
+        if self.peak_bytes is not None:
+            parts.append(f'memory;desc="peak {self.peak_bytes / 2**20:.1f} MB"')
+        return ", ".join(parts)
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+class _Stage:
+    __slots__ = ("name", "start", "child")
+
+    def __init__(self, name):
+        self.name = name
+        self.child = 0.0
+
+    def __enter__(self):
+        _stack().append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        stack = _local.stack
+        stack.pop()
+        if stack:
+            stack[-1].child += elapsed
+        own = elapsed - self.child
+        STAGES.add(self.name, own)
+        profile = getattr(_local, "profile", None)
+        if profile is not None:
+            profile.add(self.name, own)
+        return False
+
+def stage(name):
+    """
+    Context manager timing the enclosed block as stage name.
+    """
+    return _Stage(name) if ENABLED else _NO_STAGE
+
+def staged(name):
+    """
+    Decorator timing every call of the function as stage name.
+    """
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def timed_iter(name, iterable):
+    """
+    Yields from iterable, timing each step as stage name.
+    """
+    if not ENABLED:
+        yield from iterable
+        return
+    it = iter(iterable)
+    while True:
+        with _Stage(name):
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+        yield item
+
+# --- REQUESTS ---
+
+_memory_lock = threading.Lock()
+# Held by the one request that owns tracemalloc
+_trace_lock = threading.Lock()
+_sampled = 0
+
+def sample_memory():
+    """
+    True for every MEMORY_SAMPLE-th call.
+    """
+    global _sampled
+    if not ENABLED or MEMORY_SAMPLE <= 0:
+        return False
+    with _memory_lock:
+        _sampled += 1
+        return _sampled % MEMORY_SAMPLE == 0
+
+def observe_download(chunks, file_format, cache_status="none", profile=None, trace_memory=False):
+    """
+    Yields the byte chunks of a download while counting its bytes. Once
+    they run out, records the request latency and, with trace_memory, its
+    peak traced memory. profile is activated on the thread around every
+    step so it collects the stages that produce the chunks.
+    """
+    if not ENABLED:
+        yield from chunks
+        return
+
+    tracing = trace_memory and _trace_lock.acquire(blocking=False)
+    if tracing:
+        tracemalloc.start()
+    started = time.perf_counter()
+    written = 0
+    it = iter(chunks)
+    try:
+        while True:
+            previous = getattr(_local, "profile", None)
+            _local.profile = profile
+            try:
+                chunk = next(it)
+            except StopIteration:
+                break
+            finally:
+                _local.profile = previous
+            written += len(chunk)
+            yield chunk
+    finally:
+        BYTES.inc(written, file_format)
+        REQUESTS.inc(1, file_format, cache_status)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, file_format)
+        if tracing:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            _trace_lock.release()
+            REQUEST_PEAK_BYTES.observe(peak, file_format)
+            if profile is not None:
+                profile.peak_bytes = peak
+        if profile is not None:
+            profile.finish()
@@ -0,0 +1,63 @@
+"""
+Seeded, index-addressable noise streams.
+
+Every SPN draws from its own np.random.Generator stream derived from
+(seed, spn_id). The stream is cut into fixed-size blocks, each seeded
+independently, so samples [start:stop] can be produced without drawing
+everything before start: window-by-window or sliced generation gives the
+same values as one full run with the same seed.
+"""
+import numpy as np
+
+NOISE_BLOCK = 4096
+
+def new_seed():
+    """
+    Fresh random seed for runs that did not ask for one.
+    """
+    return int(np.random.SeedSequence().entropy)
+
+def parse_seed(value):
+    """
+    A user-supplied seed as an int. Raises ValueError unless it is a
+    non-negative integer, the only seeds SeedSequence takes.
+    """
+    try:
+        seed = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid seed {value!r}") from None
+    if seed < 0:
+        raise ValueError(f"seed must not be negative, got {seed}")
+    return seed
+
+def standard_normal(seed, stream_id, start, stop):
+    """
+    Standard normal samples [start:stop] of stream stream_id under seed.
+    """
+    if stop <= start:
+        return np.zeros(0)
+
+    first, last = start // NOISE_BLOCK, (stop - 1) // NOISE_BLOCK
+    blocks = []
+    for block in range(first, last + 1):
+        seq = np.random.SeedSequence(seed, spawn_key=(stream_id, block))
+        blocks.append(np.random.Generator(np.random.PCG64(seq)).standard_normal(NOISE_BLOCK))
+
+    offset = first * NOISE_BLOCK
+    return np.concatenate(blocks)[start - offset:stop - offset]
+
+class SampleNoise:
+    """
+    Noise for one SPN over samples [start:stop], with the
+    np.random.normal(loc, scale, size) call shape the patterns use.
+    """
+    def __init__(self, seed, stream_id, start, stop):
+        self.seed = seed
+        self.stream_id = stream_id
+        self.start = start
+        self.stop = stop
+
+    def normal(self, loc, scale, size):
+        if size != self.stop - self.start:
+            raise ValueError(f"noise requested for {size} samples, window has {self.stop - self.start}")
+        return loc + scale * standard_normal(self.seed, self.stream_id, self.start, self.stop)
@@ -0,0 +1,125 @@
+"""
+Time-sliced parallel generation of a single run.
+
+The time axis is cut into slices that worker processes generate
+independently. Patterns are evaluated on the absolute time axis and noise
+comes from index-addressable streams (see noise.py), so every slice is
+exactly the corresponding part of a single-process run. Workers write
+frames and signal values into one shared-memory segment laid out by the
+parent; slices are already in timeline order and are joined by position,
+without a global sort.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from frames import FRAME_DTYPE, FrameStore, SignalTable
+
+# Slices per worker; more slices even out uneven PGN density over time
+SLICES_PER_WORKER = 4
+
+def attach_shared(name):
+    """
+    Attaches to a segment created by the parent. Pool workers share the
+    parent's resource tracker, and the parent unlinks the segment when done.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no track flag
+        return shared_memory.SharedMemory(name=name)
+
+class SharedLayout:
+    """
+    Named arrays packed into one shared-memory segment.
+    """
+    def __init__(self):
+        self.regions = {}
+        self.size = 0
+
+    def add(self, name, dtype, shape):
+        dtype = np.dtype(dtype)
+        self.size = -(-self.size // 8) * 8
+        self.regions[name] = (self.size, dtype, shape)
+        self.size += dtype.itemsize * int(np.prod(shape))
+
+    def views(self, buf):
+        return {
+            name: np.ndarray(shape, dtype=dtype, buffer=buf, offset=offset)
+            for name, (offset, dtype, shape) in self.regions.items()
+        }
+
+def _write_slice(buf, job):
+    arrays = job['layout'].views(buf)
+    store = job['engine'].generate_slice(job['ranges'], job['duration_sec'], job['seed'], signals=job['signals'])
+
+    offset = job['offset']
+    arrays['frames'][offset:offset + len(store)] = store.frames
+    for pgn_id, table in store.signals.items():
+        start, stop = job['ranges'][pgn_id]
+        arrays[f"index_{pgn_id}"][start:stop] = table.frame_index + offset
+        arrays[f"values_{pgn_id}"][:, start:stop] = table.values
+
+def _slice_worker(job):
+    shm = attach_shared(job['shm_name'])
+    try:
+        # Views into shm.buf must be gone before close(), hence the helper
+        _write_slice(shm.buf, job)
+    finally:
+        shm.close()
+    return job['offset']
+
+def _collect(buf, layout, engine, selected_pgns, total, path, signals):
+    arrays = layout.views(buf)
+    store = FrameStore.allocate(total, path)
+    store.frames[:] = arrays['frames']
+
+    if signals:
+        for pgn_id in selected_pgns:
+            spec = engine.codec.pgn(pgn_id)
+            store.signals[pgn_id] = SignalTable(
+                pgn_id, spec.spn_ids, spec.names, [s.unit for s in spec.spns],
+                arrays[f"index_{pgn_id}"].copy(), arrays[f"values_{pgn_id}"].copy()
+            )
+    return store
+
+def generate_sliced(engine, selected_pgns, duration_sec, seed, workers=None, slices=None, path=None, signals=True):
+    """
+    engine.generate_frames() computed in time slices on a process pool.
+    """
+    workers = workers or os.cpu_count() or 1
+    counts = {
+        pgn_id: engine.sample_count(duration_sec, engine.codec.pgn(pgn_id).cycle_time_ms)
+        for pgn_id in selected_pgns
+    }
+    end_ms = max([counts[p] * engine.codec.pgn(p).cycle_time_ms for p in selected_pgns], default=0)
+    slices = slices or workers * SLICES_PER_WORKER
+    all_ranges = list(engine.time_slices(selected_pgns, duration_sec, -(-end_ms // slices)))
+
+    total = sum(counts.values())
+    layout = SharedLayout()
+    layout.add('frames', FRAME_DTYPE, (total,))
+    if signals:
+        for pgn_id in selected_pgns:
+            layout.add(f"index_{pgn_id}", np.int64, (counts[pgn_id],))
+            layout.add(f"values_{pgn_id}", np.float64, (len(engine.codec.pgn(pgn_id).spn_ids), counts[pgn_id]))
+
+    shm = shared_memory.SharedMemory(create=True, size=max(layout.size, 1))
+    try:
+        jobs = []
+        offset = 0
+        for ranges in all_ranges:
+            jobs.append({
+                "engine": engine, "layout": layout, "shm_name": shm.name, "ranges": ranges,
+                "offset": offset, "duration_sec": duration_sec, "seed": seed, "signals": signals,
+            })
+            offset += sum(stop - start for start, stop in ranges.values())
+
+        with ProcessPoolExecutor(max_workers=min(workers, max(len(jobs), 1))) as pool:
+            list(pool.map(_slice_worker, jobs))
+
+        store = _collect(shm.buf, layout, engine, selected_pgns, total, path, signals)
+    finally:
+        shm.close()
+        shm.unlink()
+    return store
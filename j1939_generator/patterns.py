@@ -0,0 +1,61 @@
+"""
+Signal pattern library used by J1939Engine.get_smart_pattern.
+
+Every pattern takes the time axis t (seconds), the compiled SPN spec and
+the SPN's noise stream (noise.SampleNoise) and returns the physical values
+before the final clip to the SPN's min/max.
+select_pattern() maps an SPN name to its pattern once, when the codec is
+compiled, instead of on every generation call.
+"""
+import numpy as np
+
+def engine_speed(t, spec, noise):
+    pattern = 600 + 1000 * np.sin(0.1 * t) + 200 * noise.normal(0, 0.1, len(t))
+    return np.clip(pattern, 600, 2500)
+
+def vehicle_speed(t, spec, noise):
+    return 100 * (1 - np.exp(-0.1 * t))
+
+def throttle(t, spec, noise):
+    pattern = 50 + 40 * np.sin(0.2 * t)
+    return np.clip(pattern, 0, 100)
+
+def coolant_temperature(t, spec, noise):
+    return 80 + 10 * (1 - np.exp(-0.05 * t)) + noise.normal(0, 0.2, len(t))
+
+def temperature(t, spec, noise):
+    return 90 + 10 * (1 - np.exp(-0.05 * t)) + noise.normal(0, 0.2, len(t))
+
+def pressure(t, spec, noise):
+    base_p = 300
+    return base_p + 100 * np.sin(0.1 * t)
+
+def level(t, spec, noise):
+    return 100 - (0.5 * t)
+
+def default(t, spec, noise):
+    mid = (spec.max - spec.min) / 2
+    amp = mid * 0.5
+    return mid + amp * np.sin(t)
+
+def select_pattern(name):
+    """
+    Automatically selects the best pattern based on the SPN name.
+    """
+    name = name.lower()
+
+    # --- SMART LOGIC ---
+
+    if "speed" in name and "engine" in name:
+        return engine_speed
+    elif "vehicle speed" in name:
+        return vehicle_speed
+    elif "throttle" in name or "demand" in name:
+        return throttle
+    elif "temperature" in name:
+        return coolant_temperature if "coolant" in name else temperature
+    elif "pressure" in name:
+        return pressure
+    elif "level" in name:
+        return level
+    return default
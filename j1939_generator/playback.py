@@ -0,0 +1,261 @@
+"""
+Real-time playback of a generated frame timeline.
+
+PlaybackEngine walks FrameStore windows (engine.iter_frames, a fleet trace,
+...) and sends every frame when it is due, at the timestamps the engine
+derived from each PGN's cycle_time_ms. Due times are absolute offsets from
+the start of playback, so timing errors never accumulate into drift. Frames
+sharing a timestamp go out together after a single wake-up.
+
+Sinks take frames in the 16-byte SocketCAN `struct can_frame` layout, so
+UDP, Unix datagram and SocketCAN outputs share one interface.
+"""
+import abc
+import asyncio
+import socket
+import time
+from urllib.parse import urlparse
+import numpy as np
+
+CAN_EFF_FLAG = 0x80000000
+
+# struct can_frame: can_id (with EFF flag), dlc, 3 pad bytes, 8 data bytes
+CAN_FRAME_DTYPE = np.dtype([
+    ('can_id', '<u4'),
+    ('dlc', 'u1'),
+    ('pad', 'u1', (3,)),
+    ('data', 'u1', (8,)),
+])
+
+# Frames later than this count as late in the report
+LATE_THRESHOLD_SEC = 0.001
+
+# Sleep this much short of a due time, then spin, to beat timer resolution
+SPIN_SEC = 0.0002
+
+def encode_can_frames(frames):
+    """
+    FrameStore frames -> list of 16-byte SocketCAN frames.
+    """
+    out = np.zeros(len(frames), dtype=CAN_FRAME_DTYPE)
+    out['can_id'] = frames['can_id'] | CAN_EFF_FLAG
+    out['dlc'] = frames['dlc']
+    out['data'] = frames['data']
+    raw = out.tobytes()
+    size = CAN_FRAME_DTYPE.itemsize
+    return [raw[i:i + size] for i in range(0, len(raw), size)]
+
+# --- SINKS ---
+
+class FrameSink(abc.ABC):
+    """
+    Destination for encoded CAN frames.
+    """
+    @abc.abstractmethod
+    def send(self, frame):
+        """
+        Sends one 16-byte SocketCAN frame.
+        """
+
+    def send_many(self, frames):
+        for frame in frames:
+            self.send(frame)
+
+    def close(self):
+        pass
+
+class NullSink(FrameSink):
+    """
+    Discards frames; measures the scheduler alone.
+    """
+    def send(self, frame):
+        pass
+
+    def send_many(self, frames):
+        pass
+
+class UDPSink(FrameSink):
+    def __init__(self, host, port):
+        self.address = (host, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, frame):
+        self.sock.sendto(frame, self.address)
+
+    def close(self):
+        self.sock.close()
+
+class UnixSink(FrameSink):
+    def __init__(self, path):
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    def send(self, frame):
+        self.sock.sendto(frame, self.path)
+
+    def close(self):
+        self.sock.close()
+
+class SocketCANSink(FrameSink):
+    def __init__(self, interface):
+        if not hasattr(socket, "AF_CAN"):
+            raise RuntimeError("SocketCAN is not available on this platform")
+        self.sock = socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+        self.sock.bind((interface,))
+
+    def send(self, frame):
+        self.sock.send(frame)
+
+    def close(self):
+        self.sock.close()
+
+def open_sink(url):
+    """
+    Sink from a URL: udp://host:port, unix:///path/to/socket, can://vcan0
+    or null://.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == "udp":
+        return UDPSink(parsed.hostname or "127.0.0.1", parsed.port)
+    if parsed.scheme == "unix":
+        return UnixSink(parsed.path)
+    if parsed.scheme == "can":
+        return SocketCANSink(parsed.netloc or parsed.path.lstrip("/"))
+    if parsed.scheme == "null":
+        return NullSink()
+    raise ValueError(f"Unsupported sink '{url}' (use udp://, unix://, can:// or null://)")
+
+# --- TIMING STATS ---
+
+class LatencyHistogram:
+    """
+    Log-binned histogram of send lateness, constant memory for any run length.
+    """
+    # 1 us .. ~100 s in 5% steps
+    EDGES = 1e-6 * 1.05 ** np.arange(0, 380)
+
+    def __init__(self):
+        self.counts = np.zeros(len(self.EDGES) + 1, dtype=np.int64)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, lateness, count=1):
+        lateness = max(float(lateness), 0.0)
+        self.counts[np.searchsorted(self.EDGES, lateness)] += count
+        self.total += count
+        self.sum += lateness * count
+        self.max = max(self.max, lateness)
+
+    def percentile(self, q):
+        if not self.total:
+            return 0.0
+        rank = np.searchsorted(np.cumsum(self.counts), q / 100 * self.total)
+        return float(self.EDGES[min(rank, len(self.EDGES) - 1)])
+
+class PlaybackStats:
+    def __init__(self):
+        self.frames = 0
+        self.late_frames = 0
+        self.wakeups = 0
+        self.lateness = LatencyHistogram()
+        self.started = None
+        self.finished = None
+
+    def to_dict(self):
+        elapsed = (self.finished or time.perf_counter()) - (self.started or time.perf_counter())
+        return {
+            "frames": self.frames,
+            "late_frames": self.late_frames,
+            "wakeups": self.wakeups,
+            "elapsed_sec": round(elapsed, 3),
+            "frames_per_sec": round(self.frames / elapsed, 1) if elapsed > 0 else 0.0,
+            "jitter_p50_ms": round(self.lateness.percentile(50) * 1e3, 3),
+            "jitter_p99_ms": round(self.lateness.percentile(99) * 1e3, 3),
+            "jitter_max_ms": round(self.lateness.max * 1e3, 3),
+            "jitter_mean_ms": round(self.lateness.sum / self.lateness.total * 1e3, 3) if self.lateness.total else 0.0,
+        }
+
+# --- SCHEDULER ---
+
+class PlaybackEngine:
+    def __init__(self, sink, rate=1.0, late_threshold_sec=LATE_THRESHOLD_SEC):
+        """
+        rate scales simulated time against the wall clock (10 = ten times
+        faster); None or 0 sends as fast as possible.
+        """
+        self.sink = sink
+        self.rate = rate or None
+        self.late_threshold_sec = late_threshold_sec
+        self.stats = PlaybackStats()
+
+    async def play(self, windows):
+        """
+        Sends every frame of the FrameStore windows on time. The next window
+        is generated in a worker thread while the current one plays.
+        """
+        loop = asyncio.get_running_loop()
+        windows = iter(windows)
+        stats = self.stats
+
+        store = await loop.run_in_executor(None, next, windows, None)
+        # The clock starts once the first window is ready to go out
+        stats.started = time.perf_counter()
+        while store is not None:
+            pending = loop.run_in_executor(None, next, windows, None)
+            await self._play_store(store)
+            store = await pending
+
+        stats.finished = time.perf_counter()
+        return stats
+
+    async def _play_store(self, store):
+        frames = store.frames
+        if not len(frames):
+            return
+        encoded = encode_can_frames(frames)
+        time_us = frames['time_us']
+
+        # One group per distinct timestamp; the timeline is already ordered
+        bounds = np.flatnonzero(np.diff(time_us)) + 1
+        starts = np.concatenate(([0], bounds))
+        stops = np.concatenate((bounds, [len(frames)]))
+
+        for start, stop in zip(starts.tolist(), stops.tolist()):
+            if self.rate is None:
+                self.sink.send_many(encoded[start:stop])
+                self.stats.frames += stop - start
+                if self.stats.wakeups % 256 == 0:
+                    await asyncio.sleep(0)
+                self.stats.wakeups += 1
+                continue
+
+            due = self.stats.started + (time_us[start] / 1e6) / self.rate
+            await self._wait_until(due)
+            self.sink.send_many(encoded[start:stop])
+            self._record(time.perf_counter() - due, stop - start)
+
+    async def _wait_until(self, due):
+        delay = due - time.perf_counter()
+        if delay > SPIN_SEC:
+            await asyncio.sleep(delay - SPIN_SEC)
+        while time.perf_counter() < due:
+            pass
+
+    def _record(self, lateness, count):
+        stats = self.stats
+        stats.frames += count
+        stats.wakeups += 1
+        stats.lateness.add(lateness, count)
+        if lateness > self.late_threshold_sec:
+            stats.late_frames += count
+
+def play(windows, sink, rate=1.0):
+    """
+    Blocking helper: plays windows into sink and returns the stats.
+    """
+    engine = PlaybackEngine(sink, rate)
+    try:
+        return asyncio.run(engine.play(windows))
+    finally:
+        sink.close()
@@ -0,0 +1,328 @@
+"""
+Drive-cycle scenarios: coupled signal models driven by a declarative cycle.
+
+A Scenario is a list of segments,
+
+    idle        standing still, engine at idle
+    accelerate  to to_kmh (or at a fixed throttle %)
+    cruise      hold the entry speed, or settle at speed_kmh
+    brake       to to_kmh (default 0), or at decel_mps2
+
+and every signal follows from the vehicle speed it produces: throttle is
+what a first-order vehicle model needs for that speed curve, the gear comes
+from the shift schedule, engine speed from the gear ratio, torque from the
+throttle and fuel rate from torque and engine speed. Within a segment the
+speed has a closed form, so all channels are computed with whole-array
+numpy ops on any time axis, window by window, with no per-sample loop.
+
+Evaluated channels are cached per (scenario, time axis): SPNs of one PGN
+share one evaluation, and repeated runs of a scenario cost nothing.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+IDLE, ACCELERATE, CRUISE, BRAKE = "idle", "accelerate", "cruise", "brake"
+MODES = (IDLE, ACCELERATE, CRUISE, BRAKE)
+
+# --- VEHICLE ---
+
+# Speed reached at 100 % throttle, and the time constant of getting there
+VMAX_KMH = 110.0
+DRIVE_TAU_SEC = 12.0
+# Coasting down with the throttle closed
+COAST_TAU_SEC = 25.0
+
+IDLE_RPM = 650.0
+# Clutch slip while launching in first gear, at full throttle
+LAUNCH_RPM = 900.0
+WHEEL_RADIUS_M = 0.5
+FINAL_DRIVE = 3.7
+GEAR_RATIOS = np.array([6.0, 3.6, 2.3, 1.5, 1.0, 0.8])
+# Upshift speeds from gear n to n + 1
+SHIFT_KMH = np.array([12.0, 24.0, 38.0, 55.0, 72.0])
+
+IDLE_TORQUE_PCT = 7.0
+ENGINE_BRAKE_PCT = -12.0
+# Engine reference torque (SPN 544), 100 % of the percent-torque SPNs
+REFERENCE_TORQUE_NM = 1000.0
+IDLE_FUEL_LPH = 2.0
+BSFC_G_PER_KWH = 210.0
+DIESEL_G_PER_L = 835.0
+
+CHANNELS = ("vehicle_speed", "throttle", "gear", "engine_speed", "demand_torque",
+            "torque", "torque_fraction", "fuel_rate", "fuel_economy")
+
+# Sensor noise added per SPN (standard deviation, in channel units)
+CHANNEL_NOISE = {"engine_speed": 4.0, "vehicle_speed": 0.05}
+
+# --- BUILT-IN CYCLES ---
+
+DRIVE_CYCLES = {
+    "urban": [
+        {"mode": IDLE, "duration_s": 15},
+        {"mode": ACCELERATE, "duration_s": 20, "to_kmh": 50},
+        {"mode": CRUISE, "duration_s": 40},
+        {"mode": BRAKE, "duration_s": 12},
+        {"mode": IDLE, "duration_s": 20},
+        {"mode": ACCELERATE, "duration_s": 15, "to_kmh": 35},
+        {"mode": CRUISE, "duration_s": 25},
+        {"mode": BRAKE, "duration_s": 10},
+    ],
+    "highway": [
+        {"mode": IDLE, "duration_s": 10},
+        {"mode": ACCELERATE, "duration_s": 60, "to_kmh": 88},
+        {"mode": CRUISE, "duration_s": 300},
+        {"mode": CRUISE, "duration_s": 60, "speed_kmh": 70},
+        {"mode": ACCELERATE, "duration_s": 40, "to_kmh": 90},
+        {"mode": CRUISE, "duration_s": 240},
+        {"mode": BRAKE, "duration_s": 35},
+    ],
+    "idle": [
+        {"mode": IDLE, "duration_s": 60},
+    ],
+}
+
+class Segment:
+    """
+    One drive-cycle segment. Within it the speed (m/s) is either a
+    first-order approach to v_target with time constant tau, or a linear
+    ramp down at decel to v_floor.
+    """
+    def __init__(self, mode, duration_s, to_kmh=None, speed_kmh=None, throttle=None, decel_mps2=None):
+        if mode not in MODES:
+            raise ValueError(f"unknown segment mode {mode!r}, expected one of {MODES}")
+        if duration_s <= 0:
+            raise ValueError(f"{mode} segment needs a positive duration_s")
+        self.mode = mode
+        self.duration_s = float(duration_s)
+        self.to_kmh = to_kmh
+        self.speed_kmh = speed_kmh
+        self.throttle = throttle
+        self.decel_mps2 = decel_mps2
+
+    @classmethod
+    def from_dict(cls, spec):
+        def number(name):
+            return float(spec[name]) if spec.get(name) is not None else None
+        return cls(spec['mode'], float(spec['duration_s']), number('to_kmh'), number('speed_kmh'),
+                   number('throttle'), number('decel_mps2'))
+
+    def to_dict(self):
+        spec = {"mode": self.mode, "duration_s": self.duration_s}
+        for name in ("to_kmh", "speed_kmh", "throttle", "decel_mps2"):
+            if getattr(self, name) is not None:
+                spec[name] = getattr(self, name)
+        return spec
+
+    def plan(self, v0):
+        """
+        (kind, v_target or v_floor, tau or decel) for this segment entered
+        at speed v0 (m/s).
+        """
+        vmax = VMAX_KMH / 3.6
+        if self.mode == IDLE:
+            return "lag", 0.0, COAST_TAU_SEC
+        if self.mode == BRAKE:
+            floor = (self.to_kmh or 0.0) / 3.6
+            decel = self.decel_mps2 if self.decel_mps2 is not None else max(v0 - floor, 0.0) / self.duration_s
+            return "ramp", floor, decel
+        if self.mode == CRUISE:
+            target = v0 if self.speed_kmh is None else self.speed_kmh / 3.6
+            return "lag", min(target, vmax), DRIVE_TAU_SEC
+
+        if self.throttle is not None:
+            return "lag", vmax * min(max(self.throttle, 0.0), 100.0) / 100, DRIVE_TAU_SEC
+        # Steady-state speed whose approach curve reaches to_kmh at the end
+        decay = np.exp(-self.duration_s / DRIVE_TAU_SEC)
+        target = (((self.to_kmh or VMAX_KMH) / 3.6) - v0 * decay) / (1 - decay)
+        return "lag", min(max(target, 0.0), vmax), DRIVE_TAU_SEC
+
+class Scenario:
+    """
+    A drive cycle, repeated for as long as the run lasts when repeat is
+    set; otherwise the vehicle idles after the last segment. Every
+    repetition starts from standstill.
+    """
+    def __init__(self, segments, name="custom", repeat=True):
+        if not segments:
+            raise ValueError("scenario has no segments")
+        self.name = name
+        self.segments = list(segments)
+        self.repeat = repeat
+
+        # Segment table: start time, entry speed and plan of each segment
+        self.starts = np.cumsum([0.0] + [s.duration_s for s in self.segments])
+        kinds, targets, rates, v0s = [], [], [], []
+        v = 0.0
+        for segment in self.segments:
+            kind, target, rate = segment.plan(v)
+            kinds.append(kind == "ramp")
+            targets.append(target)
+            rates.append(rate)
+            v0s.append(v)
+            v = float(_speed(kind == "ramp", v, target, rate, segment.duration_s))
+        self._ramp = np.array(kinds + [False])
+        self._target = np.array(targets + [0.0])
+        self._rate = np.array(rates + [COAST_TAU_SEC])
+        self._v0 = np.array(v0s + [v])
+        self.key = json.dumps([name, repeat, [s.to_dict() for s in self.segments]], sort_keys=True)
+
+    @classmethod
+    def from_dict(cls, spec):
+        """
+        Scenario from {"name", "segments": [...], "repeat"}, or a bare list
+        of segment dicts.
+        """
+        if isinstance(spec, list):
+            spec = {"segments": spec}
+        segments = [Segment.from_dict(s) for s in spec['segments']]
+        return cls(segments, spec.get('name', "custom"), spec.get('repeat', True))
+
+    def to_dict(self):
+        return {"name": self.name, "repeat": self.repeat, "segments": [s.to_dict() for s in self.segments]}
+
+    @classmethod
+    def named(cls, name):
+        if name not in DRIVE_CYCLES:
+            raise ValueError(f"unknown drive cycle {name!r}, expected one of {sorted(DRIVE_CYCLES)}")
+        return cls([Segment.from_dict(s) for s in DRIVE_CYCLES[name]], name)
+
+    @classmethod
+    def load(cls, source):
+        """
+        Built-in cycle by name, or a JSON scenario file.
+        """
+        if source in DRIVE_CYCLES:
+            return cls.named(source)
+        with open(source) as f:
+            return cls.from_dict(json.load(f))
+
+    @property
+    def cycle_sec(self):
+        return float(self.starts[-1])
+
+    def evaluate(self, t):
+        """
+        Every channel at times t (seconds), as {channel: array}.
+        """
+        t = np.asarray(t, dtype=np.float64)
+        if self.repeat:
+            t = np.mod(t, self.cycle_sec)
+        # Past the end of a one-shot cycle: the idle row after the last segment
+        seg = np.searchsorted(self.starts, t, side='right') - 1
+        seg = np.clip(seg, 0, len(self.segments))
+        tau = t - self.starts[seg]
+
+        ramp = self._ramp[seg]
+        v = _speed(ramp, self._v0[seg], self._target[seg], self._rate[seg], tau)
+        throttle = np.where(ramp, 0.0, 100 * self._target[seg] / (VMAX_KMH / 3.6))
+        kmh = v * 3.6
+
+        gear = np.searchsorted(SHIFT_KMH, kmh, side='right')
+        wheel_rpm = v / WHEEL_RADIUS_M * 60 / (2 * np.pi)
+        rpm = wheel_rpm * GEAR_RATIOS[gear] * FINAL_DRIVE
+        launch = np.where(gear == 0, IDLE_RPM + LAUNCH_RPM * throttle / 100, IDLE_RPM)
+        rpm = np.maximum(rpm, launch)
+
+        # Closed throttle while rolling: engine braking with fuel cut-off
+        overrun = (throttle == 0) & (v > 0.5)
+        torque = np.where(overrun, ENGINE_BRAKE_PCT, np.maximum(throttle, IDLE_TORQUE_PCT))
+        power_kw = np.maximum(torque, 0) / 100 * REFERENCE_TORQUE_NM * rpm * 2 * np.pi / 60 / 1000
+        fuel = np.where(overrun, 0.0, np.maximum(power_kw * BSFC_G_PER_KWH / DIESEL_G_PER_L, IDLE_FUEL_LPH))
+        economy = np.divide(kmh, fuel, out=np.full_like(kmh, np.inf), where=fuel > 0)
+
+        return {
+            "vehicle_speed": kmh,
+            "throttle": throttle,
+            "gear": gear + (v > 0.1),
+            "engine_speed": rpm,
+            "demand_torque": throttle,
+            "torque": torque,
+            "torque_fraction": np.floor((torque - np.floor(torque)) * 8) / 8,
+            "fuel_rate": fuel,
+            "fuel_economy": economy,
+        }
+
+def _speed(ramp, v0, target, rate, tau):
+    """
+    Speed tau seconds into a segment: linear ramp down to target at rate,
+    or first-order approach to target with time constant rate.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        down = np.maximum(v0 - rate * tau, target)
+        lag = target + (v0 - target) * np.exp(-tau / rate)
+    return np.where(ramp, down, lag)
+
+def select_channel(name):
+    """
+    Scenario channel that drives an SPN, from its name, or None for SPNs
+    the scenario does not model (they keep their pattern).
+    """
+    name = name.lower()
+    if "torque" in name:
+        if "mode" in name:
+            return None
+        if "demand" in name:
+            return "demand_torque"
+        return "torque_fraction" if "high res" in name else "torque"
+    if "speed" in name and "engine" in name:
+        return "engine_speed"
+    if "vehicle speed" in name:
+        return "vehicle_speed"
+    if "throttle" in name or "accelerator pedal" in name:
+        return "throttle"
+    if "fuel rate" in name:
+        return "fuel_rate"
+    if "fuel economy" in name:
+        return "fuel_economy"
+    if "current gear" in name or "selected gear" in name:
+        return "gear"
+    return None
+
+# --- CACHE ---
+
+class ScenarioCache:
+    """
+    LRU cache of evaluated channels, keyed on (scenario, time axis) and
+    bounded by total bytes.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def channels(self, scenario, t, axis):
+        """
+        scenario.evaluate(t); axis is a hashable description of t.
+        """
+        key = (scenario.key, axis)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        channels = scenario.evaluate(t)
+        size = sum(a.nbytes for a in channels.values())
+        if size <= self.max_bytes:
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = channels
+                    self._bytes += size
+                while self._bytes > self.max_bytes:
+                    _, old = self._entries.popitem(last=False)
+                    self._bytes -= sum(a.nbytes for a in old.values())
+        return channels
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+cache = ScenarioCache(int(os.environ.get("J1939_SCENARIO_CACHE_MB", 64)) * 2**20)
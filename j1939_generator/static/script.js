@@ -1,36 +1,132 @@
+const POLL_INTERVAL_MS = 500;
+const SEARCH_DELAY_MS = 250;
+const COMPRESSION_EXTENSIONS = { gzip: '.gz', zstd: '.zst' };
+
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+// Checked PGNs survive paging and searching, so they live here, not in the DOM
+const selectedPgns = new Set();
+const pager = { page: 1, query: '', total: 0, perPage: 50 };
+
+function renderPgns(pgns) {
+    const list = document.getElementById('pgn-list');
+    list.innerHTML = '';
+    for (const pgn of pgns) {
+        const item = document.createElement('div');
+        item.className = 'pgn-item';
+        const box = document.createElement('input');
+        box.type = 'checkbox';
+        box.id = `pgn_${pgn.id}`;
+        box.value = pgn.id;
+        box.checked = selectedPgns.has(String(pgn.id));
+        const label = document.createElement('label');
+        label.htmlFor = box.id;
+        label.style.display = 'inline';
+        label.style.fontWeight = 'normal';
+        label.textContent = `${pgn.name} (PGN ${pgn.id})`;
+        item.append(box, label);
+        list.appendChild(item);
+    }
+}
+
+function updatePager() {
+    const pages = Math.max(1, Math.ceil(pager.total / pager.perPage));
+    document.getElementById('pgn-page-info').innerText =
+        `Page ${pager.page} of ${pages} (${pager.total} PGNs, ${selectedPgns.size} selected)`;
+    document.getElementById('pgn-prev').disabled = pager.page <= 1;
+    document.getElementById('pgn-next').disabled = pager.page >= pages;
+}
+
+async function loadPgnPage(page) {
+    const params = new URLSearchParams({ page: page, per_page: pager.perPage, q: pager.query });
+    const response = await fetch(`/pgns?${params}`);
+    if (!response.ok) {
+        return;
+    }
+    const result = await response.json();
+    pager.page = result.page;
+    pager.total = result.total;
+    renderPgns(result.pgns);
+    updatePager();
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    const pagerEl = document.getElementById('pgn-pager');
+    pager.total = Number(pagerEl.dataset.total);
+    pager.perPage = Number(pagerEl.dataset.perPage);
+    updatePager();
+
+    document.getElementById('pgn-list').addEventListener('change', (event) => {
+        if (event.target.type === 'checkbox') {
+            event.target.checked ? selectedPgns.add(event.target.value) : selectedPgns.delete(event.target.value);
+            updatePager();
+        }
+    });
+    document.getElementById('pgn-prev').addEventListener('click', () => loadPgnPage(pager.page - 1));
+    document.getElementById('pgn-next').addEventListener('click', () => loadPgnPage(pager.page + 1));
+
+    let searchTimer = null;
+    document.getElementById('pgn-search').addEventListener('input', (event) => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => {
+            pager.query = event.target.value.trim();
+            loadPgnPage(1);
+        }, SEARCH_DELAY_MS);
+    });
+});
+
 async function generateData() {
-    const checkboxes = document.querySelectorAll('input[type="checkbox"]:checked');
-    const selectedPgns = Array.from(checkboxes).map(cb => cb.value);
+    const pgns = Array.from(selectedPgns);
     const format = document.getElementById('format').value;
+    const compression = document.getElementById('compression').value;
     const duration = document.getElementById('duration').value;
+    const seed = document.getElementById('seed').value;
 
-    if (selectedPgns.length === 0) {
+    if (pgns.length === 0) {
         alert("Please select at least one PGN!");
         return;
     }
 
-    const button = document.querySelector('button');
+    const button = document.getElementById('generate');
     button.innerText = "Generating...";
     button.disabled = true;
 
     try {
-        const response = await fetch('/generate', {
+        const response = await fetch('/jobs', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ pgns: selectedPgns, format: format, duration: duration })
+            body: JSON.stringify({ pgns: pgns, format: format, compression: compression || null, duration: duration, seed: seed || null })
         });
 
-        if (response.ok) {
-            const blob = await response.blob();
-            const url = window.URL.createObjectURL(blob);
-            const a = document.createElement('a');
-            a.href = url;
-            a.download = `j1939_dataset.${format}`;
-            document.body.appendChild(a);
-            a.click();
-            a.remove();
-        } else {
+        if (response.status === 429) {
+            alert("The server is busy with other generations. Please try again shortly.");
+        } else if (!response.ok) {
             alert("Generation failed. Server returned error.");
+        } else {
+            let job = await response.json();
+
+            // Poll until the background job has written the file
+            while (job.status === 'queued' || job.status === 'running') {
+                button.innerText = `Generating... ${Math.floor(job.progress * 100)}%`;
+                await sleep(POLL_INTERVAL_MS);
+                const status = await fetch(`/jobs/${job.id}`);
+                if (!status.ok) {
+                    throw new Error(`Job status returned ${status.status}`);
+                }
+                job = await status.json();
+            }
+
+            if (job.status === 'done') {
+                // The browser downloads straight from the server (resumable via Range)
+                const a = document.createElement('a');
+                a.href = `/jobs/${job.id}/download`;
+                a.download = `j1939_dataset.${format}${COMPRESSION_EXTENSIONS[compression] || ''}`;
+                document.body.appendChild(a);
+                a.click();
+                a.remove();
+            } else {
+                alert(`Generation failed: ${job.error || "unknown error"}`);
+            }
         }
     } catch (error) {
         console.error(error);
@@ -0,0 +1,82 @@
+"""
+Timeline merging for per-PGN frame streams.
+
+Every PGN stream produced by the engine is already in time order, so the
+bus timeline is a k-way merge rather than a full sort. Frames that share a
+timestamp are ordered by CAN priority (lower value first), then PGN, then
+source address, which makes the output order reproducible.
+"""
+import heapq
+import numpy as np
+
+def can_priority(can_id):
+    """
+    3-bit J1939 priority field of a 29-bit CAN ID.
+    """
+    return (can_id >> 26) & 0x7
+
+def block_order(blocks):
+    """
+    PGNBlocks sorted by the tie-break rule: (priority, PGN, source address).
+    """
+    return sorted(blocks, key=lambda b: (can_priority(b.can_id), b.layout.pgn_id, b.can_id & 0xFF))
+
+def merge_index(streams):
+    """
+    Linear k-way merge of sorted timestamp arrays.
+
+    streams must already be in tie order. Returns the merged order as
+    indices into np.concatenate(streams); on equal timestamps the frame
+    from the earlier stream comes first.
+    """
+    runs = [(np.asarray(s), np.arange(len(s), dtype=np.int64)) for s in streams]
+    base = 0
+    for i, (times, idx) in enumerate(runs):
+        runs[i] = (times, idx + base)
+        base += len(times)
+
+    if not runs:
+        return np.zeros(0, dtype=np.int64)
+
+    # Pairwise merges of neighbouring runs keep the tie order stable
+    while len(runs) > 1:
+        merged = []
+        for i in range(0, len(runs) - 1, 2):
+            merged.append(_merge_pair(runs[i], runs[i + 1]))
+        if len(runs) % 2:
+            merged.append(runs[-1])
+        runs = merged
+
+    return runs[0][1]
+
+def _merge_pair(left, right):
+    """
+    Merges two sorted (times, index) runs; left wins ties.
+    """
+    l_times, l_idx = left
+    r_times, r_idx = right
+    total = len(l_times) + len(r_times)
+
+    # Final slot of every right-hand element; the rest belongs to the left run
+    r_pos = np.searchsorted(l_times, r_times, side='right') + np.arange(len(r_times))
+    is_right = np.zeros(total, dtype=bool)
+    is_right[r_pos] = True
+
+    times = np.empty(total, dtype=np.result_type(l_times, r_times))
+    idx = np.empty(total, dtype=np.int64)
+    times[r_pos], idx[r_pos] = r_times, r_idx
+    times[~is_right], idx[~is_right] = l_times, l_idx
+    return times, idx
+
+def iter_merged(streams):
+    """
+    Lazy variant of merge_index for consumers that walk the timeline frame by
+    frame. Yields (stream_no, sample_no, timestamp) in merged order; streams
+    may be any iterables of timestamps, already in tie order.
+    """
+    def tagged(stream_no, stream):
+        for sample_no, t in enumerate(stream):
+            yield t, stream_no, sample_no
+
+    for t, stream_no, sample_no in heapq.merge(*(tagged(i, s) for i, s in enumerate(streams))):
+        yield stream_no, sample_no, t
@@ -0,0 +1,360 @@
+"""
+J1939-21 transport protocol: multi-packet messages as TP.CM / TP.DT frames.
+
+Payloads longer than 8 bytes (DM1 with several DTCs, VIN, software ID, ...)
+are sent in sessions:
+    BAM   to global (0xFF): TP.CM_BAM, then TP.DT packets every
+          packet_interval_ms
+    CMDT  to one destination: TP.CM_RTS from the sender, TP.CM_CTS
+          from the receiver for each window of cts_window packets, the
+          TP.DT packets, then TP.CM_EndOfMsgAck from the receiver
+
+Every session of a given mode and payload length has the same frame
+sequence and relative timing. Sessions are therefore segmented in batches
+from one template: times, CAN IDs and control bytes come from the template,
+and payloads are reshaped into the 7-byte DT slots in one go.
+
+Session contents come from a counter-based hash of (seed, spec, source
+address, repetition), so any time window can be generated on its own and
+matches the same part of a full run.
+"""
+import numpy as np
+from codec import get_codec
+from frames import FrameStore
+
+TP_CM = 0xEC00
+TP_DT = 0xEB00
+TP_PRIORITY = 7
+GLOBAL_ADDRESS = 0xFF
+
+CM_RTS, CM_CTS, CM_EOMA, CM_BAM = 16, 17, 19, 32
+
+MAX_PAYLOAD = 255 * 7
+
+# Frame kinds in a session template
+_CM, _DT, _CTS, _EOMA = 0, 1, 2, 3
+
+BAM, CMDT = "bam", "cmdt"
+
+# --- HASHING ---
+
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+def mix(*keys):
+    """
+    splitmix64 of several integer key arrays: a counter-based random
+    source that needs no generator state.
+    """
+    h = np.zeros(np.broadcast(*keys).shape if len(keys) > 1 else np.shape(keys[0]), dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for key in keys:
+            h = h ^ (np.asarray(key).astype(np.uint64) + _GOLDEN)
+            h = (h ^ (h >> np.uint64(30))) * _MIX1
+            h = (h ^ (h >> np.uint64(27))) * _MIX2
+            h = h ^ (h >> np.uint64(31))
+    return h
+
+# --- PAYLOADS ---
+
+VIN_ALPHABET = np.frombuffer(b"ABCDEFGHJKLMNPRSTUVWXYZ0123456789", dtype=np.uint8)
+
+def dm1_payloads(keys, spn_pool, max_dtcs=10):
+    """
+    DM1 (active DTCs) with 2..max_dtcs DTCs each; single-DTC DM1s fit in
+    one frame and never use the transport protocol.
+    """
+    n = len(keys)
+    counts = 2 + (mix(keys, 1) % np.uint64(max(max_dtcs - 1, 1))).astype(np.int64)
+    width = 2 + 4 * int(counts.max(initial=2))
+    out = np.full((n, width), 0xFF, dtype=np.uint8)
+    # Lamp status: MIL / red stop / amber warning / protect, 2 bits each
+    out[:, 0] = (mix(keys, 2) & np.uint64(0x55)).astype(np.uint8)
+
+    slot = np.arange(int(counts.max(initial=2)))
+    h = mix(keys[:, None], 3, slot[None, :])
+    spn = np.asarray(spn_pool, dtype=np.int64)[(h % np.uint64(len(spn_pool))).astype(np.int64)] & 0x7FFFF
+    fmi = ((h >> np.uint64(32)) % np.uint64(32)).astype(np.int64)
+    occurrences = 1 + ((h >> np.uint64(40)) % np.uint64(126)).astype(np.int64)
+    dtc = np.stack([spn & 0xFF, (spn >> 8) & 0xFF, ((spn >> 16) & 0x7) << 5 | fmi, occurrences], axis=-1)
+
+    used = slot[None, :] < counts[:, None]
+    dtc_bytes = out[:, 2:].reshape(n, -1, 4)
+    dtc_bytes[used] = dtc[used]
+    return out, 2 + 4 * counts
+
+def vin_payloads(keys, source_addresses, seed):
+    """
+    17-character VIN plus '*' delimiter, fixed per source address.
+    """
+    h = mix(seed, 4, np.asarray(source_addresses)[:, None], np.arange(17)[None, :])
+    out = np.full((len(keys), 18), ord("*"), dtype=np.uint8)
+    out[:, :17] = VIN_ALPHABET[(h % np.uint64(len(VIN_ALPHABET))).astype(np.int64)]
+    return out, np.full(len(keys), 18)
+
+def software_id_payloads(keys, source_addresses, seed):
+    """
+    Software identification: field count, then '*'-terminated version
+    strings, fixed per source address.
+    """
+    texts = {}
+    for sa in np.unique(source_addresses).tolist():
+        h = int(mix(seed, 5, sa))
+        fields = [f"APP{sa:02X}-{h % 10}.{(h >> 8) % 100}.{(h >> 16) % 1000}",
+                  f"BOOT-{(h >> 24) % 10}.{(h >> 28) % 10}"]
+        texts[sa] = bytes([len(fields)]) + "".join(f + "*" for f in fields).encode("ascii")
+    width = max(len(t) for t in texts.values())
+    table = {sa: np.frombuffer(t.ljust(width, b"\xff"), dtype=np.uint8) for sa, t in texts.items()}
+    out = np.array([table[sa] for sa in np.asarray(source_addresses).tolist()], dtype=np.uint8).reshape(-1, width)
+    lengths = np.array([len(texts[sa]) for sa in np.asarray(source_addresses).tolist()], dtype=np.int64)
+    return out, lengths
+
+def raw_payloads(keys, length):
+    """
+    Random bytes of a fixed length, for reassembly load tests.
+    """
+    h = mix(keys[:, None], 6, np.arange(length)[None, :])
+    return (h & np.uint64(0xFF)).astype(np.uint8), np.full(len(keys), length)
+
+# PGN -> payload kind for the well-known transport messages
+KNOWN_MESSAGES = {
+    65226: "dm1",
+    65260: "vin",
+    65242: "software_id",
+}
+
+# --- SESSIONS ---
+
+class TransportSpec:
+    """
+    Periodic transport sessions of one PGN from a set of source addresses.
+    """
+    def __init__(self, pgn, mode=BAM, source_addresses=(0,), period_ms=1000, destination=0xF9,
+                 packet_interval_ms=None, cts_window=16, response_ms=5, offset_ms=None,
+                 payload=None, length=None, max_dtcs=10):
+        if mode not in (BAM, CMDT):
+            raise ValueError(f"Unknown transport mode '{mode}' (use {BAM} or {CMDT})")
+        self.pgn = int(pgn)
+        self.mode = mode
+        self.source_addresses = np.array(sorted(set(int(sa) for sa in source_addresses)), dtype=np.int64)
+        if not len(self.source_addresses) or self.source_addresses.min() < 0 or self.source_addresses.max() > 0xFD:
+            raise ValueError("source addresses must be in 0..253")
+        self.period_ms = period_ms
+        self.destination = GLOBAL_ADDRESS if mode == BAM else int(destination)
+        # BAM packets must be 50..200 ms apart; CMDT can go as fast as the bus
+        self.packet_interval_ms = packet_interval_ms if packet_interval_ms is not None else (50 if mode == BAM else 10)
+        self.cts_window = max(1, min(int(cts_window), 255))
+        self.response_ms = response_ms
+        self.offset_ms = offset_ms
+        self.payload = payload or KNOWN_MESSAGES.get(self.pgn, "raw")
+        self.length = length
+        self.max_dtcs = max_dtcs
+        if self.payload == "raw" and not (length and 9 <= length <= MAX_PAYLOAD):
+            raise ValueError(f"raw payloads need a length of 9..{MAX_PAYLOAD} bytes")
+
+    @classmethod
+    def from_dict(cls, spec):
+        """
+        From JSON: source_addresses may be a list or a "first-last" range.
+        """
+        spec = dict(spec)
+        sas = spec.pop('source_addresses', [0])
+        if isinstance(sas, str):
+            first, _, last = sas.partition("-")
+            sas = range(int(first, 0), int(last or first, 0) + 1)
+        return cls(source_addresses=sas, **spec)
+
+    def template(self, length):
+        """
+        (kinds, relative times in us, is-from-receiver, DT sequence numbers,
+        control bytes) of one session carrying length bytes.
+        """
+        packets = -(-length // 7)
+        step = int(self.packet_interval_ms * 1000)
+        kinds, times, seqs, ctrl = [_CM], [0], [0], []
+        size = [length & 0xFF, length >> 8]
+        pgn = [self.pgn & 0xFF, (self.pgn >> 8) & 0xFF, self.pgn >> 16]
+
+        if self.mode == BAM:
+            ctrl.append([CM_BAM] + size + [packets, 0xFF] + pgn)
+            for seq in range(1, packets + 1):
+                kinds.append(_DT)
+                times.append(seq * step)
+                seqs.append(seq)
+                ctrl.append([seq] + [0xFF] * 7)
+        else:
+            response = int(self.response_ms * 1000)
+            ctrl.append([CM_RTS] + size + [packets, self.cts_window] + pgn)
+            t, seq = 0, 1
+            while seq <= packets:
+                count = min(self.cts_window, packets - seq + 1)
+                t += response
+                kinds.append(_CTS)
+                times.append(t)
+                seqs.append(0)
+                ctrl.append([CM_CTS, count, seq, 0xFF, 0xFF] + pgn)
+                for s in range(seq, seq + count):
+                    t += step if s > seq else response
+                    kinds.append(_DT)
+                    times.append(t)
+                    seqs.append(s)
+                    ctrl.append([s] + [0xFF] * 7)
+                seq += count
+            t += response
+            kinds.append(_EOMA)
+            times.append(t)
+            seqs.append(0)
+            ctrl.append([CM_EOMA] + size + [packets, 0xFF] + pgn)
+
+        kinds = np.array(kinds)
+        return (kinds, np.array(times, dtype=np.int64), np.isin(kinds, (_CTS, _EOMA)),
+                np.array(seqs), np.array(ctrl, dtype=np.uint8))
+
+    def span_us(self, length):
+        return int(self.template(length)[1][-1])
+
+    def max_length(self):
+        if self.payload == "dm1":
+            return 2 + 4 * self.max_dtcs
+        if self.payload == "raw":
+            return self.length
+        return 64
+
+class TransportScheduler:
+    """
+    Transport sessions of several specs over one run.
+    """
+    def __init__(self, specs, seed=0):
+        self.specs = list(specs)
+        self.seed = seed
+        seen = {}
+        for i, spec in enumerate(self.specs):
+            if spec.max_length() < 9 or spec.max_length() > MAX_PAYLOAD:
+                raise ValueError(f"PGN {spec.pgn}: payload length must be 9..{MAX_PAYLOAD}")
+            span = spec.span_us(spec.max_length())
+            if span >= spec.period_ms * 1000:
+                raise ValueError(
+                    f"PGN {spec.pgn}: a {spec.mode.upper()} session takes {span / 1000:.0f} ms, "
+                    f"longer than its {spec.period_ms} ms period"
+                )
+            # An originator may run one BAM, and one CMDT per destination, at a time
+            for sa in spec.source_addresses.tolist():
+                key = (sa, spec.mode, spec.destination)
+                if key in seen:
+                    raise ValueError(f"Source address {sa} already has a {spec.mode.upper()} spec (PGN {seen[key]})")
+                seen[key] = spec.pgn
+
+    @classmethod
+    def from_dicts(cls, specs, seed=0):
+        return cls([TransportSpec.from_dict(s) for s in specs], seed)
+
+    def _phase_us(self, index, spec):
+        """
+        Start of each source address's first session; spread over the
+        period unless offset_ms pins it.
+        """
+        if spec.offset_ms is not None:
+            return np.full(len(spec.source_addresses), int(spec.offset_ms * 1000), dtype=np.int64)
+        phase_ms = mix(self.seed, 7, index, spec.source_addresses) % np.uint64(max(int(spec.period_ms), 1))
+        return phase_ms.astype(np.int64) * 1000
+
+    def frames(self, duration_sec, start_us=0, stop_us=None):
+        """
+        FrameStore of every transport frame with a timestamp in
+        [start_us, stop_us), for sessions starting within the run.
+        """
+        end_us = int(duration_sec * 1e6)
+        stop_us = stop_us if stop_us is not None else end_us + max(
+            [s.span_us(s.max_length()) for s in self.specs], default=0) + 1
+
+        parts = []
+        for index, spec in enumerate(self.specs):
+            parts.extend(self._spec_frames(index, spec, end_us, start_us, stop_us))
+
+        if not parts:
+            return FrameStore.allocate(0)
+        cols = [np.concatenate(c) for c in zip(*parts)]
+        time_us, can_id, data, sa_key, spec_key, rep_key, frame_key = cols
+        order = np.lexsort((frame_key, rep_key, spec_key, sa_key, time_us))
+
+        store = FrameStore.allocate(len(order))
+        store.frames['time_us'] = time_us[order]
+        store.frames['can_id'] = can_id[order]
+        store.frames['dlc'] = 8
+        store.frames['data'] = data[order]
+        return store
+
+    def _spec_frames(self, index, spec, end_us, start_us, stop_us):
+        period = int(spec.period_ms * 1000)
+        span = spec.span_us(spec.max_length())
+        phase = self._phase_us(index, spec)
+
+        # Repetitions k whose session can reach into [start_us, stop_us)
+        k_first = np.maximum(-(-(start_us - span - phase) // period), 0)
+        k_stop = np.minimum(-(-(stop_us - phase) // period), -(-(end_us - phase) // period))
+        counts = np.maximum(k_stop - k_first, 0)
+        if not counts.sum():
+            return []
+        sa = np.repeat(spec.source_addresses, counts)
+        k = np.repeat(k_first, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+        start = np.repeat(phase, counts) + k * period
+        keys = mix(self.seed, index, sa, k)
+
+        if spec.payload == "dm1":
+            payloads, lengths = dm1_payloads(keys, sorted(self._spn_pool()), spec.max_dtcs)
+        elif spec.payload == "vin":
+            payloads, lengths = vin_payloads(keys, sa, self.seed)
+        elif spec.payload == "software_id":
+            payloads, lengths = software_id_payloads(keys, sa, self.seed)
+        else:
+            payloads, lengths = raw_payloads(keys, spec.length)
+
+        parts = []
+        for length in np.unique(lengths).tolist():
+            rows = np.flatnonzero(lengths == length)
+            time_us, can_id, data, frame_no = segment(spec, length, start[rows], sa[rows], payloads[rows, :length])
+            keep = (time_us >= start_us) & (time_us < stop_us)
+            parts.append((
+                time_us[keep], can_id[keep], data[keep],
+                np.broadcast_to(sa[rows, None], keep.shape)[keep],
+                np.full(keep.sum(), index), np.broadcast_to(k[rows, None], keep.shape)[keep], frame_no[keep],
+            ))
+        return parts
+
+    @staticmethod
+    def _spn_pool():
+        """
+        SPNs DM1 reports as DTCs: the catalog's, limited to the 19-bit field.
+        """
+        return [s for s in get_codec().catalog.spns if s < 1 << 19] or [190]
+
+def segment(spec, length, start_us, source_addresses, payloads):
+    """
+    Segments S sessions of equal payload length into frames. Returns
+    (time_us, can_id, data, frame_no), each shaped (S, frames per session)
+    (data with a trailing 8).
+    """
+    kinds, rel_us, from_receiver, seqs, ctrl = spec.template(length)
+    n = len(start_us)
+    packets = -(-length // 7)
+
+    time_us = start_us[:, None] + rel_us[None, :]
+
+    # Sender frames go to the destination; CTS and EndOfMsgAck come back
+    pf = np.where(kinds == _DT, TP_DT, TP_CM)
+    base = (TP_PRIORITY << 26) | (pf << 8)
+    sa = source_addresses[:, None]
+    can_id = np.where(
+        from_receiver[None, :],
+        base[None, :] | (sa << 8) | spec.destination,
+        base[None, :] | (spec.destination << 8) | sa,
+    ).astype(np.uint32)
+
+    data = np.broadcast_to(ctrl, (n,) + ctrl.shape).copy()
+    padded = np.full((n, packets * 7), 0xFF, dtype=np.uint8)
+    padded[:, :length] = payloads
+    data[:, seqs > 0, 1:] = padded.reshape(n, packets, 7)[:, seqs[seqs > 0] - 1, :]
+
+    frame_no = np.broadcast_to(np.arange(len(kinds)), (n, len(kinds)))
+    return time_us, can_id, data, frame_no
@@ -0,0 +1,56 @@
+import pytest
+import app as webapp
+
+@pytest.fixture
+def client():
+    return webapp.app.test_client()
+
+BODY = {"pgns": [61444], "duration": 2, "format": "trc"}
+
+@pytest.mark.parametrize("route", ["/generate", "/jobs"])
+def test_negative_seed_is_rejected(client, route):
+    response = client.post(route, json={**BODY, "seed": -5})
+    assert response.status_code == 400
+    assert "seed" in response.get_json()["error"]
+
+def test_seeded_generate(client):
+    response = client.post('/generate', json={**BODY, "seed": 5})
+    assert response.status_code == 200
+    assert response.headers["X-Seed"] == "5"
+    assert response.data.count(b"\n") > 100
+
+def test_live_negative_seed_is_rejected(client):
+    response = client.get('/live?pgns=61444&seed=-1')
+    assert response.status_code == 400
+    assert "seed" in response.get_json()["error"]
+
+def test_live_stream_reports_generator_failure(client, monkeypatch):
+    def broken(*args, **kwargs):
+        raise ValueError("generator broke")
+        yield
+
+    monkeypatch.setattr(webapp.engine, "iter_frames", broken)
+    response = client.get('/live?pgns=61444&seed=1&duration=1&rate=100')
+    assert response.status_code == 200
+    body = response.get_data()
+    assert b"event: error" in body and b"generator broke" in body
+    assert b"event: end" not in body
+
+@pytest.mark.parametrize("route", ["/generate", "/jobs"])
+@pytest.mark.parametrize("body", [
+    {"pgns": ["abc"]},
+    {"pgns": 61444},
+    {"duration": "x"},
+    {"duration": None},
+    {"duration": 0},
+    {"duration": -3},
+    {"duration": webapp.MAX_DURATION_SEC + 1},
+    {"format": ["trc"]},
+])
+def test_invalid_request_is_rejected(client, route, body):
+    response = client.post(route, json={**BODY, **body})
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+def test_non_object_body_is_rejected(client):
+    assert client.post('/generate', json=[61444]).status_code == 400
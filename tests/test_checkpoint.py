@@ -0,0 +1,90 @@
+import gzip
+import os
+import numpy as np
+import pytest
+from checkpoint import Checkpoint, CheckpointedRun, frame_log_path
+from frames import FRAME_DTYPE
+from scenario import Scenario
+
+PGNS = [61444, 65265, 65262]
+SEED = 7
+
+def run(tmp_path, name, pgns=None, duration=None, **options):
+    path = str(tmp_path / name)
+    job = CheckpointedRun(path + ".ck", path, pgns, duration, **options)
+    mode = job.prepare()
+    job.run()
+    return path, mode
+
+def logged_frames(path):
+    frames = np.fromfile(frame_log_path(path + ".ck"), dtype=FRAME_DTYPE)
+    # The log's alignment padding is not part of the frames
+    return {name: frames[name] for name in ('time_us', 'can_id', 'dlc', 'data')}
+
+def assert_same_run(fresh, resumed, compression=None):
+    read = gzip.open if compression == 'gzip' else open
+    with read(fresh, 'rb') as a, read(resumed, 'rb') as b:
+        assert a.read() == b.read()
+    fa, fb = logged_frames(fresh), logged_frames(resumed)
+    for name in fa:
+        np.testing.assert_array_equal(fa[name], fb[name])
+
+@pytest.mark.parametrize("file_format, compression", [("trc", None), ("csv", None), ("trc", "gzip")])
+def test_extend_matches_fresh_run(tmp_path, file_format, compression):
+    options = dict(seed=SEED, file_format=file_format, compression=compression)
+    fresh, _ = run(tmp_path, "fresh", PGNS, 60, **options)
+    resumed, mode = run(tmp_path, "resumed", PGNS, 10, **options)
+    assert mode == "fresh"
+
+    _, mode = run(tmp_path, "resumed", duration=30)
+    assert mode == "append"
+    _, mode = run(tmp_path, "resumed", duration=60)
+    assert mode == "append"
+    assert_same_run(fresh, resumed, compression)
+    if compression is None:
+        assert Checkpoint.load(resumed + ".ck").output_bytes == os.path.getsize(resumed)
+
+@pytest.mark.parametrize("file_format, compression", [("trc", None), ("trc", "gzip")])
+def test_add_pgns_matches_fresh_run(tmp_path, file_format, compression):
+    options = dict(seed=SEED, file_format=file_format, compression=compression)
+    fresh, _ = run(tmp_path, "fresh", PGNS + [65263], 75, **options)
+    resumed, _ = run(tmp_path, "resumed", PGNS, 10, **options)
+
+    _, mode = run(tmp_path, "resumed", PGNS + [65263], 75)
+    assert mode == "rewrite"
+    assert_same_run(fresh, resumed, compression)
+
+def test_extend_from_a_cut_mid_cycle_rewrites(tmp_path):
+    # 10.5 s ends mid-cycle for the 1000 ms PGN, so the run can't be appended to
+    options = dict(seed=3, file_format="asc", scenario=Scenario.named("urban"))
+    fresh, _ = run(tmp_path, "fresh", PGNS, 30, **options)
+    resumed, _ = run(tmp_path, "resumed", PGNS, 10.5, **options)
+
+    _, mode = run(tmp_path, "resumed", duration=30)
+    assert mode == "rewrite"
+    assert_same_run(fresh, resumed)
+
+def test_csv_cannot_add_pgns(tmp_path):
+    resumed, _ = run(tmp_path, "resumed", PGNS, 10, seed=SEED, file_format="csv")
+    with pytest.raises(ValueError):
+        run(tmp_path, "resumed", PGNS + [65263], 10)
+
+@pytest.mark.parametrize("change", [
+    dict(duration=5),
+    dict(seed=SEED + 1),
+    dict(file_format="txt"),
+    dict(pgns=PGNS[:1]),
+])
+def test_resume_rejects_a_different_run(tmp_path, change):
+    run(tmp_path, "resumed", PGNS, 10, seed=SEED, file_format="trc")
+    options = dict(pgns=None, duration=20)
+    options.update(change)
+    with pytest.raises(ValueError):
+        run(tmp_path, "resumed", options.pop("pgns"), options.pop("duration"), **options)
+
+def test_same_duration_is_a_no_op(tmp_path):
+    resumed, _ = run(tmp_path, "resumed", PGNS, 10, seed=SEED, file_format="trc")
+    before = open(resumed, 'rb').read()
+    _, mode = run(tmp_path, "resumed")
+    assert mode == "done"
+    assert open(resumed, 'rb').read() == before
@@ -0,0 +1,12 @@
+import pytest
+from cli import parse_args
+
+@pytest.mark.parametrize("seed", ["-1", "abc"])
+def test_invalid_seed_is_a_usage_error(seed, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        parse_args(["--pgns", "61444", "--seed", seed])
+    assert exit_info.value.code == 2
+    assert "--seed" in capsys.readouterr().err
+
+def test_seed():
+    assert parse_args(["--pgns", "61444", "--seed", "7"]).seed == 7
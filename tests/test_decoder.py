@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from bench_decoder import candump_log, check_round_trip
+from decoder import TraceDecoder, detect_format
+from engine import J1939Engine
+from exporters import iter_trc, iter_txt
+from j1939_db import PGNS
+
+@pytest.fixture(scope="module")
+def engine():
+    return J1939Engine()
+
+@pytest.fixture(scope="module")
+def store(engine):
+    return engine.generate_frames(list(PGNS), duration_sec=20, seed=1)
+
+@pytest.mark.parametrize("name, encode, timed", [
+    ("trc", lambda s: b"".join(iter_trc([s])), True),
+    ("txt", lambda s: b"".join(iter_txt([s])), False),
+    ("candump", candump_log, True),
+])
+@pytest.mark.parametrize("chunk_bytes", [1 << 20, 4096])
+def test_round_trip(tmp_path, engine, store, name, encode, timed, chunk_bytes):
+    path = tmp_path / f"trace.{name}"
+    path.write_bytes(encode(store))
+    assert detect_format(str(path)) == name
+
+    decoded = TraceDecoder(engine, chunk_bytes=chunk_bytes).decode(str(path))
+    check_round_trip(engine, name, store, decoded, timed)
+
+def test_decoded_dataframe_matches_generate_dataset(tmp_path, engine):
+    pgns = list(PGNS)
+    df = engine.generate_dataset(pgns, duration_sec=10, seed=1)
+    path = tmp_path / "trace.trc"
+    path.write_bytes(b"".join(iter_trc([engine.generate_frames(pgns, duration_sec=10, seed=1)])))
+
+    back = TraceDecoder(engine).decode(str(path)).to_dataframe(engine.dataset_columns(pgns))
+    assert (back['pgn_hex'] == df['pgn_hex']).all()
+    assert (back['payload_hex'] == df['payload_hex']).all()
+    np.testing.assert_array_equal(back['time_ms'], df['time_ms'])
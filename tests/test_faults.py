@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from engine import J1939Engine
+from faults import FAULT_KINDS, FaultPlan, FaultSpec, error_raw, out_of_range_raw
+
+ENGINE_PGN = 61444
+# Driver Demand Eng % Torque (8 bits) and Engine Speed (16 bits)
+SPN_8, SPN_16 = 512, 190
+
+def raw_field(engine, store, pgn_id, spn_id):
+    layout = engine.codec.pgn(pgn_id)
+    row = layout.spn_ids.index(spn_id)
+    words = np.ascontiguousarray(store.data).view('<u8').ravel()
+    return (words >> np.uint64(layout.shift[row])) & np.uint64(layout.mask[row])
+
+def run(kind, spn_id, duration=2):
+    engine = J1939Engine(faults=FaultPlan([FaultSpec(kind, spn=spn_id, start_s=0.5, stop_s=1.5)], seed=1))
+    store = engine.generate_frames([ENGINE_PGN], duration, seed=1)
+    labels = engine.faults.labels(engine, [ENGINE_PGN], duration)
+    return engine, store, labels
+
+def test_raw_values_by_field_length():
+    assert [error_raw(n) for n in (2, 4, 8, 16, 32)] == [0b10, 0xE, 0xFE, 0xFE00, 0xFE000000]
+    assert [out_of_range_raw(n) for n in (4, 8, 16, 32)] == [0xD, 0xFD, 0xFDFF, 0xFDFFFFFF]
+    with pytest.raises(ValueError):
+        out_of_range_raw(2)
+
+@pytest.mark.parametrize("spn_id, length", [(SPN_8, 8), (SPN_16, 16)])
+@pytest.mark.parametrize("kind, expected", [
+    ("error", error_raw),
+    ("not_available", lambda n: (1 << n) - 1),
+    ("out_of_range", out_of_range_raw),
+])
+def test_value_faults_on_the_wire(spn_id, length, kind, expected):
+    engine, store, labels = run(kind, spn_id)
+    raw = raw_field(engine, store, ENGINE_PGN, spn_id)
+    time_us = store.frames['time_us']
+
+    assert len(labels) and (labels['kind'] == FAULT_KINDS.index(kind)).all()
+    assert (labels['spn'] == spn_id).all()
+    hit = np.isin(time_us, labels['time_us'])
+    assert hit.sum() == len(labels)
+    assert (raw[hit] == expected(length)).all()
+    # Outside the labelled frames the field stays in the valid range
+    valid_max = 0xFA if length == 8 else 0xFAFF
+    assert (raw[~hit] <= valid_max).all()
+
+def test_error_is_not_in_the_not_available_range():
+    engine, store, labels = run("error", SPN_16)
+    raw = raw_field(engine, store, ENGINE_PGN, SPN_16)[np.isin(store.frames['time_us'], labels['time_us'])]
+    assert ((raw >= 0xFE00) & (raw <= 0xFEFF)).all()
@@ -0,0 +1,38 @@
+import copy
+import numpy as np
+from codec import compile_codec, get_codec
+from fleet import FleetInstance, generate_fleet
+from j1939_db import PGNS, SPNS
+
+EEC1 = 61444
+
+def custom_codec():
+    # EEC1 at 50 ms instead of 20 ms, so a default-codec worker would show
+    pgns = copy.deepcopy(PGNS)
+    pgns[EEC1]['cycle_time_ms'] = 50
+    return compile_codec(pgns, SPNS)
+
+def instances():
+    return [FleetInstance(0, [EEC1], seed=1), FleetInstance(1, [EEC1], seed=2)]
+
+def fields(store):
+    return {name: store.frames[name] for name in ('time_us', 'can_id', 'dlc', 'data')}
+
+def test_workers_use_callers_codec():
+    codec = custom_codec()
+    pooled = generate_fleet(instances(), 2, workers=2, codec=codec)
+    serial = generate_fleet(instances(), 2, workers=1, codec=codec)
+    a, b = fields(pooled), fields(serial)
+    for name in a:
+        np.testing.assert_array_equal(a[name], b[name])
+
+    layout = codec.pgn(EEC1)
+    assert layout.cycle_time_ms != get_codec().pgn(EEC1).cycle_time_ms
+    for sa in (0, 1):
+        times = a['time_us'][a['can_id'] == layout.can_id_for(sa)]
+        assert len(times) == 2000 // layout.cycle_time_ms
+        assert np.all(np.diff(times) == layout.cycle_time_ms * 1000)
+
+def test_default_codec_when_none_given():
+    store = generate_fleet(instances(), 1, workers=2)
+    assert len(store.frames) == 2 * (1000 // get_codec().pgn(EEC1).cycle_time_ms)